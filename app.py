@@ -1,78 +1,70 @@
 from flask import Flask, render_template, jsonify, make_response, session
-import os
-import json
-import requests
 from flask import request
 from dotenv import load_dotenv
-from google.cloud import firestore
 
-# Importuj moduły
-from modules import ai_logic, quiz, auth
-from database import get_team_stats, db
-
-from database import get_team_stats, db
-
-# Load .env file
+# Load .env file (przed importem modułów - czytają zmienne środowiskowe przy imporcie)
 load_dotenv()
 
+# Importuj moduły
+from config import Config
+import database
+from modules import ai_logic, quiz, auth, admin, categories, question_bank, stats_buffer, metrics, profiling, upstream
+from modules.prompts import prompt_registry
+from database import get_team_stats, STORAGE_BACKEND
+
 app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')  # Dodaj do .env
+# Wspólna konfiguracja wczytywana raz - dostępna jako app.config / current_app.config
+app.config.from_object(Config)
+app.secret_key = app.config['SECRET_KEY']
 
 
 # Zarejestruj Blueprinty
 app.register_blueprint(ai_logic.bp, url_prefix='/api')
 app.register_blueprint(quiz.bp, url_prefix='/api')
 app.register_blueprint(auth.bp, url_prefix='/api/auth')
+app.register_blueprint(admin.bp, url_prefix='/api/admin')
 
+# Czas i operacje na bazie każdego żądania - GET /metrics
+metrics.init_app(app)
+# Profilowanie wybranych żądań (PROFILING_ENABLED) - GET /api/admin/profiles
+profiling.init_app(app, authorize=admin.is_admin_request)
+
+# Komendy CLI (flask question-bank ingest, flask stats migrate)
+app.cli.add_command(question_bank.cli)
+app.cli.add_command(admin.cli)
+
+
+# Klient Firestore powstaje przy pierwszym użyciu (database.get_db), nie przy starcie procesu
+app.logger.info('Using %s storage in app.py', 'SQLite' if STORAGE_BACKEND == 'sqlite' else 'Firestore')
+
+
+def preload():
+    """
+    Buduje niezmienne dane raz, w procesie głównym gunicorn (preload_app w gunicorn.conf.py)
+
+    Prompty i lokalne kategorie są wczytywane przy imporcie modułów, tu dochodzą
+    skompilowane szablony Jinja. Workery dostają je po fork przez copy-on-write
+    zamiast wczytywać je osobno.
+    """
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    app.logger.info(
+        'Preloaded %s templates, %s prompts, %s categories',
+        len(app.jinja_env.list_templates()), len(prompt_registry.list_prompts()), len(categories.catalog.categories)
+    )
+
+
+def reset_after_fork():
+    """
+    Porzuca klientów sieciowych odziedziczonych po procesie głównym (gunicorn post_fork)
+
+    Klient gRPC Firestore i pule połączeń HTTP nie mogą być współdzielone między
+    procesami - każdy worker tworzy własne przy pierwszym użyciu.
+    """
+    database.reset_after_fork()
+    upstream.reset_after_fork()
 
-# Load environment variables
-ENVIRONMENT = os.getenv('ENVIRONMENT', 'local')
-
-QUIZ_CATEGORIES = os.getenv('QUIZ_CATEGORIES', 'api_quiz_categories')
-QUIZ_DATA = os.getenv('QUIZ_DATA', 'api_quiz')
-QUESTION_DESCRIPTION = os.getenv('QUESTION_DESCRIPTION', 'api_question_description')
-
-QUIZ_API_PROVIDERS = os.getenv('QUIZ_API_PROVIDERS', '')
-AI_API_PROVIDERS = os.getenv('AI_API_PROVIDERS', '')
-
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
-GEMINI_API_URL = os.getenv('GEMINI_API_URL', '')
-TRIVIA_API_URL = os.getenv('TRIVIA_API_URL', 'https://opentdb.com/api.php')
-
-
-# Sprawdź czy Firestore jest zainicjalizowany
-if db:
-    app.logger.info('Firestore connection available in app.py')
-else:
-    app.logger.warning('Firestore not available in app.py')
-
-# Load local API providers if running locally
-if ENVIRONMENT == 'local':
-    with open('static/data/local_api_providers.json') as f:
-        local_api_providers = json.load(f)
-    with open('static/data/local_quiz_categories.json') as f:
-        local_quiz_categories = json.load(f)
-    with open('static/data/local_quiz.json') as f:
-        local_quiz = json.load(f)
-
-else:
-    local_api_providers = {
-        "quiz_api": os.getenv('QUIZ_API_PROVIDERS', '').split(','),
-        "ai_api": os.getenv('AI_API_PROVIDERS', '').split(',')
-    }
-
-# Wczytaj prompty z pliku JSON
-try:
-    with open('static/data/prompts.json', 'r', encoding='utf-8') as f:
-        prompts_data = json.load(f)
-        PROMPTS_TYPE = prompts_data.get('introduction_prompts', [])
-except FileNotFoundError:
-    PROMPTS_TYPE = []
-    app.logger.warning('prompts.json file not found')
-except json.JSONDecodeError:
-    PROMPTS_TYPE = []
-    app.logger.error('Error parsing prompts.json')
-    
 
 @app.route('/')
 def index():
@@ -84,12 +76,13 @@ def index():
 @auth.login_required
 def game():
 
-    resp = make_response(render_template('game.html', prompt_type=PROMPTS_TYPE))
+    # Lista promptów z tego samego rejestru co ai_logic (prompts.json wczytany raz)
+    resp = make_response(render_template('game.html', prompt_type=prompt_registry.list_prompts()))
     #resp.set_cookie('quiz_api_providers', QUIZ_API_PROVIDERS)
     #resp.set_cookie('ai_api_providers', AI_API_PROVIDERS)
-    resp.set_cookie('quiz_categories', QUIZ_CATEGORIES)
-    resp.set_cookie('quiz_data', QUIZ_DATA)
-    resp.set_cookie('question_description', QUESTION_DESCRIPTION)
+    resp.set_cookie('quiz_categories', app.config['QUIZ_CATEGORIES'])
+    resp.set_cookie('quiz_data', app.config['QUIZ_DATA'])
+    resp.set_cookie('question_description', app.config['QUESTION_DESCRIPTION'])
     return resp
 
    
@@ -106,8 +99,29 @@ def get_stats():
     
     if stats is None:
         return jsonify({'error': 'Failed to get stats'}), 500
-    
+
+    stats_buffer.questions_generated.overlay(team_name, stats['stats'])
     return jsonify(stats), 200
 
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Metryki w formacie tekstowym Prometheusa (czasy żądań i zewnętrznych API, operacje na bazie, cache)
+
+    Wymaga tokenu METRICS_TOKEN (Authorization: Bearer) albo nagłówka X-Admin-Token.
+    """
+    if not metrics.METRICS_ENABLED or not (metrics.METRICS_TOKEN or admin.ADMIN_TOKEN):
+        return jsonify({'error': 'Metrics disabled'}), 404
+
+    if not (metrics.is_metrics_request() or admin.is_admin_request()):
+        return jsonify({'error': 'Metrics token required'}), 403
+
+    response = make_response(metrics.render())
+    response.mimetype = 'text/plain'
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
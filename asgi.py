@@ -0,0 +1,112 @@
+# Punkt wejścia ASGI
+#
+# Endpointy czekające na zewnętrzne API (Gemini, Trivia) obsługiwane są na pętli
+# zdarzeń asyncio, więc jeden worker utrzymuje setki równoległych wywołań.
+# Wszystkie pozostałe ścieżki trafiają do aplikacji Flask przez WsgiToAsgi.
+#
+# Uruchomienie:
+#     gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+import json
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as flask_app
+from modules import ai_logic, metrics, quiz, upstream
+
+
+# Ścieżki obsługiwane asynchronicznie: (metoda, ścieżka) -> handler zwracający (payload, status)
+ASYNC_ROUTES = {
+    ('GET', '/api/generate-description'): ai_logic.generate_description_async,
+    ('GET', '/api/get-keyword-definition'): ai_logic.get_keyword_definition_async,
+    ('GET', '/api/get-questions'): quiz.get_questions_async,
+}
+
+
+class AsyncRequest:
+    """
+    Minimalny odpowiednik flask.request dla handlerów asynchronicznych
+    """
+
+    def __init__(self, scope):
+        self.path = scope['path']
+        self.args = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+
+        cookie = SimpleCookie()
+        for name, value in scope.get('headers', []):
+            if name == b'cookie':
+                cookie.load(value.decode('latin-1'))
+        self.cookies = {key: morsel.value for key, morsel in cookie.items()}
+        self.session = _load_flask_session(self.cookies)
+
+
+def _load_flask_session(cookies):
+    """
+    Odczytuje sesję Flask z podpisanego ciasteczka (tylko odczyt - handlery nie zmieniają sesji)
+    """
+    value = cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not value:
+        return {}
+
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if serializer is None:
+        return {}
+
+    try:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        return serializer.loads(value, max_age=max_age)
+    except Exception:
+        return {}
+
+
+class AsyncApp:
+    """
+    Aplikacja ASGI: asynchroniczne handlery dla ASYNC_ROUTES, Flask dla reszty
+    """
+
+    def __init__(self, wsgi_app, routes):
+        self.flask = WsgiToAsgi(wsgi_app)
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        handler = None
+        if scope['type'] == 'http':
+            handler = self.routes.get((scope['method'], scope['path']))
+
+        if handler is None:
+            await self.flask(scope, receive, send)
+            return
+
+        # Etykieta jak nazwa endpointu Flask, np. quiz.get_questions_async
+        metrics_state = metrics.start_request()
+        payload, status = await handler(AsyncRequest(scope))
+        metrics.finish_request(metrics_state, f"{handler.__module__.rsplit('.', 1)[-1]}.{handler.__name__}", scope['method'], status)
+        body = json.dumps(payload).encode('utf-8')
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode('latin-1')),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await upstream.aclose_all()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = AsyncApp(flask_app, ASYNC_ROUTES)
@@ -0,0 +1,256 @@
+# Test obciążeniowy pętli gry: logowanie, pytanie, licznik pytań, opis, odpowiedź
+#
+# Aplikacja Flask działa w tym samym procesie na serwerze werkzeug, opentdb i
+# Gemini zastępuje lokalny serwer (bench/stubs.py), a Firestore - backend SQLite
+# z wstrzykiwanym opóźnieniem. Nic nie wychodzi do sieci.
+#
+# Uruchomienie (z katalogu głównego repozytorium):
+#     python -m bench.run --teams 50 --rounds 20 --concurrency 16 --output bench.json
+#     python -m bench.run --trivia-latency 150 --gemini-latency 800 --baseline bench.json
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.stubs import Fault, StubUpstream, FaultyStorage
+
+
+ENDPOINTS = ('login', 'get-questions', 'stats-question', 'generate-description', 'stats-answer')
+
+
+def percentile(samples, q):
+    # Ta sama metoda co w modules/upstream.py - wartość z posortowanej listy, bez interpolacji
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class Recorder:
+    """
+    Zbiera czasy odpowiedzi i błędy per endpoint ze wszystkich wątków
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+
+    def timed(self, name, send):
+        started = time.perf_counter()
+        try:
+            response = send()
+            ok = response.status_code < 400
+        except requests.exceptions.RequestException:
+            response, ok = None, False
+        elapsed = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.errors[name] += 1
+        return response if ok else None
+
+    def report(self):
+        result = {}
+        for name in ENDPOINTS:
+            samples = sorted(self.latencies[name])
+            if not samples:
+                continue
+            result[name] = {
+                'requests': len(samples),
+                'errors': self.errors[name],
+                'p50_ms': round(percentile(samples, 0.50), 2),
+                'p95_ms': round(percentile(samples, 0.95), 2),
+                'p99_ms': round(percentile(samples, 0.99), 2),
+                'max_ms': round(samples[-1], 2)
+            }
+        return result
+
+
+def play(base_url, team_name, rounds, recorder, describe):
+    """
+    Jeden symulowany zespół: rejestracja i logowanie, potem rounds pełnych rund gry
+    """
+    http = requests.Session()
+    # Wartość ze spacją w cudzysłowie - werkzeug 3.1 pomija niecytowane ciasteczka ze spacjami
+    http.cookies.set('selectedQuizApi', '"Trivia API"')
+    credentials = {'team_name': team_name, 'password': 'bench-password'}
+
+    http.post(f'{base_url}/api/auth/register', json={**credentials, 'repeat_password': 'bench-password'})
+    if recorder.timed('login', lambda: http.post(f'{base_url}/api/auth/login', json=credentials)) is None:
+        return
+
+    for round_number in range(rounds):
+        response = recorder.timed('get-questions', lambda: http.get(
+            f'{base_url}/api/get-questions', params={'amount': 1, 'category': 28}
+        ))
+        if response is None or not response.json().get('results'):
+            continue
+        question = response.json()['results'][0]
+
+        recorder.timed('stats-question', lambda: http.post(
+            f'{base_url}/api/team/stats/question', json={'categoryId': 28, 'categoryName': 'Vehicles'}
+        ))
+
+        if describe:
+            recorder.timed('generate-description', lambda: http.get(f'{base_url}/api/generate-description', params={
+                'category': question['category'],
+                'question': question['question'],
+                'correct_answer': question['correct_answer'],
+                'incorrect_answers': ', '.join(question['incorrect_answers']),
+                'temperature': '0.5'
+            }))
+
+        recorder.timed('stats-answer', lambda: http.post(
+            f'{base_url}/api/team/stats/answer', json={'is_correct_answer': round_number % 3 != 0, 'category_id': 28}
+        ))
+
+
+def run_load(base_url, teams, rounds, concurrency, describe):
+    """
+    Uruchamia teams zespołów (po concurrency naraz) przeciwko base_url
+
+    Returns:
+        tuple: (Recorder, czas trwania w sekundach)
+    """
+    recorder = Recorder()
+    run_id = int(time.time() * 1000)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(play, base_url, f'bench-{run_id}-{index}', rounds, recorder, describe)
+            for index in range(teams)
+        ]
+        for future in futures:
+            future.result()
+    return recorder, time.perf_counter() - started
+
+
+def app_env(stub, workdir):
+    """
+    Zmienne środowiskowe kierujące aplikację do zamienników opentdb i Gemini oraz plików w workdir
+    """
+    return {
+        **stub.env(),
+        'STORAGE_BACKEND': 'sqlite',
+        'STORAGE_SQLITE_PATH': os.path.join(workdir, 'storage.sqlite3'),
+        'CACHE_DIR': os.path.join(workdir, 'cache'),
+        'QUESTION_BANK_PATH': os.path.join(workdir, 'question_bank.sqlite3'),
+        'QUESTION_BANK_MODE': 'off',
+        'TRIVIA_MIN_INTERVAL': '0',
+        'CAPTURE_ENABLED': 'False'
+    }
+
+
+def start_app(stub, storage_fault, workdir):
+    """
+    Konfiguruje aplikację na lokalne zależności i uruchamia ją na wolnym porcie
+
+    Zmienne środowiskowe muszą być ustawione przed importem app - moduły czytają je przy imporcie.
+    """
+    os.environ.update(app_env(stub, workdir))
+
+    import database
+    from modules.storage import bind_backend
+
+    storage = FaultyStorage(os.environ['STORAGE_SQLITE_PATH'], storage_fault, notify_points=database._notify_points)
+    bind_backend(vars(database), storage)
+    database.storage = storage
+
+    from werkzeug.serving import make_server
+    from app import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, storage
+
+
+def compare(report, baseline):
+    """
+    Wypisuje zmianę p50/p95/p99 i przepustowości względem zapisanego wcześniej raportu
+    """
+    print('\nChange vs baseline:')
+    for name, current in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if previous[key]:
+                changes.append(f'{key} {(current[key] - previous[key]) / previous[key] * 100:+.1f}%')
+        print(f'  {name:<22}' + ', '.join(changes))
+
+    if baseline.get('requests_per_second'):
+        change = (report['requests_per_second'] - baseline['requests_per_second']) / baseline['requests_per_second'] * 100
+        print(f"  {'requests/s':<22}{change:+.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Test obciążeniowy pętli gry z lokalnymi zamiennikami opentdb, Gemini i Firestore')
+    parser.add_argument('--teams', type=int, default=20, help='Liczba symulowanych zespołów')
+    parser.add_argument('--rounds', type=int, default=10, help='Liczba rund na zespół')
+    parser.add_argument('--concurrency', type=int, default=8, help='Liczba zespołów grających równocześnie')
+    parser.add_argument('--no-describe', dest='describe', action='store_false', help='Pomiń /api/generate-description')
+    parser.add_argument('--trivia-latency', type=float, default=50.0, help='Opóźnienie opentdb (ms)')
+    parser.add_argument('--gemini-latency', type=float, default=300.0, help='Opóźnienie Gemini (ms)')
+    parser.add_argument('--storage-latency', type=float, default=5.0, help='Opóźnienie operacji na bazie (ms)')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Odchylenie opóźnień jako ułamek wartości')
+    parser.add_argument('--trivia-errors', type=float, default=0.0, help='Odsetek błędów opentdb (0-1)')
+    parser.add_argument('--gemini-errors', type=float, default=0.0, help='Odsetek błędów Gemini (0-1)')
+    parser.add_argument('--storage-errors', type=float, default=0.0, help='Odsetek błędów bazy (0-1)')
+    parser.add_argument('--output', help='Zapisz raport JSON do pliku')
+    parser.add_argument('--baseline', help='Porównaj z raportem JSON z poprzedniego uruchomienia')
+    args = parser.parse_args(argv)
+
+    def fault(latency, error_rate):
+        return Fault(latency, latency * args.jitter, error_rate)
+
+    stub = StubUpstream(fault(args.trivia_latency, args.trivia_errors), fault(args.gemini_latency, args.gemini_errors)).start()
+    workdir = tempfile.mkdtemp(prefix='quiz-bench-')
+    server, storage = start_app(stub, fault(args.storage_latency, args.storage_errors), workdir)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    print(f'Benchmark app at {base_url}, upstream stubs at {stub.base_url}, data in {workdir}')
+
+    recorder, duration = run_load(base_url, args.teams, args.rounds, args.concurrency, args.describe)
+
+    server.shutdown()
+    stub.stop()
+
+    endpoints = recorder.report()
+    total_requests = sum(item['requests'] for item in endpoints.values())
+    report = {
+        'config': vars(args),
+        'duration_seconds': round(duration, 3),
+        'requests': total_requests,
+        'requests_per_second': round(total_requests / duration, 2) if duration else 0,
+        'endpoints': endpoints,
+        'upstream_calls': dict(stub.calls),
+        'upstream_calls_per_request': round((stub.calls['trivia'] + stub.calls['gemini']) / total_requests, 3) if total_requests else 0,
+        'storage_calls_per_request': round(storage.calls / total_requests, 3) if total_requests else 0
+    }
+
+    print(f"\n{'endpoint':<22}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, item in endpoints.items():
+        print(f"{name:<22}{item['requests']:>9}{item['errors']:>8}{item['p50_ms']:>10}{item['p95_ms']:>10}{item['p99_ms']:>10}")
+    print(f"\n{report['requests']} requests in {report['duration_seconds']} s ({report['requests_per_second']} req/s)")
+    print(f"Upstream calls: {report['upstream_calls']} ({report['upstream_calls_per_request']} per request), "
+          f"storage calls per request: {report['storage_calls_per_request']}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report saved to {args.output}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# Pomiar zimnego startu workera: czas importu aplikacji i opóźnienie pierwszego żądania
+#
+# Każdy pomiar to świeży proces Pythona (python -X importtime), więc nic nie jest
+# już zaimportowane ani zainicjalizowane. Raport zawiera medianę i maksimum z
+# --runs uruchomień oraz moduły o najdłuższym łącznym czasie importu.
+#
+# Uruchomienie (z katalogu głównego repozytorium):
+#     python -m bench.startup --runs 5 --output startup.json
+#     python -m bench.startup --backend firestore --path /api/get-stats --baseline startup.json
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+RESULT_PREFIX = 'STARTUP_RESULT '
+
+# Kod uruchamiany w procesie potomnym - wynik trafia na stdout z prefiksem, bo logi aplikacji też idą na stdout
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+client = app.test_client()
+status = client.get(sys.argv[1]).status_code
+first = time.perf_counter()
+client.get(sys.argv[1])
+second = time.perf_counter()
+print(%r + json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (first - imported) * 1000,
+    'second_request_ms': (second - first) * 1000,
+    'status': status
+}), flush=True)
+''' % RESULT_PREFIX
+
+
+def parse_importtime(stderr):
+    """
+    Zwraca {moduł: łączny czas importu w ms} z wyjścia python -X importtime
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative) / 1000
+    return modules
+
+
+def run_once(path, env):
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD, path],
+        env=env, capture_output=True, text=True, timeout=300
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):]), parse_importtime(completed.stderr)
+
+    raise RuntimeError(f'Startup run failed (exit code {completed.returncode}):\n{completed.stderr[-2000:]}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Czas importu aplikacji i pierwszego żądania w świeżym procesie')
+    parser.add_argument('--runs', type=int, default=5, help='Liczba uruchomień (świeżych procesów)')
+    parser.add_argument('--path', default='/', help='Ścieżka pierwszego żądania')
+    parser.add_argument('--backend', choices=('sqlite', 'firestore'), default='sqlite',
+                        help='Backend bazy (firestore wymaga FIRESTORE_KEY_PATH)')
+    parser.add_argument('--top', type=int, default=15, help='Liczba najwolniej importowanych modułów w raporcie')
+    parser.add_argument('--output', help='Zapisz raport JSON do pliku')
+    parser.add_argument('--baseline', help='Porównaj z raportem JSON z poprzedniego uruchomienia')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='quiz-startup-')
+    env = {
+        **os.environ,
+        'STORAGE_BACKEND': args.backend,
+        'CAPTURE_ENABLED': 'False',
+        'QUESTION_BANK_MODE': 'off'
+    }
+    if args.backend == 'sqlite':
+        env['STORAGE_SQLITE_PATH'] = os.path.join(workdir, 'storage.sqlite3')
+
+    runs, imports = [], {}
+    for _ in range(args.runs):
+        result, modules = run_once(args.path, env)
+        runs.append(result)
+        for name, ms in modules.items():
+            imports.setdefault(name, []).append(ms)
+
+    def summarize(key):
+        samples = sorted(run[key] for run in runs)
+        return {'median_ms': round(statistics.median(samples), 2), 'max_ms': round(samples[-1], 2)}
+
+    report = {
+        'config': vars(args),
+        'status': runs[-1]['status'],
+        'import': summarize('import_ms'),
+        'first_request': summarize('first_request_ms'),
+        'second_request': summarize('second_request_ms'),
+        'slowest_imports': [
+            {'module': name, 'cumulative_ms': round(statistics.median(samples), 2)}
+            for name, samples in sorted(imports.items(), key=lambda item: -statistics.median(item[1]))[:args.top]
+        ]
+    }
+
+    print(f"{'phase':<18}{'median ms':>12}{'max ms':>12}")
+    for phase in ('import', 'first_request', 'second_request'):
+        print(f"{phase:<18}{report[phase]['median_ms']:>12}{report[phase]['max_ms']:>12}")
+    print(f"\nGET {args.path} -> {report['status']}, {args.runs} runs, backend: {args.backend}")
+    print('\nSlowest imports (cumulative):')
+    for item in report['slowest_imports']:
+        print(f"  {item['module']:<50}{item['cumulative_ms']:>10} ms")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print('\nChange vs baseline (median):')
+        for phase in ('import', 'first_request', 'second_request'):
+            previous = baseline.get(phase, {}).get('median_ms')
+            if previous:
+                print(f"  {phase:<18}{(report[phase]['median_ms'] - previous) / previous * 100:+.1f}%")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report saved to {args.output}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from modules.storage.sqlite import SqliteStorage
+
+
+class Fault:
+    """
+    Opóźnienie i błędy wstrzykiwane do jednej zależności
+
+    Args:
+        latency_ms (float): Średnie opóźnienie odpowiedzi
+        jitter_ms (float): Losowe odchylenie opóźnienia (+/-)
+        error_rate (float): Odsetek odpowiedzi zakończonych błędem (0-1)
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def delay(self):
+        latency = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def fails(self):
+        return random.random() < self.error_rate
+
+
+class StubUpstream:
+    """
+    Lokalny serwer HTTP udający opentdb i Gemini API
+
+    Pytania i opisy są syntetyczne, ale mają format prawdziwych odpowiedzi,
+    więc aplikacja przechodzi te same ścieżki kodu. Serwer liczy wywołania
+    każdej usługi - z tego raport wylicza wywołania zewnętrznych API na żądanie.
+    """
+
+    def __init__(self, trivia_fault=None, gemini_fault=None):
+        self.trivia_fault = trivia_fault or Fault()
+        self.gemini_fault = gemini_fault or Fault()
+        self.calls = {'trivia': 0, 'gemini': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._question_counter = 0
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def env(self):
+        """
+        Zmienne środowiskowe kierujące aplikację do serwera zamiast do opentdb i Gemini
+        """
+        return {
+            'TRIVIA_API_URL': f'{self.base_url}/api.php',
+            'TRIVIA_TOKEN_URL': f'{self.base_url}/api_token.php',
+            'TRIVIA_CATEGORIES_URL': f'{self.base_url}/api_category.php',
+            'TRIVIA_COUNT_URL': f'{self.base_url}/api_count.php',
+            'GEMINI_API_URL': f'{self.base_url}/v1beta/models/bench:generateContent',
+            'GEMINI_API_KEY': 'bench'
+        }
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def do_POST(self):
+                # Body musi zostać odczytane, inaczej połączenie keep-alive się rozjedzie
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def _handle(self, handler):
+        url = urlsplit(handler.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        service = 'gemini' if url.path.startswith('/v1beta/') else 'trivia'
+        fault = self.gemini_fault if service == 'gemini' else self.trivia_fault
+
+        self._count(service)
+        fault.delay()
+        if fault.fails():
+            self._count('errors')
+            self._send(handler, 503, {'error': 'injected failure'})
+            return
+
+        if url.path == '/api.php':
+            payload = {'response_code': 0, 'results': self._questions(int(params.get('amount', 1)), params)}
+        elif url.path == '/api_token.php':
+            payload = {'response_code': 0, 'response_message': 'ok', 'token': uuid.uuid4().hex}
+        elif url.path == '/api_category.php':
+            payload = {'trivia_categories': [{'id': 9, 'name': 'General Knowledge'}, {'id': 28, 'name': 'Vehicles'}]}
+        elif url.path == '/api_count.php':
+            payload = {'category_id': int(params.get('category', 9)), 'category_question_count': {
+                'total_question_count': 1000, 'total_easy_question_count': 300,
+                'total_medium_question_count': 400, 'total_hard_question_count': 300
+            }}
+        elif service == 'gemini':
+            payload = self._description()
+        else:
+            self._send(handler, 404, {'error': 'not found'})
+            return
+
+        self._send(handler, 200, payload)
+
+    def _send(self, handler, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json; charset=utf-8')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _questions(self, amount, params):
+        with self._lock:
+            start = self._question_counter
+            self._question_counter += amount
+
+        return [{
+            'type': params.get('type') or 'multiple',
+            'difficulty': params.get('difficulty') or 'medium',
+            'category': 'Vehicles',
+            'question': f'Bench question #{number}?',
+            'correct_answer': f'Answer {number}',
+            'incorrect_answers': [f'Wrong {number}.{i}' for i in range(3)]
+        } for number in range(start, start + amount)]
+
+    def _description(self):
+        text = json.dumps({
+            'wprowadzenie': 'Wprowadzenie do pytania testowego. ' * 8,
+            'podsumowanie': 'Podsumowanie pytania testowego. ' * 4,
+            'słowa_kluczowe': ['silnik', 'skrzynia biegów', 'napęd']
+        }, ensure_ascii=False)
+        return {'candidates': [{'content': {'parts': [{'text': text}]}}]}
+
+
+class FaultyStorage(SqliteStorage):
+    """
+    Backend SQLite z opóźnieniem i błędami - lokalny odpowiednik Firestore
+
+    Każda operacja (jedno pobranie połączenia) czeka fault.latency_ms, tak jak
+    czekałoby zapytanie sieciowe, a wstrzyknięty błąd jest zgłaszany jako
+    sqlite3.OperationalError i obsługiwany przez zwykłą ścieżkę błędów backendu.
+    """
+
+    def __init__(self, path, fault=None, notify_points=None):
+        super().__init__(path, notify_points=notify_points)
+        self.fault = fault or Fault()
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+
+    def _connection(self):
+        with self._calls_lock:
+            self.calls += 1
+        self.fault.delay()
+        if self.fault.fails():
+            raise sqlite3.OperationalError('injected storage failure')
+        return super()._connection()
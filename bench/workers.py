@@ -0,0 +1,133 @@
+# Porównanie klas workerów gunicorn (sync, gthread, gevent) na tej samej pętli gry
+#
+# Każda konfiguracja to osobny gunicorn -c gunicorn.conf.py app:app z lokalnymi
+# zamiennikami opentdb i Gemini (bench/stubs.py) oraz backendem SQLite. Obciążenie
+# generuje ten sam kod co bench/run.py. Wynik to przepustowość i percentyle per
+# klasa workera - z niego pochodzi tabela w README.
+#
+# Uruchomienie (z katalogu głównego repozytorium, wymaga gunicorn, dla gevent także gevent):
+#     python -m bench.workers --workers 2 --threads 8 --gemini-latency 800 --output workers.json
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from bench.run import app_env, percentile, run_load
+from bench.stubs import Fault, StubUpstream
+
+
+WORKER_CLASSES = ('sync', 'gthread', 'gevent')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(worker_class, args, env):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        env={
+            **env,
+            'GUNICORN_WORKER_CLASS': worker_class,
+            'GUNICORN_BIND': f'127.0.0.1:{port}',
+            'WEB_CONCURRENCY': str(args.workers),
+            'GUNICORN_THREADS': str(args.threads),
+            'GUNICORN_WORKER_CONNECTIONS': str(args.connections),
+            'LOG_LEVEL': 'WARNING'
+        },
+        stdout=subprocess.DEVNULL
+    )
+
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn ({worker_class}) exited with code {process.returncode}')
+        try:
+            requests.get(f'{base_url}/', timeout=1)
+            return process, base_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError(f'gunicorn ({worker_class}) did not start in 60 s')
+
+
+def measure(worker_class, args, env):
+    process, base_url = start_gunicorn(worker_class, args, env)
+    try:
+        recorder, duration = run_load(base_url, args.teams, args.rounds, args.concurrency, args.describe)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    samples = sorted(sample for values in recorder.latencies.values() for sample in values)
+    return {
+        'worker_class': worker_class,
+        'workers': args.workers,
+        'threads': args.threads if worker_class == 'gthread' else 1,
+        'requests': len(samples),
+        'errors': sum(recorder.errors.values()),
+        'requests_per_second': round(len(samples) / duration, 2) if duration else 0,
+        'p50_ms': round(percentile(samples, 0.50), 2) if samples else None,
+        'p95_ms': round(percentile(samples, 0.95), 2) if samples else None,
+        'p99_ms': round(percentile(samples, 0.99), 2) if samples else None,
+        'endpoints': recorder.report()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Przepustowość pętli gry dla klas workerów gunicorn')
+    parser.add_argument('--worker-classes', default=','.join(WORKER_CLASSES), help='Lista klas workerów (po przecinku)')
+    parser.add_argument('--workers', type=int, default=2, help='Liczba procesów workerów')
+    parser.add_argument('--threads', type=int, default=8, help='Wątki na worker (gthread)')
+    parser.add_argument('--connections', type=int, default=200, help='Połączenia na worker (gevent)')
+    parser.add_argument('--teams', type=int, default=32, help='Liczba symulowanych zespołów')
+    parser.add_argument('--rounds', type=int, default=5, help='Liczba rund na zespół')
+    parser.add_argument('--concurrency', type=int, default=32, help='Liczba zespołów grających równocześnie')
+    parser.add_argument('--no-describe', dest='describe', action='store_false', help='Pomiń /api/generate-description')
+    parser.add_argument('--trivia-latency', type=float, default=50.0, help='Opóźnienie opentdb (ms)')
+    parser.add_argument('--gemini-latency', type=float, default=300.0, help='Opóźnienie Gemini (ms)')
+    parser.add_argument('--output', help='Zapisz raport JSON do pliku')
+    args = parser.parse_args(argv)
+
+    stub = StubUpstream(Fault(args.trivia_latency), Fault(args.gemini_latency)).start()
+    results = []
+    try:
+        for worker_class in [name.strip() for name in args.worker_classes.split(',') if name.strip()]:
+            if worker_class == 'gevent' and importlib.util.find_spec('gevent') is None:
+                print('Skipping gevent: package not installed (pip install gevent)')
+                continue
+
+            # Osobny katalog danych - każda konfiguracja startuje z pustą bazą i cache
+            env = {**os.environ, **app_env(stub, tempfile.mkdtemp(prefix=f'quiz-workers-{worker_class}-'))}
+            print(f'Measuring {worker_class}...')
+            results.append(measure(worker_class, args, env))
+    finally:
+        stub.stop()
+
+    print(f"\n{'worker class':<14}{'workers':>8}{'threads':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for item in results:
+        print(f"{item['worker_class']:<14}{item['workers']:>8}{item['threads']:>8}{item['requests_per_second']:>10}"
+              f"{item['p50_ms']:>10}{item['p95_ms']:>10}{item['p99_ms']:>10}{item['errors']:>8}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+        print(f'Report saved to {args.output}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
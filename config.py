@@ -1,7 +1,21 @@
 import os
 
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+
 class Config:
+    """
+    Wspólna konfiguracja aplikacji - zmienne środowiskowe czytane raz przy starcie
+    """
     DEBUG = os.getenv('DEBUG', 'False') == 'True'
     ENV = os.getenv('ENV', 'development')
+    ENVIRONMENT = os.getenv('ENVIRONMENT', 'local')
+    SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')  # Dodaj do .env
     QUIZ_API_PROVIDERS = os.getenv('QUIZ_API_PROVIDERS', '').split(',')
-    AI_API_PROVIDERS = os.getenv('AI_API_PROVIDERS', '').split(',')
\ No newline at end of file
+    AI_API_PROVIDERS = os.getenv('AI_API_PROVIDERS', '').split(',')
+    QUIZ_CATEGORIES = os.getenv('QUIZ_CATEGORIES', 'api_quiz_categories')
+    QUIZ_DATA = os.getenv('QUIZ_DATA', 'api_quiz')
+    QUESTION_DESCRIPTION = os.getenv('QUESTION_DESCRIPTION', 'api_question_description')
@@ -1,27 +1,150 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from unicodedata import category
+import copy
+import random
+import threading
 import uuid
+import zlib
 from google.cloud import firestore
+from google.api_core.exceptions import NotFound
 import os
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from modules import metrics
+from modules.cache import TTLCache, shared_or_memory_cache
+from modules.storage import bind_backend, merge_seen_chunk, validate_new_team
+from modules.log import get_logger
+
 
 
 # Load environment variables
 load_dotenv()
 
+logger = get_logger(__name__)
+
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
 
+# firestore (domyślnie) lub sqlite - lokalny plik bez połączenia z chmurą (backend w modules/storage/sqlite.py)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'firestore')
+STORAGE_SQLITE_PATH = os.getenv('STORAGE_SQLITE_PATH', '')
+
 # Inicjalizacja Firestore
 FIRESTORE_KEY_PATH = os.getenv('FIRESTORE_KEY_PATH', 'config/serviceAccount.json')
 
-try:
-    db = firestore.Client.from_service_account_json(FIRESTORE_KEY_PATH)
-    print('Firestore initialized successfully in database.py')
-except Exception as e:
-    print(f'Error initializing Firestore in database.py: {str(e)}')
-    db = None
+# Klient Firestore jest tworzony przy pierwszym użyciu, a nie przy imporcie - osobno w każdym
+# procesie (także po fork), bo klient gRPC nie może być współdzielony między procesami
+_db_client = None
+_db_pid = None
+_db_lock = threading.Lock()
+
+
+def get_db():
+    """
+    Zwraca firestore.Client bieżącego procesu albo None, gdy nie udało się go utworzyć
+    """
+    global _db_client, _db_pid
+    if _db_pid == os.getpid():
+        return _db_client
+
+    with _db_lock:
+        if _db_pid != os.getpid():
+            client = None
+            if STORAGE_BACKEND != 'sqlite':
+                try:
+                    client = firestore.Client.from_service_account_json(FIRESTORE_KEY_PATH)
+                    logger.info('Firestore initialized successfully in database.py')
+                except Exception as e:
+                    logger.error('Error initializing Firestore in database.py: %s', e)
+            _db_client, _db_pid = client, os.getpid()
+    return _db_client
+
+
+class _LazyFirestoreClient:
+    """
+    Pośrednik do klienta z get_db() - `db.collection(...)` i `if not db` działają jak przy zwykłym kliencie
+    """
+
+    def __bool__(self):
+        return get_db() is not None
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+
+db = _LazyFirestoreClient()
+
+
+def reset_after_fork():
+    """
+    Porzuca klientów Firestore odziedziczonych po procesie nadrzędnym (gunicorn post_fork)
+
+    Kanał gRPC nie przeżywa fork, więc nie jest zamykany - tylko zapominany.
+    Kolejne użycie utworzy klienta w nowym procesie.
+    """
+    global _db_client, _db_pid, _db_lock, _async_db, _async_db_pid
+    _db_lock = threading.Lock()
+    _db_client, _db_pid = None, None
+    _async_db, _async_db_pid = None, None
+
+
+# Asynchroniczny klient Firestore dla ścieżki ASGI - tworzony przy pierwszym użyciu
+_async_db = None
+_async_db_pid = None
+
+
+def get_async_db():
+    """
+    Zwraca firestore.AsyncClient bieżącego procesu albo None, gdy nie udało się go utworzyć
+
+    Tak jak get_db: jeden klient na proces, tworzony pod blokadą i nigdy przy backendzie sqlite.
+    """
+    global _async_db, _async_db_pid
+    if _async_db_pid == os.getpid():
+        return _async_db
+
+    with _db_lock:
+        if _async_db_pid != os.getpid():
+            client = None
+            if STORAGE_BACKEND != 'sqlite':
+                try:
+                    client = firestore.AsyncClient.from_service_account_json(FIRESTORE_KEY_PATH)
+                    logger.info('Async Firestore initialized successfully in database.py')
+                except Exception as e:
+                    logger.error('Error initializing async Firestore in database.py: %s', e)
+            _async_db, _async_db_pid = client, os.getpid()
+    return _async_db
+
+
+# Cache walidacji sesji - kluczem jest team_name, wartością ID zespołu potwierdzone w bazie
+SESSION_CACHE_TTL = float(os.getenv('SESSION_CACHE_TTL', '60'))
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', '1024'))
+
+# Współdzielony przez workery - unieważnienie sesji (rotate_team_id) działa od razu we wszystkich procesach
+session_cache = shared_or_memory_cache(
+    'session_validation', os.path.join(os.getenv('CACHE_DIR', 'cache'), 'sessions'),
+    max_size=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL
+)
+
+# Funkcje wywoływane po zmianie punktów zespołu (np. ranking)
+_points_listeners = []
+
+
+def add_points_listener(callback):
+    """
+    Rejestruje callback(team_name, category_id, points, stats) wywoływany po zapisaniu punktów
+
+    stats to statystyki po zapisie albo None, gdy zapis był samym inkrementem bez odczytu.
+    """
+    _points_listeners.append(callback)
+
+
+def _notify_points(team_name, category_id, points, stats=None):
+    for callback in _points_listeners:
+        try:
+            callback(team_name, category_id, points, stats)
+        except Exception as e:
+            logger.error('Error in points listener: %s', e)
 
 
 # ✅ Funkcja pomocnicza do wyboru nazwy kolekcji
@@ -43,7 +166,7 @@ def ensure_teams_collection_exists():
         bool: True jeśli kolekcja istnieje lub została utworzona, False w przypadku błędu
     """
     if not db:
-        print('Firestore not initialized')
+        logger.warning('Firestore not initialized')
         return False
     
     try:
@@ -59,7 +182,7 @@ def ensure_teams_collection_exists():
             break
         
         if not has_documents:
-            print(f'Collection {collection_name} does not exist or is empty. Creating...')
+            logger.info('Collection %s does not exist or is empty. Creating...', collection_name)
             
             # Utwórz dokument inicjalizujący (może być usunięty później)
             init_doc_ref = db.collection(collection_name).document('_init')
@@ -69,18 +192,18 @@ def ensure_teams_collection_exists():
                 'can_be_deleted': True
             })
             
-            print(f'Collection {collection_name} created successfully with initial document')
+            logger.info('Collection %s created successfully with initial document', collection_name)
             
             # Opcjonalnie: usuń dokument inicjalizujący
             # init_doc_ref.delete()
             
         else:
-            print(f'Collection {collection_name} already exists')
+            logger.info('Collection %s already exists', collection_name)
         
         return True
         
     except Exception as e:
-        print(f'Error ensuring collection exists: {str(e)}')
+        logger.error('Error ensuring collection exists: %s', e)
         return False
 
 
@@ -90,34 +213,219 @@ def initialize_database():
     Wywołaj tę funkcję przy starcie aplikacji
     """
     if not db:
-        print('Cannot initialize database - Firestore not connected')
+        logger.warning('Cannot initialize database - Firestore not connected')
         return False
     
     try:
         # Upewnij się, że kolekcja teams istnieje
         ensure_teams_collection_exists()
         
-        print('Database initialization completed')
+        logger.info('Database initialization completed')
         return True
         
     except Exception as e:
-        print(f'Error initializing database: {str(e)}')
+        logger.error('Error initializing database: %s', e)
         return False
 
 
 
+# ✅ Układ statystyk zespołu - zapisany w polu stats_layout dokumentu zespołu
+# document - mapa stats w dokumencie zespołu (jeden dokument na zespół)
+# sharded  - liczniki w podkolekcji stats_shards (STATS_SHARDS dokumentów sumowanych przy odczycie),
+#            seria odpowiedzi tylko w dokumencie stats_shards/meta; dokument zespołu zostaje z danymi logowania
+# STATS_LAYOUT decyduje tylko o układzie nowych zespołów - istniejące przechodzą na sharded przez migrate_team_stats
+STATS_LAYOUT = os.getenv('STATS_LAYOUT', 'document')
+STATS_SHARDS = int(os.getenv('STATS_SHARDS', '4'))
+STATS_SHARDS_COLLECTION = 'stats_shards'
+STATS_META_DOCUMENT = 'meta'
+
+# Układ statystyk zespołów w pamięci procesu - zapisy liczników nie czytają dokumentu zespołu za każdym razem.
+# Nieaktualny wpis po migracji nie gubi zmian: liczniki trafiają wtedy do starej mapy stats, która jest doliczana przy odczycie.
+STATS_LAYOUT_CACHE_TTL = float(os.getenv('STATS_LAYOUT_CACHE_TTL', '300'))
+# Sumy kawałków zespołów w układzie sharded - odpowiedź nie czyta wszystkich kawałków przy każdym zapisie.
+# Zapisy z innych workerów są widoczne po odświeżeniu sumy (najpóźniej po STATS_SHARDS_CACHE_TTL sekundach).
+STATS_SHARDS_CACHE_TTL = float(os.getenv('STATS_SHARDS_CACHE_TTL', '30'))
+
+_stats_layouts = TTLCache('stats_layouts', max_size=4096, ttl=STATS_LAYOUT_CACHE_TTL)
+_shard_totals = TTLCache('stats_shard_totals', max_size=1024, ttl=STATS_SHARDS_CACHE_TTL)
+
+# Pola będące wartościami, nie licznikami - nie są sumowane między kawałkami
+STATS_VALUE_FIELDS = ('current_streak', 'best_streak', 'accuracy_percentage')
+
+
+def _empty_stats():
+    return {
+        'questions_generated': 0,
+        'questions_answered': 0,
+        'correct_answers': 0,
+        'incorrect_answers': 0,
+        'accuracy_percentage': 0.0,
+        'total_points': 0,
+        'current_streak': 0,
+        'best_streak': 0,
+        'total_play_time_seconds': 0,
+        'categories': {}
+    }
+
+
+def _uses_sharded_stats(team_data=None):
+    return (team_data or {}).get('stats_layout') == 'sharded'
+
+
+def _remember_stats_layout(team_name, team_data):
+    layout = 'sharded' if _uses_sharded_stats(team_data) else 'document'
+    _stats_layouts.set(team_name, layout)
+    return layout
+
+
+def _get_stats_layouts(team_refs):
+    """
+    Zwraca układ statystyk zespołów - z pamięci procesu albo jednym odczytem brakujących dokumentów
+
+    Returns:
+        dict: {team_name: 'document' | 'sharded'} - bez zespołów, które nie istnieją
+    """
+    layouts = {}
+    missing = []
+    for team_ref in team_refs:
+        layout = _stats_layouts.get(team_ref.id)
+        if layout is None:
+            missing.append(team_ref)
+        else:
+            layouts[team_ref.id] = layout
+
+    if missing:
+        for team_doc in db.get_all(missing, field_paths=['stats_layout']):
+            metrics.count_storage('read')
+            if team_doc.exists:
+                layouts[team_doc.id] = _remember_stats_layout(team_doc.id, team_doc.to_dict())
+    return layouts
+
+
+def _shards_ref(team_ref):
+    return team_ref.collection(STATS_SHARDS_COLLECTION)
+
+
+def _random_shard_ref(team_ref):
+    # Losowy kawałek - równoległe zapisy tego samego zespołu trafiają do różnych dokumentów
+    return _shards_ref(team_ref).document(str(random.randrange(STATS_SHARDS)))
+
+
+def _meta_ref(team_ref):
+    return _shards_ref(team_ref).document(STATS_META_DOCUMENT)
+
+
+def _nested_stats_update(increments, values=None):
+    """
+    Buduje zagnieżdżony dict dla set(merge=True) - brakujące pola i dokumenty są tworzone przy zapisie
+    """
+    data = {}
+    for path, amount in increments.items():
+        _nested_parent(data, path)[str(path[-1])] = firestore.Increment(amount)
+    for path, value in (values or {}).items():
+        _nested_parent(data, path)[str(path[-1])] = value
+    return data
+
+
+def _nested_parent(data, path):
+    for part in path[:-1]:
+        data = data.setdefault(str(part), {})
+    return data
+
+
+def _increment_tree(stats):
+    """
+    Zamienia liczniki ze starej mapy stats na inkrementy (bez pól-wartości, np. serii)
+    """
+    tree = {}
+    for key, value in stats.items():
+        if key in STATS_VALUE_FIELDS:
+            continue
+        if isinstance(value, dict):
+            tree[key] = _increment_tree(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            tree[key] = firestore.Increment(value)
+        else:
+            tree[key] = value
+    return tree
+
+
+def _add_stats(target, source):
+    """
+    Dodaje liczniki z source do target (rekurencyjnie); pozostałe wartości są kopiowane
+    """
+    for key, value in source.items():
+        if isinstance(value, dict):
+            _add_stats(target.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            target[key] = target.get(key, 0) + value
+        else:
+            target[key] = value
+
+
+def _read_sharded_stats(team_ref, team_data):
+    """
+    Sumuje kawałki statystyk zespołu
+
+    Liczniki zapisane do starej mapy stats w dokumencie zespołu (np. przez proces
+    z nieaktualnym układem w pamięci) są dodawane do sumy. Seria jest tylko w
+    dokumencie meta. Suma liczników trafia do _shard_totals.
+    """
+    legacy = team_data.get('stats') or {}
+    stats = _empty_stats()
+    _add_stats(stats, {key: value for key, value in legacy.items() if key not in STATS_VALUE_FIELDS})
+
+    meta = {}
+    for shard_doc in _shards_ref(team_ref).stream():
+        metrics.count_storage('read')
+        if shard_doc.id == STATS_META_DOCUMENT:
+            meta = shard_doc.to_dict() or {}
+        else:
+            _add_stats(stats, shard_doc.to_dict() or {})
+
+    _shard_totals.set(team_ref.id, copy.deepcopy(stats))
+    return _with_streak(stats, meta)
+
+
+def _with_streak(stats, meta):
+    stats['current_streak'] = meta.get('current_streak', 0)
+    stats['best_streak'] = meta.get('best_streak', 0)
+    if stats['questions_answered']:
+        stats['accuracy_percentage'] = round((stats['correct_answers'] / stats['questions_answered']) * 100, 2)
+    return stats
+
+
+def _add_to_shard_totals(team_name, increments):
+    """
+    Dolicza zapisane właśnie inkrementy do sumy kawałków w pamięci (jeśli jest)
+
+    Returns:
+        dict: Kopia sumy po zmianie lub None, jeśli sumy nie ma w pamięci
+    """
+    totals = _shard_totals.get(team_name)
+    if totals is None:
+        return None
+    totals = copy.deepcopy(totals)
+    for path, amount in increments.items():
+        parent = _nested_parent(totals, path)
+        parent[str(path[-1])] = parent.get(str(path[-1]), 0) + amount
+    _shard_totals.set(team_name, copy.deepcopy(totals))
+    return totals
+
+
 def get_team_stats(team_name):
     """
     Pobiera statystyki zespołu z Firestore
     """
     if not db:
-        print('Firestore not initialized')
+        logger.warning('Firestore not initialized')
         return None
     
     try:
         collection_name = get_teams_collection()
         team_ref = db.collection(collection_name).document(team_name)
         team_doc = team_ref.get()
+        metrics.count_storage('read')
         
         if not team_doc.exists:
             return {
@@ -129,199 +437,244 @@ def get_team_stats(team_name):
             }
         
         team_data = team_doc.to_dict()
+        if _remember_stats_layout(team_name, team_data) == 'sharded':
+            stats = _read_sharded_stats(team_ref, team_data)
+        else:
+            stats = team_data.get('stats', {})
+
         return {
             'team_name': team_name,
-            'stats': team_data.get('stats', {}),
+            'stats': stats,
             'created_at': team_data.get('created_at')
         }
         
     except Exception as e:
-        print(f'Error getting stats: {str(e)}')
+        logger.error('Error getting stats: %s', e)
         return None
 
 
-# dodaj punkty druzynie za prowidłową odpowiedź
-def add_points_to_team(team_name, category_id, points):
+# ✅ Warstwa mutacji statystyk - atomowe inkrementy po stronie serwera
+def _stats_field(*parts):
     """
-    Dodaje punkty do zespołu w Firestore
-    
+    Buduje ścieżkę pola w mapie stats, np. stats.categories.`9`.correct
+    """
+    return firestore.FieldPath('stats', *[str(part) for part in parts]).to_api_repr()
+
+
+def _apply_stats_mutation(team_name, increments, values=None):
+    """
+    Zapisuje zmiany statystyk zespołu jednym update() bez wcześniejszego odczytu dokumentu.
+
+    Liczniki są wysyłane jako firestore.Increment na ścieżkach z kropkami, więc
+    równoległe odpowiedzi tego samego zespołu nie nadpisują się nawzajem.
+    Brakujące mapy kategorii Firestore tworzy sam przy zapisie. Zespoły w układzie
+    sharded dostają zapis do losowego kawałka.
+
     Args:
         team_name (str): Nazwa zespołu
-        points (int): Liczba punktów do dodania
+        increments (dict): {(część ścieżki, ...): wartość inkrementu}
+        values (dict, optional): {(część ścieżki, ...): wartość do ustawienia}
+
+    Returns:
+        bool: True jeśli zapis się powiódł, False jeśli zespół nie istnieje lub wystąpił błąd
     """
     if not db:
-        print('Firestore not initialized')
+        logger.warning('Firestore not initialized')
         return False
-    
+
     try:
         collection_name = get_teams_collection()
         team_ref = db.collection(collection_name).document(team_name)
-        team_doc = team_ref.get()
-        
-        if not team_doc.exists:
-            print(f'Team {team_name} does not exist')
+
+        layout = _get_stats_layouts([team_ref]).get(team_name)
+        if layout is None:
+            logger.warning('Team %s does not exist', team_name)
             return False
-        
-        team_data = team_doc.to_dict()
-        stats = team_data.get('stats', {})
 
-        print(f'Current stats before update: {stats}')
-        
-        categories = stats.get('categories', {})
-        
-        # Jeśli kategoria istnieje, dodaj punkty
-        if category_id in categories:
-            categories[category_id]['points'] = categories[category_id].get('points', 0) + points
+        if layout == 'sharded':
+            # set(merge=True) tworzy kawałek - istnienie zespołu sprawdził odczyt układu
+            _random_shard_ref(team_ref).set(_nested_stats_update(increments, values), merge=True)
+            metrics.count_storage('write')
+            _add_to_shard_totals(team_name, increments)
+            return True
 
-        # Dodaj punkty do ogólnej puli punktów
-        stats['total_points'] = stats.get('total_points', 0) + points
-        
-        # Zaktualizuj dokument
-        team_ref.update({'stats': stats})
-        print(f'Added {points} points to team: {team_name}')
-        
+        # update() kończy się NotFound jeśli dokument nie istnieje - nie tworzymy zespołów przy okazji
+        team_ref.update(_stats_update_data(increments, values))
+        metrics.count_storage('write')
         return True
+
+    except NotFound:
+        logger.warning('Team %s does not exist', team_name)
+        return False
+
+
+def _stats_update_data(increments, values=None):
+    update_data = {}
+    for path, amount in increments.items():
+        update_data[_stats_field(*path)] = firestore.Increment(amount)
+    for path, value in (values or {}).items():
+        update_data[_stats_field(*path)] = value
+    return update_data
+
+
+# Firestore przyjmuje maks. 500 operacji w jednym batchu
+STATS_BATCH_SIZE = 500
+
+
+def apply_stats_mutations(mutations):
+    """
+    Zapisuje zmiany statystyk wielu zespołów batchami (po STATS_BATCH_SIZE zespołów)
+
+    Jeśli batch się nie powiedzie (np. któryś zespół nie istnieje), jego zespoły
+    są zapisywane pojedynczo przez _apply_stats_mutation. Zmiany nieistniejących
+    zespołów są pomijane.
+
+    Args:
+        mutations (dict): {team_name: (increments, values)} w formacie _apply_stats_mutation
+
+    Returns:
+        dict: Zmiany, których nie udało się zapisać (do ponowienia), w tym samym formacie
+    """
+    if not db:
+        logger.warning('Firestore not initialized')
+        return dict(mutations)
+
+    collection_name = get_teams_collection()
+    items = list(mutations.items())
+    failed = {}
+
+    for start in range(0, len(items), STATS_BATCH_SIZE):
+        chunk = items[start:start + STATS_BATCH_SIZE]
+        try:
+            # Układ zespołów z pamięci lub jednym odczytem - bez kawałków dla nieistniejących zespołów
+            layouts = _get_stats_layouts([db.collection(collection_name).document(name) for name, _ in chunk])
+        except Exception as e:
+            logger.error('Error reading stats layouts: %s', e)
+            failed.update(chunk)
+            continue
+
+        chunk = [(team_name, mutation) for team_name, mutation in chunk if team_name in layouts]
+        batch = db.batch()
+        for team_name, (increments, values) in chunk:
+            team_ref = db.collection(collection_name).document(team_name)
+            if layouts[team_name] == 'sharded':
+                batch.set(_random_shard_ref(team_ref), _nested_stats_update(increments, values), merge=True)
+            else:
+                batch.update(team_ref, _stats_update_data(increments, values))
+
+        if not chunk:
+            continue
+
+        try:
+            batch.commit()
+            metrics.count_storage('write', len(chunk))
+            for team_name, (increments, values) in chunk:
+                if layouts[team_name] == 'sharded':
+                    _add_to_shard_totals(team_name, increments)
+        except Exception as e:
+            logger.error('Error committing stats batch, retrying per team: %s', e)
+            for team_name, (increments, values) in chunk:
+                try:
+                    _apply_stats_mutation(team_name, increments, values)
+                except Exception as e:
+                    logger.error('Error updating stats for team %s: %s', team_name, e)
+                    failed[team_name] = (increments, values)
+
+    return failed
+
+
+# dodaj punkty druzynie za prowidłową odpowiedź
+def add_points_to_team(team_name, category_id, points):
+    """
+    Dodaje punkty do zespołu w Firestore
+    
+    Args:
+        team_name (str): Nazwa zespołu
+        category_id (str): ID kategorii
+        points (int): Liczba punktów do dodania
+    """
+    try:
+        category_id = str(category_id)
+        updated = _apply_stats_mutation(team_name, {
+            ('categories', category_id, 'points'): points,
+            ('total_points',): points
+        })
+
+        if updated:
+            logger.debug('Added %s points to team: %s', points, team_name)
+            _notify_points(team_name, category_id, points)
+
+        return updated
         
     except Exception as e:
-        print(f'Error adding points to team: {str(e)}')
+        logger.error('Error adding points to team: %s', e)
         return False
 
 
 # zaktualizuj licznik wygenerowanych pytań dla kategorii
 def update_questions_generated_counter(team_name, category_id, category_name):
-    if not db:
-        print('Firestore not initialized')
-        return False
-    
     try:
-        collection_name = get_teams_collection()
-        team_ref = db.collection(collection_name).document(team_name)
-        team_doc = team_ref.get()
-        
-        if not team_doc.exists:
-            print(f'Team {team_name} does not exist')
-            return False
-        
-        team_data = team_doc.to_dict()
-        stats = team_data.get('stats', {})
-        print(f'Current stats before update: {stats}')
-        
-        categories = stats.get('categories', {})
-        
-        # Jeśli kategoria nie istnieje, zainicjuj ją
-        if category_id not in categories:
-            categories[category_id] = {
-                "name": category_name,
-                'generated': 1,
-                'correct': 0,
-                'incorrect': 0,
-                'points': 0
+        category_id = str(category_id)
+        updated = _apply_stats_mutation(
+            team_name,
+            {
+                ('categories', category_id, 'generated'): 1,
+                ('questions_generated',): 1
+            },
+            values={
+                ('categories', category_id, 'name'): category_name
             }
+        )
 
-        else:
-            # Zwiększ licznik
-            categories[category_id]['generated'] = categories[category_id].get('generated', 0) + 1
+        if updated:
+            logger.debug('Updated questions generated counter for team: %s', team_name)
 
-        # zwiększ ogólny licznik wygenerowanych pytań
-        stats['questions_generated'] = stats.get('questions_generated', 0) + 1
-        
-        # Zaktualizuj statystyki
-        stats['categories'] = categories
-        
-        # Zaktualizuj dokument
-        team_ref.update({'stats': stats})
-        print(f'Updated questions generated counter for team: {team_name}')
-        
-        return True
+        return updated
         
     except Exception as e:
-        print(f'Error updating questions generated counter: {str(e)}')
+        logger.error('Error updating questions generated counter: %s', e)
         return False
 
 # zaktualizuj licznik prawidłowych odpowiedzi zespołu
 def update_correct_answers_counter(team_name, category_id):
-    if not db:
-        print('Firestore not initialized')
-        return False
-    
     try:
-        collection_name = get_teams_collection()
-        team_ref = db.collection(collection_name).document(team_name)
-        team_doc = team_ref.get()
-        
-        if not team_doc.exists:
-            print(f'Team {team_name} does not exist')
-            return False
-        
-        team_data = team_doc.to_dict()
-        stats = team_data.get('stats', {})
-
-        
-        categories = stats.get('categories', {})
         category_id = str(category_id)
-        
-        print(f"category_id:" , category_id)
-        if category_id in categories:
-            # Zwiększ licznik
-            categories[category_id]['correct'] = categories[category_id].get('correct', 0) + 1
-
-        #zwiększ ogólny licznik poprawnych odpowiedzi
-        stats['correct_answers'] = stats.get('correct_answers', 0) + 1
+        updated = _apply_stats_mutation(team_name, {
+            ('categories', category_id, 'correct'): 1,
+            # zwiększ ogólny licznik poprawnych odpowiedzi
+            ('correct_answers',): 1,
+            # zwiększ licznik pytań odpowiedzianych
+            ('questions_answered',): 1
+        })
 
-        #zwiększ licznik pytań odpowiedzianych
-        stats['questions_answered'] = stats.get('questions_answered', 0) + 1
+        if updated:
+            logger.debug('Updated correct answers counter for team: %s', team_name)
 
-        # Zaktualizuj dokument
-        team_ref.update({'stats': stats})
-        print(f'Updated correct answers counter for team: {team_name}')
-        
-        return True
+        return updated
         
     except Exception as e:
-        print(f'Error updating answers correct counter: {str(e)}')
+        logger.error('Error updating answers correct counter: %s', e)
         return False
     
-# zaktualizuj licznik prawidłowych odpowiedzi zespołu
+# zaktualizuj licznik nieprawidłowych odpowiedzi zespołu
 def update_incorrect_answers_counter(team_name, category_id):
-    if not db:
-        print('Firestore not initialized')
-        return False
-    
     try:
-        collection_name = get_teams_collection()
-        team_ref = db.collection(collection_name).document(team_name)
-        team_doc = team_ref.get()
-        
-        if not team_doc.exists:
-            print(f'Team {team_name} does not exist')
-            return False
-        
-        team_data = team_doc.to_dict()
-        stats = team_data.get('stats', {})
-
-        
-        categories = stats.get('categories', {})
         category_id = str(category_id)
-        
-        print(f"category_id:" , category_id)
-        if category_id in categories:
-            # Zwiększ licznik
-            categories[category_id]['incorrect'] = categories[category_id].get('incorrect', 0) + 1
-
-        #zwiększ ogólny licznik poprawnych odpowiedzi
-        stats['incorrect_answers'] = stats.get('incorrect_answers', 0) + 1
+        updated = _apply_stats_mutation(team_name, {
+            ('categories', category_id, 'incorrect'): 1,
+            # zwiększ ogólny licznik błędnych odpowiedzi
+            ('incorrect_answers',): 1,
+            # zwiększ licznik pytań odpowiedzianych
+            ('questions_answered',): 1
+        })
 
-        #zwiększ licznik pytań odpowiedzianych
-        stats['questions_answered'] = stats.get('questions_answered', 0) + 1
+        if updated:
+            logger.debug('Updated incorrect answers counter for team: %s', team_name)
 
-        # Zaktualizuj dokument
-        team_ref.update({'stats': stats})
-        print(f'Updated incorrect answers counter for team: {team_name}')
-        
-        return True
+        return updated
         
     except Exception as e:
-        print(f'Error updating answers incorrect counter: {str(e)}')
+        logger.error('Error updating answers incorrect counter: %s', e)
         return False
     
 
@@ -332,6 +685,9 @@ def validate_team_session(team_name, team_id):
     """
     Sprawdza czy team_id z sesji zgadza się z team_id w bazie danych
     
+    Poprawne sesje są trzymane w session_cache przez SESSION_CACHE_TTL sekund,
+    więc kolejne żądania tej samej sesji nie czytają dokumentu zespołu.
+    
     Args:
         team_name (str): Nazwa zespołu z sesji
         team_id (str): ID zespołu z sesji
@@ -339,17 +695,22 @@ def validate_team_session(team_name, team_id):
     Returns:
         bool: True jeśli sesja jest prawidłowa, False w przeciwnym razie
     """
+    if team_id and session_cache.get(team_name) == team_id:
+        return True
+
     if not db:
-        print('Firestore not initialized')
+        logger.warning('Firestore not initialized')
         return False
     
     try:
         collection_name = get_teams_collection()
         team_ref = db.collection(collection_name).document(team_name)
-        team_doc = team_ref.get()
+        # Tylko pole id - bez przesyłania statystyk i danych logowania
+        team_doc = team_ref.get(field_paths=['id'])
+        metrics.count_storage('read')
         
         if not team_doc.exists:
-            print(f'Team {team_name} does not exist')
+            logger.warning('Team %s does not exist', team_name)
             return False
         
         team_data = team_doc.to_dict()
@@ -357,17 +718,102 @@ def validate_team_session(team_name, team_id):
         
         # Porównaj ID z sesji z ID z bazy
         if stored_team_id != team_id:
-            print(f'Team ID mismatch for {team_name}: session={team_id}, db={stored_team_id}')
+            logger.warning('Team ID mismatch for %s: session=%s, db=%s', team_name, team_id, stored_team_id)
             return False
         
-        print(f'Team session validated successfully for {team_name}')
+        session_cache.set(team_name, team_id)
+        logger.debug('Team session validated successfully for %s', team_name)
         return True
         
     except Exception as e:
-        print(f'Error validating team session: {str(e)}')
+        logger.error('Error validating team session: %s', e)
+        return False
+
+
+async def async_validate_team_session(team_name, team_id):
+    """
+    Asynchroniczna wersja validate_team_session dla ścieżki ASGI (asgi.py)
+    
+    Korzysta z tego samego session_cache i z firestore.AsyncClient przy chybieniu.
+    """
+    if team_id and session_cache.get(team_name) == team_id:
+        return True
+
+    async_db = get_async_db()
+    if async_db is None:
+        logger.warning('Firestore not initialized')
+        return False
+
+    try:
+        collection_name = get_teams_collection()
+        team_doc = await async_db.collection(collection_name).document(team_name).get(field_paths=['id'])
+        metrics.count_storage('read')
+
+        if not team_doc.exists:
+            logger.warning('Team %s does not exist', team_name)
+            return False
+
+        stored_team_id = team_doc.to_dict().get('id')
+        if stored_team_id != team_id:
+            logger.warning('Team ID mismatch for %s: session=%s, db=%s', team_name, team_id, stored_team_id)
+            return False
+
+        session_cache.set(team_name, team_id)
+        return True
+
+    except Exception as e:
+        logger.error('Error validating team session: %s', e)
         return False
 
 
+def invalidate_team_session(team_name):
+    """
+    Usuwa z session_cache potwierdzone ID zespołu (jeden wpis - bez przeglądania cache'a)
+    
+    Wywoływane przy utworzeniu zespołu, jego zablokowaniu i zmianie ID.
+    Przy SHARED_CACHE_ENABLED cache jest wspólny dla workerów na maszynie; bez niego
+    wpis w pozostałych workerach wygaśnie po SESSION_CACHE_TTL.
+    """
+    session_cache.delete(team_name)
+    logger.debug('Invalidated cached sessions for team: %s', team_name)
+
+
+def get_session_cache_stats():
+    """
+    Zwraca liczniki trafień i chybień cache'a walidacji sesji
+    """
+    return session_cache.stats()
+
+
+def rotate_team_id(team_name):
+    """
+    Nadaje zespołowi nowe ID - wszystkie dotychczasowe sesje przestają być ważne
+    
+    Returns:
+        str: Nowe ID zespołu lub None w przypadku błędu
+    """
+    if not db:
+        logger.warning('Firestore not initialized')
+        return None
+
+    try:
+        collection_name = get_teams_collection()
+        team_ref = db.collection(collection_name).document(team_name)
+        new_team_id = uuid.uuid4().hex
+        team_ref.update({'id': new_team_id})
+        metrics.count_storage('write')
+        invalidate_team_session(team_name)
+        logger.debug('Rotated team id for team: %s', team_name)
+        return new_team_id
+
+    except NotFound:
+        logger.warning('Team %s does not exist', team_name)
+        return None
+    except Exception as e:
+        logger.error('Error rotating team id: %s', e)
+        return None
+
+
 def team_exists(team_name):
     """
     Sprawdza czy zespół o danej nazwie już istnieje
@@ -378,9 +824,10 @@ def team_exists(team_name):
     try:
         collection_name = get_teams_collection()
         team_ref = db.collection(collection_name).document(team_name)
+        metrics.count_storage('read')
         return team_ref.get().exists
     except Exception as e:
-        print(f'Error checking if team exists: {str(e)}')
+        logger.error('Error checking if team exists: %s', e)
         return None
 
 
@@ -400,16 +847,10 @@ def create_team(team_name, password, email=None):
         return {'success': False, 'error': 'Database not initialized'}
     
 
-    # Walidacja nazwy zespołu
-    if not team_name or len(team_name) < 3:
-        return {'success': False, 'error': 'Team name must be at least 3 characters'}
-    
-    if len(team_name) > 50:
-        return {'success': False, 'error': 'Team name must be less than 50 characters'}
-    
-    # Walidacja hasła
-    if not password or len(password) < 8:
-        return {'success': False, 'error': 'Password must be at least 8 characters'}
+    # Walidacja nazwy zespołu i hasła
+    error = validate_new_team(team_name, password)
+    if error:
+        return {'success': False, 'error': error}
     
     try:
         # Firestore automatycznie utworzy kolekcję przy pierwszym .set()
@@ -427,27 +868,29 @@ def create_team(team_name, password, email=None):
             'created_at': datetime.now(),
             'last_login': None,
             'is_active': True,
-            'failed_login_attempts': 0,
-            'stats': {
-                'questions_generated': 0,
-                'questions_answered': 0,
-                'correct_answers': 0,
-                'incorrect_answers': 0,
-                'accuracy_percentage': 0.0,
-                'total_points': 0,
-                'current_streak': 0,
-                'best_streak': 0,
-                'total_play_time_seconds': 0,
-                'categories': {}
-            }
+            'failed_login_attempts': 0
         }
-        
+
         # Dodaj email jeśli podano
         if email:
             team_data['email'] = email
-        
-        team_ref.set(team_data)
-        print(f'Team created successfully: {team_name}')
+
+        if STATS_LAYOUT == 'sharded':
+            # Statystyki poza dokumentem zespołu - zespół i seria zapisywane razem
+            team_data['stats_layout'] = 'sharded'
+            batch = db.batch()
+            batch.set(team_ref, team_data)
+            batch.set(_meta_ref(team_ref), {'current_streak': 0, 'best_streak': 0})
+            batch.commit()
+            metrics.count_storage('write', 2)
+            team_data['stats'] = _empty_stats()
+            _stats_layouts.set(team_name, 'sharded')
+        else:
+            team_data['stats'] = _empty_stats()
+            team_ref.set(team_data)
+            metrics.count_storage('write')
+        invalidate_team_session(team_name)
+        logger.info('Team created successfully: %s', team_name)
         
         return {
             'success': True,
@@ -462,7 +905,7 @@ def create_team(team_name, password, email=None):
         }
         
     except Exception as e:
-        print(f'Error creating team: {str(e)}')
+        logger.error('Error creating team: %s', e)
         return {'success': False, 'error': str(e)}
 
 
@@ -493,6 +936,7 @@ def authenticate_team(team_name, password):
 
         # pobierz ponownie dokument zespołu po ewentualnym utworzeniu
         team_doc = team_ref.get()
+        metrics.count_storage('read', 2)
         
         # Sprawdź czy zespół istnieje
         if not team_doc.exists:
@@ -516,6 +960,10 @@ def authenticate_team(team_name, password):
                 team_ref.update({
                     'failed_login_attempts': firestore.Increment(1)
                 })
+                metrics.count_storage('write')
+                # Konto właśnie zostało zablokowane - unieważnij zapamiętane sesje
+                if failed_attempts + 1 >= 5:
+                    invalidate_team_session(team_name)
                 return {'success': False, 'error': 'Invalid team name or password'}
 
             
@@ -524,8 +972,9 @@ def authenticate_team(team_name, password):
             'last_login': datetime.now(),
             'failed_login_attempts': 0  # Zresetuj licznik
         })
+        metrics.count_storage('write')
         
-        print(f'Team logged in successfully: {team_name}')
+        logger.debug('Team logged in successfully: %s', team_name)
         
         return {
             'success': True,
@@ -535,82 +984,518 @@ def authenticate_team(team_name, password):
             'team_data': {
                 'created_at': team_data.get('created_at'),
                 'last_login': datetime.now(),
-                'stats': team_data.get('stats', {})
+                'stats': _read_sharded_stats(team_ref, team_data) if _uses_sharded_stats(team_data) else team_data.get('stats', {})
             }
         }
         
     except Exception as e:
-        print(f'Error authenticating team: {str(e)}')
+        logger.error('Error authenticating team: %s', e)
         return {'success': False, 'error': str(e)}
 
 
-def update_team_stats_answer(team_name, category, is_correct, points=0, time_taken=0):
+def record_answer(team_name, category_id, is_correct, points=0, time_taken=0):
     """
-    Aktualizuje statystyki po udzieleniu odpowiedzi
+    Zapisuje udzieloną odpowiedź jedną transakcją: punkty, liczniki, serię i procent poprawności
+    
+    Zastępuje sekwencję team_exists + add_points_to_team + update_*_answers_counter
+    + get_team_stats (5 zapytań) jednym odczytem i jednym commitem.
     
     Args:
         team_name (str): Nazwa zespołu
-        category (str): ID kategorii
+        category_id (str): ID kategorii
         is_correct (bool): Czy odpowiedź była poprawna
         points (int): Zdobyte punkty
         time_taken (int): Czas odpowiedzi w sekundach
+    
+    Returns:
+        dict: Statystyki po zapisie w formacie get_team_stats,
+              False jeśli zespół nie istnieje, None w przypadku błędu
     """
     if not db:
-        return False
-    
-    try:
-        collection_name = get_teams_collection()
-        team_ref = db.collection(collection_name).document(team_name)
-        team_doc = team_ref.get()
-        
+        logger.warning('Firestore not initialized')
+        return None
+
+    category_id = str(category_id)
+
+    @firestore.transactional
+    def _record_in_transaction(transaction, team_ref):
+        team_doc = team_ref.get(transaction=transaction)
+        metrics.count_storage('read')
+
         if not team_doc.exists:
             return False
-        
+
         team_data = team_doc.to_dict()
+        if _remember_stats_layout(team_ref.id, team_data) == 'sharded':
+            # Zapis idzie do kawałków poza tą transakcją
+            return team_data
+
         stats = team_data.get('stats', {})
-        
-        # Aktualizuj ogólne statystyki
+        categories = stats.setdefault('categories', {})
+        category_stats = categories.setdefault(category_id, {})
+
+        # Aktualizuj lokalną kopię - zostanie zwrócona bez ponownego odczytu
         stats['questions_answered'] = stats.get('questions_answered', 0) + 1
-        
+        stats['total_points'] = stats.get('total_points', 0) + points
+        stats['total_play_time_seconds'] = stats.get('total_play_time_seconds', 0) + time_taken
+        category_stats['points'] = category_stats.get('points', 0) + points
+
         if is_correct:
             stats['correct_answers'] = stats.get('correct_answers', 0) + 1
             stats['current_streak'] = stats.get('current_streak', 0) + 1
-            stats['best_streak'] = max(
-                stats.get('best_streak', 0),
-                stats.get('current_streak', 0)
-            )
+            category_stats['correct'] = category_stats.get('correct', 0) + 1
+            counter_name = 'correct'
         else:
             stats['incorrect_answers'] = stats.get('incorrect_answers', 0) + 1
             stats['current_streak'] = 0
-        
+            category_stats['incorrect'] = category_stats.get('incorrect', 0) + 1
+            counter_name = 'incorrect'
+
+        stats['best_streak'] = max(stats.get('best_streak', 0), stats['current_streak'])
+
         # Oblicz procent poprawności
-        total_answered = stats['questions_answered']
-        if total_answered > 0:
-            stats['accuracy_percentage'] = round(
-                (stats['correct_answers'] / total_answered) * 100, 2
-            )
-        
-        stats['total_points'] = stats.get('total_points', 0) + points
-        stats['total_play_time_seconds'] = stats.get('total_play_time_seconds', 0) + time_taken
-        
-        # Aktualizuj statystyki kategorii
-        categories = stats.get('categories', {})
-        if category not in categories:
-            categories[category] = {'generated': 0, 'correct': 0, 'incorrect': 0}
-        
-        if is_correct:
-            categories[category]['correct'] = categories[category].get('correct', 0) + 1
+        stats['accuracy_percentage'] = round(
+            (stats.get('correct_answers', 0) / stats['questions_answered']) * 100, 2
+        )
+
+        # Liczniki jako inkrementy, pola pochodne jako wartości wyliczone z odczytu
+        update_data = {
+            _stats_field('questions_answered'): firestore.Increment(1),
+            _stats_field('total_points'): firestore.Increment(points),
+            _stats_field('total_play_time_seconds'): firestore.Increment(time_taken),
+            _stats_field(f'{counter_name}_answers'): firestore.Increment(1),
+            _stats_field('categories', category_id, 'points'): firestore.Increment(points),
+            _stats_field('categories', category_id, counter_name): firestore.Increment(1),
+            _stats_field('current_streak'): stats['current_streak'],
+            _stats_field('best_streak'): stats['best_streak'],
+            _stats_field('accuracy_percentage'): stats['accuracy_percentage']
+        }
+
+        transaction.update(team_ref, update_data)
+        metrics.count_storage('write')
+
+        return {
+            'team_name': team_name,
+            'stats': stats,
+            'created_at': team_data.get('created_at')
+        }
+
+    try:
+        collection_name = get_teams_collection()
+        team_ref = db.collection(collection_name).document(team_name)
+
+        result = _record_in_transaction(db.transaction(), team_ref)
+        if result is not False and _uses_sharded_stats(result):
+            result = _record_answer_sharded(team_ref, result, category_id, is_correct, points, time_taken)
+
+        if result is False:
+            logger.warning('Team %s does not exist', team_name)
         else:
-            categories[category]['incorrect'] = categories[category].get('incorrect', 0) + 1
-        
-        stats['categories'] = categories
-        
-        # Zapisz zaktualizowane statystyki
-        team_ref.update({'stats': stats})
-        print(f'Updated answer stats for team: {team_name}')
-        
+            logger.debug('Recorded answer for team: %s', team_name)
+            _notify_points(team_name, category_id, points, result['stats'])
+
+        return result
+
+    except Exception as e:
+        logger.error('Error recording answer: %s', e)
+        return None
+
+
+def _record_answer_sharded(team_ref, team_data, category_id, is_correct, points, time_taken):
+    """
+    Wersja record_answer dla układu sharded
+
+    Transakcja czyta tylko dokument serii (meta) i zapisuje liczniki do losowego
+    kawałka - dokument zespołu z danymi logowania nie jest blokowany. Zwracane
+    statystyki to suma kawałków z pamięci procesu powiększona o tę odpowiedź,
+    więc wszystkie kawałki są czytane tylko przy braku sumy w pamięci.
+    """
+    meta_ref = _meta_ref(team_ref)
+    counter_name = 'correct' if is_correct else 'incorrect'
+    increments = {
+        ('questions_answered',): 1,
+        ('total_points',): points,
+        ('total_play_time_seconds',): time_taken,
+        (f'{counter_name}_answers',): 1,
+        ('categories', category_id, 'points'): points,
+        ('categories', category_id, counter_name): 1
+    }
+
+    @firestore.transactional
+    def _record_in_transaction(transaction):
+        meta_doc = meta_ref.get(transaction=transaction)
+        metrics.count_storage('read')
+        meta = (meta_doc.to_dict() or {}) if meta_doc.exists else {}
+
+        current_streak = meta.get('current_streak', 0) + 1 if is_correct else 0
+        streak = {'current_streak': current_streak, 'best_streak': max(meta.get('best_streak', 0), current_streak)}
+
+        transaction.set(meta_ref, streak, merge=True)
+        transaction.set(_random_shard_ref(team_ref), _nested_stats_update(increments), merge=True)
+        metrics.count_storage('write', 2)
+        return streak
+
+    streak = _record_in_transaction(db.transaction())
+
+    totals = _add_to_shard_totals(team_ref.id, increments)
+    if totals is None:
+        stats = _read_sharded_stats(team_ref, team_data)
+    else:
+        stats = _with_streak(totals, streak)
+
+    return {
+        'team_name': team_ref.id,
+        'stats': stats,
+        'created_at': team_data.get('created_at')
+    }
+
+
+def update_team_stats_answer(team_name, category, is_correct, points=0, time_taken=0):
+    """
+    Aktualizuje statystyki po udzieleniu odpowiedzi
+    
+    Args:
+        team_name (str): Nazwa zespołu
+        category (str): ID kategorii
+        is_correct (bool): Czy odpowiedź była poprawna
+        points (int): Zdobyte punkty
+        time_taken (int): Czas odpowiedzi w sekundach
+    """
+    return bool(record_answer(team_name, category, is_correct, points, time_taken))
+
+
+# ✅ Filtr pytań widzianych przez zespół - zapisywany w dokumencie zespołu w kawałkach
+def get_seen_questions(team_name):
+    """
+    Pobiera zapisany filtr pytań widzianych przez zespół
+
+    Returns:
+        dict: Mapa seen_questions z dokumentu ({} jeśli jej nie ma) lub None w przypadku błędu
+    """
+    if not db:
+        logger.warning('Firestore not initialized')
+        return None
+
+    try:
+        collection_name = get_teams_collection()
+        team_doc = db.collection(collection_name).document(team_name).get(field_paths=['seen_questions'])
+        metrics.count_storage('read')
+        if not team_doc.exists:
+            return {}
+        return (team_doc.to_dict() or {}).get('seen_questions', {})
+
+    except Exception as e:
+        logger.error('Error getting seen questions: %s', e)
+        return None
+
+
+def save_seen_questions(team_name, chunks, added, bits, hashes, replace=False):
+    """
+    Scala zmienione kawałki filtra pytań widzianych przez zespół z zapisanymi
+
+    Każdy worker ma własną kopię filtra, więc kawałki nie są nadpisywane, tylko
+    łączone z zapisanymi (bitowe OR) w transakcji - bity dodane w innych
+    procesach nie giną. Rozmiar filtra jest stały, więc dokument zespołu nie
+    rośnie wraz z liczbą pytań.
+
+    Args:
+        team_name (str): Nazwa zespołu
+        chunks (dict): {numer kawałka: bytes}
+        added (int): Liczba pytań dodanych do filtra od poprzedniego zapisu
+        bits (int): Rozmiar filtra w bitach
+        hashes (int): Liczba funkcji skrótu
+        replace (bool): Zastąp całą mapę (po wyczyszczeniu filtra)
+
+    Returns:
+        dict: Mapa seen_questions po scaleniu (do uzupełnienia filtra w pamięci),
+            False jeśli zespół nie istnieje, None w przypadku błędu
+    """
+    if not db:
+        logger.warning('Firestore not initialized')
+        return None
+
+    @firestore.transactional
+    def _merge_in_transaction(transaction, team_ref):
+        team_doc = team_ref.get(field_paths=['seen_questions'], transaction=transaction)
+        metrics.count_storage('read')
+
+        if not team_doc.exists:
+            return False
+
+        stored = (team_doc.to_dict() or {}).get('seen_questions') or {}
+        if replace or stored.get('bits') != bits or stored.get('hashes') != hashes:
+            merged = {'bits': bits, 'hashes': hashes, 'count': added, 'chunks': {
+                str(index): bytes(blob) for index, blob in chunks.items()
+            }}
+            transaction.update(team_ref, {'seen_questions': merged})
+        else:
+            merged = {**stored, 'count': stored.get('count', 0) + added, 'chunks': dict(stored.get('chunks') or {})}
+            update_data = {'seen_questions.count': merged['count']}
+            for index, blob in chunks.items():
+                merged['chunks'][str(index)] = merge_seen_chunk(merged['chunks'].get(str(index)), blob)
+                update_data[firestore.FieldPath('seen_questions', 'chunks', str(index)).to_api_repr()] = \
+                    merged['chunks'][str(index)]
+            transaction.update(team_ref, update_data)
+
+        metrics.count_storage('write')
+        return merged
+
+    try:
+        collection_name = get_teams_collection()
+        result = _merge_in_transaction(db.transaction(), db.collection(collection_name).document(team_name))
+        if result is False:
+            logger.warning('Team %s does not exist', team_name)
+        return result
+
+    except Exception as e:
+        logger.error('Error saving seen questions: %s', e)
+        return None
+
+
+# ✅ Podsumowanie rankingu - dokumenty per ranking i kubełek zespołów zamiast przeglądania całej kolekcji
+# Kubełki trzymają dokumenty daleko od limitu 1 MiB i rozkładają zapisy różnych zespołów na różne dokumenty
+LEADERBOARD_SUMMARY_BUCKETS = int(os.getenv('LEADERBOARD_SUMMARY_BUCKETS', '16'))
+LEADERBOARD_META_DOCUMENT = 'leaderboard_meta'
+# Limit operacji w jednym zapisie wsadowym Firestore
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def get_summary_collection():
+    return f'{get_teams_collection()}_summary'
+
+
+def _summary_document_id(board, team_name):
+    bucket = zlib.crc32(team_name.encode('utf-8')) % LEADERBOARD_SUMMARY_BUCKETS
+    return f'leaderboard_{board}_{bucket}'
+
+
+def get_leaderboard_summary(since=None):
+    """
+    Pobiera rankingi z dokumentów podsumowania
+
+    Args:
+        since (float): Jeśli podane, tylko dokumenty zmienione po tym czasie (timestamp)
+
+    Returns:
+        dict: {nazwa rankingu: {team_name: punkty}} ({} jeśli podsumowania nie ma) lub None w przypadku błędu
+    """
+    if not db:
+        logger.warning('Firestore not initialized')
+        return None
+
+    try:
+        summary = db.collection(get_summary_collection())
+        if since is None:
+            # Dokument meta powstaje przy pierwszym zapisie - jego brak oznacza, że podsumowania nie ma
+            metrics.count_storage('read')
+            if not summary.document(LEADERBOARD_META_DOCUMENT).get().exists:
+                return {}
+            documents = summary.stream()
+        else:
+            documents = summary.where(
+                filter=firestore.FieldFilter('updated_at', '>', datetime.fromtimestamp(since, timezone.utc))
+            ).stream()
+
+        boards = {} if since is not None else {'global': {}}
+        for summary_doc in documents:
+            metrics.count_storage('read')
+            data = summary_doc.to_dict() or {}
+            if 'board' not in data:
+                continue
+            boards.setdefault(data['board'], {}).update(data.get('scores') or {})
+        return boards
+
+    except Exception as e:
+        logger.error('Error getting leaderboard summary: %s', e)
+        return None
+
+
+def merge_leaderboard_summary(boards):
+    """
+    Zapisuje zmienione wpisy rankingu do dokumentów podsumowania
+
+    Punkty zespołów tylko rosną, więc każdy wpis jest zapisywany transformacją
+    Maximum - kilka procesów może zapisywać swoje zmiany bez transakcji i bez
+    utraty zmian, a zapis obejmuje tylko zmienione wpisy.
+
+    Args:
+        boards (dict): {nazwa rankingu: {team_name: punkty}}, 'global' lub id kategorii
+
+    Returns:
+        bool: True po zapisie lub None w przypadku błędu
+    """
+    if not db:
+        logger.warning('Firestore not initialized')
+        return None
+
+    documents = {}
+    for name, scores in boards.items():
+        for team_name, points in scores.items():
+            scores_update = documents.setdefault(_summary_document_id(name, team_name), (name, {}))[1]
+            scores_update[team_name] = firestore.Maximum(points)
+
+    try:
+        summary = db.collection(get_summary_collection())
+        batch = db.batch()
+        pending = 0
+        for document_id, (name, scores_update) in documents.items():
+            batch.set(summary.document(document_id), {
+                'board': name,
+                'scores': scores_update,
+                'updated_at': firestore.SERVER_TIMESTAMP
+            }, merge=True)
+            pending += 1
+            if pending == FIRESTORE_BATCH_LIMIT - 1:
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+
+        batch.set(summary.document(LEADERBOARD_META_DOCUMENT), {'updated_at': firestore.SERVER_TIMESTAMP})
+        batch.commit()
+        metrics.count_storage('write')
         return True
-        
+
     except Exception as e:
-        print(f'Error updating team stats: {str(e)}')
-        return False
+        logger.error('Error saving leaderboard summary: %s', e)
+        return None
+
+
+def scan_team_scores():
+    """
+    Odczytuje punkty wszystkich zespołów z kolekcji (tylko do jednorazowej budowy rankingu)
+
+    Returns:
+        dict: {nazwa rankingu: {team_name: punkty}} lub None w przypadku błędu
+    """
+    if not db:
+        logger.warning('Firestore not initialized')
+        return None
+
+    try:
+        collection_name = get_teams_collection()
+        team_stats = {}
+        for team_doc in db.collection(collection_name).select(['stats']).stream():
+            metrics.count_storage('read')
+            if team_doc.id == '_init':
+                continue
+            team_stats[team_doc.id] = {}
+            _add_stats(team_stats[team_doc.id], (team_doc.to_dict() or {}).get('stats') or {})
+
+        # Kawałki statystyk (układ sharded) - dodawane do zespołów z tej kolekcji
+        for shard_doc in db.collection_group(STATS_SHARDS_COLLECTION).stream():
+            metrics.count_storage('read')
+            team_ref = shard_doc.reference.parent.parent
+            if shard_doc.id == STATS_META_DOCUMENT or team_ref.parent.id != collection_name or team_ref.id not in team_stats:
+                continue
+            _add_stats(team_stats[team_ref.id], shard_doc.to_dict() or {})
+
+        boards = {'global': {}}
+        for team_name, stats in team_stats.items():
+            boards['global'][team_name] = stats.get('total_points', 0)
+            for category_id, category_stats in (stats.get('categories') or {}).items():
+                if 'points' in category_stats:
+                    boards.setdefault(str(category_id), {})[team_name] = category_stats['points']
+        return boards
+
+    except Exception as e:
+        logger.error('Error scanning team scores: %s', e)
+        return None
+
+
+# ✅ Migracja statystyk do układu sharded
+def migrate_team_stats(team_name):
+    """
+    Przenosi mapę stats z dokumentu zespołu do kawałków (jedną transakcją)
+
+    Liczniki trafiają jako inkrementy do kawałka 0, seria do dokumentu meta, a
+    mapa stats znika z dokumentu zespołu - po migracji seria jest tylko w meta.
+
+    Returns:
+        bool: True jeśli przeniesiono statystyki, False jeśli nie było czego przenosić, None przy błędzie
+    """
+    if not db:
+        logger.warning('Firestore not initialized')
+        return None
+
+    @firestore.transactional
+    def _migrate_in_transaction(transaction, team_ref):
+        team_doc = team_ref.get(transaction=transaction)
+        meta_doc = _meta_ref(team_ref).get(transaction=transaction)
+        if not team_doc.exists:
+            return False
+
+        team_data = team_doc.to_dict()
+        legacy = team_data.get('stats')
+        if legacy is None:
+            if team_data.get('stats_layout') != 'sharded':
+                transaction.update(team_ref, {'stats_layout': 'sharded'})
+            return False
+
+        transaction.set(_shards_ref(team_ref).document('0'), _increment_tree(legacy), merge=True)
+        stored_meta = (meta_doc.to_dict() or {}) if meta_doc.exists else {}
+        transaction.set(_meta_ref(team_ref), {
+            'current_streak': legacy.get('current_streak', 0),
+            'best_streak': max(legacy.get('best_streak', 0), stored_meta.get('best_streak', 0))
+        })
+        transaction.update(team_ref, {'stats': firestore.DELETE_FIELD, 'stats_layout': 'sharded'})
+        return True
+
+    try:
+        collection_name = get_teams_collection()
+        team_ref = db.collection(collection_name).document(team_name)
+        migrated = _migrate_in_transaction(db.transaction(), team_ref)
+        _stats_layouts.delete(team_name)
+        _shard_totals.delete(team_name)
+        return migrated
+
+    except Exception as e:
+        logger.error('Error migrating stats for team %s: %s', team_name, e)
+        return None
+
+
+def migrate_all_team_stats(dry_run=False):
+    """
+    Migruje statystyki wszystkich zespołów, które mają jeszcze mapę stats w dokumencie
+
+    Returns:
+        dict: {'migrated', 'skipped', 'failed'} - liczby zespołów
+    """
+    result = {'migrated': 0, 'skipped': 0, 'failed': 0}
+    if not db:
+        logger.warning('Firestore not initialized')
+        return result
+
+    collection_name = get_teams_collection()
+    for team_doc in db.collection(collection_name).select(['stats_layout']).stream():
+        if team_doc.id == '_init' or (team_doc.to_dict() or {}).get('stats_layout') == 'sharded':
+            result['skipped'] += 1
+            continue
+
+        if dry_run:
+            logger.info('Would migrate stats for team: %s', team_doc.id)
+            result['migrated'] += 1
+            continue
+
+        migrated = migrate_team_stats(team_doc.id)
+        if migrated is None:
+            result['failed'] += 1
+        elif migrated:
+            result['migrated'] += 1
+        else:
+            result['skipped'] += 1
+
+    return result
+
+
+# ✅ Backend SQLite - jego metody zastępują powyższe funkcje Firestore (interfejs: modules/storage)
+if STORAGE_BACKEND == 'sqlite':
+    from modules.storage.sqlite import SqliteStorage
+
+    storage = SqliteStorage(
+        STORAGE_SQLITE_PATH or os.path.join('data', f'{get_teams_collection()}.sqlite3'),
+        notify_points=_notify_points
+    )
+    bind_backend(globals(), storage)
+    logger.info('Using SQLite storage in database.py: %s', storage.path)
+elif STORAGE_BACKEND != 'firestore':
+    logger.warning('Unknown STORAGE_BACKEND %s, using Firestore', STORAGE_BACKEND)
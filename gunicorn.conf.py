@@ -0,0 +1,70 @@
+# Konfiguracja gunicorn
+#
+# Uruchomienie:
+#     gunicorn -c gunicorn.conf.py app:app                                                  (gthread, domyślnie)
+#     GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+#
+# Model procesów: master importuje aplikację raz (preload_app) - prompty, lokalne
+# kategorie i skompilowane szablony powstają przed fork i są współdzielone przez
+# copy-on-write. Klienci sieciowi (Firestore/gRPC, pule HTTP, połączenia SQLite)
+# są tworzeni dopiero w workerach, przy pierwszym użyciu. Opis i pomiary: README.
+import gc
+import os
+
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# sync - jeden wątek na worker, gthread - pula wątków, gevent - greenlety, uvicorn.workers.UvicornWorker - asgi:app
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+# Wątki na worker (tylko gthread) i równoległe połączenia na worker (gevent)
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '200'))
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+# Dłużej niż GEMINI_READ_TIMEOUT z ponowieniami - inaczej master zabija worker czekający na Gemini
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+if 'gevent' in worker_class:
+    # Przy preload_app aplikacja jest importowana w masterze, zanim worker gevent
+    # podmieni moduły - zamki i gniazda tworzone przy imporcie byłyby blokujące
+    from gevent import monkey
+
+    monkey.patch_all()
+
+
+def when_ready(server):
+    """
+    Master po załadowaniu aplikacji, przed utworzeniem workerów
+    """
+    if not preload_app:
+        return
+
+    from app import preload
+
+    preload()
+    # Obiekty z mastera nie będą przeglądane przez GC w workerach - mniej kopiowanych stron pamięci
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """
+    Worker zaraz po fork - porzuca klientów sieciowych odziedziczonych po masterze
+    """
+    if 'gevent' in worker_class:
+        try:
+            import grpc.experimental.gevent as grpc_gevent
+
+            grpc_gevent.init_gevent()
+        except ImportError:
+            pass
+
+    if preload_app:
+        from app import reset_after_fork
+
+        reset_after_fork()
@@ -0,0 +1,119 @@
+from functools import wraps
+import hmac
+import os
+
+import click
+from flask import Blueprint, request, jsonify
+from flask.cli import AppGroup
+from dotenv import load_dotenv
+
+import database
+from modules import capture, profiling
+
+
+load_dotenv()
+
+bp = Blueprint('admin', __name__)
+
+# Endpointy administracyjne są dostępne tylko gdy ustawiono ADMIN_TOKEN
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+
+def is_admin_request():
+    """
+    Sprawdza, czy bieżące żądanie ma poprawny nagłówek X-Admin-Token
+    """
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Admin endpoints are disabled'}), 404
+
+        if not is_admin_request():
+            return jsonify({'error': 'Admin token required'}), 403
+
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@bp.route('/captures', methods=['GET'])
+@admin_required
+def get_captures():
+    """
+    Zwraca ostatnie zapisane odpowiedzi zewnętrznych API
+
+    Query params:
+        limit (int): Liczba wpisów (domyślnie 20)
+        kind (str, optional): Rodzaj wpisu, np. 'gemini_description'
+    """
+    limit = request.args.get('limit', 20, type=int)
+    kind = request.args.get('kind') or None
+
+    return jsonify({
+        'status': capture.get_capture_status(),
+        'captures': capture.get_captures(limit, kind)
+    }), 200
+
+
+@bp.route('/profiles', methods=['GET'])
+@admin_required
+def get_profiles():
+    """
+    Zwraca listę ostatnich profili żądań (PROFILING_ENABLED)
+    """
+    if not profiling.PROFILING_ENABLED:
+        return jsonify({'error': 'Profiling disabled'}), 404
+
+    return jsonify({'profiles': profiling.get_profiles()}), 200
+
+
+@bp.route('/profiles/collapsed', methods=['GET'])
+@bp.route('/profiles/<int:profile_id>/collapsed', methods=['GET'])
+@admin_required
+def get_profile_collapsed(profile_id=None):
+    """
+    Zwraca stosy w formacie collapsed (wejście dla flamegraph.pl / speedscope)
+
+    Bez profile_id łączy wszystkie zapamiętane profile.
+
+    Query params:
+        endpoint (str, optional): Tylko profile tego endpointu, np. 'ai.generate_description'
+    """
+    if not profiling.PROFILING_ENABLED:
+        return jsonify({'error': 'Profiling disabled'}), 404
+
+    if profile_id is None:
+        body = profiling.get_collapsed(request.args.get('endpoint') or None)
+    else:
+        profile = profiling.get_profile(profile_id)
+        if profile is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        body = profile.collapsed()
+
+    return body, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+
+# Komendy CLI: flask stats migrate
+cli = AppGroup('stats', help='Statystyki zespołów')
+
+
+@cli.command('migrate')
+@click.option('--team', 'team_name', default=None, help='Migruj tylko jeden zespół')
+@click.option('--dry-run', is_flag=True, help='Tylko wypisz zespoły do migracji')
+def migrate_stats_command(team_name, dry_run):
+    """
+    Przenosi statystyki z dokumentów zespołów do kawałków (układ STATS_LAYOUT=sharded)
+    """
+    if team_name:
+        if dry_run:
+            print(f'Would migrate stats for team: {team_name}')
+            return
+        migrated = database.migrate_team_stats(team_name)
+        print(f'Team {team_name}: ' + {True: 'migrated', False: 'nothing to migrate', None: 'failed'}[migrated])
+        return
+
+    result = database.migrate_all_team_stats(dry_run=dry_run)
+    print(f"Migrated: {result['migrated']}, skipped: {result['skipped']}, failed: {result['failed']}")
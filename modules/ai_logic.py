@@ -1,159 +1,201 @@
-from flask import Blueprint, Flask, app, render_template, jsonify, make_response, session
+from flask import Blueprint, jsonify, Response, stream_with_context
 import os
 import json
+import unicodedata
 import requests
 from flask import request
 from dotenv import load_dotenv
-from google.cloud import firestore
+
+from modules import capture, upstream
+from modules.streaming import JsonStringFieldReader, sse_event, iter_gemini_stream_text
+from modules.cache import PersistentCache, make_key
+from modules.prompts import prompt_registry, KEYWORD_DEFINITION_PROMPT, KEYWORD_DEFINITIONS_BATCH_PROMPT
+from modules.log import get_logger
 
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 # Utwórz Blueprint
 bp = Blueprint('ai', __name__)
 
 # Załaduj zmienne środowiskowe
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 GEMINI_API_URL = os.getenv('GEMINI_API_URL', '')
+GEMINI_STREAM_URL = os.getenv('GEMINI_STREAM_URL', GEMINI_API_URL.replace(':generateContent', ':streamGenerateContent'))
 
-# Wczytaj prompty
-try:
-    with open('static/data/prompts.json', 'r', encoding='utf-8') as f:
-        prompts_data = json.load(f)
-        PROMPTS_TYPE = prompts_data.get('introduction_prompts', [])
-except:
-    PROMPTS_TYPE = []
+# Cache opisów pytań - kluczem jest skrót pełnego body żądania do Gemini
+CACHE_DIR = os.getenv('CACHE_DIR', 'cache')
+DESCRIPTION_CACHE_TTL = float(os.getenv('DESCRIPTION_CACHE_TTL', str(7 * 24 * 3600)))
+DESCRIPTION_CACHE_MAX_BYTES = int(os.getenv('DESCRIPTION_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+DESCRIPTION_CACHE_MEMORY_SIZE = int(os.getenv('DESCRIPTION_CACHE_MEMORY_SIZE', '512'))
+# Liczba slotów warstwy współdzielonej przez workery (plik w CACHE_DIR mapowany w pamięć, 0 - wyłączona)
+SHARED_CACHE_SLOTS = int(os.getenv('SHARED_CACHE_SLOTS', '4096'))
 
+description_cache = PersistentCache(
+    'gemini_descriptions',
+    os.path.join(CACHE_DIR, 'descriptions.sqlite3'),
+    ttl=DESCRIPTION_CACHE_TTL,
+    max_bytes=DESCRIPTION_CACHE_MAX_BYTES,
+    memory_size=DESCRIPTION_CACHE_MEMORY_SIZE,
+    shared_slots=SHARED_CACHE_SLOTS,
+    shared_slot_size=8192
+)
 
-@bp.route('/generate-description', methods=['GET'])
-def generate_description():
-    # Pobierz parametry z żądania
-    category = request.args.get('category', '')
-    temperature = request.args.get('temperature', '0.5')
-    print(f"Temperature received: {temperature}")
-    question = request.args.get('question', '')
-    correct_answer = request.args.get('correct_answer', '')
-    incorrect_answers = request.args.get('incorrect_answers', '')
-    prompt_type = request.args.get('prompt_type', '')
-
-    if prompt_type:
-        for prompt in PROMPTS_TYPE:
-            if prompt['id'] == prompt_type:
-                # Wydobądź wartości 'text' z zagnieżdżonych obiektów
-                system_instruction = prompt['modality']['systemInstruction']  # Usuń [0] - to nie jest tablica
-                systemInstruction_parts = []
-                
-                # Iteruj przez klucze w systemInstruction (role, descriptionTask, etc.)
-                for key, value in system_instruction.items():
-                    if isinstance(value, dict) and 'text' in value:
-                        systemInstruction_parts.append({"text": value['text']})
-                
-                print(f"System instruction parts for prompt type {prompt_type}: {systemInstruction_parts}")
-                
-                # Wydobądź description z generationConfig
-                introduction_prompt_type_description = prompt['modality']['generationConfig']['introduction']['description']
-                print(f"Using introduction prompt type id {prompt_type}")
-                break
-        else:
-            # Jeśli nie znaleziono promptu, użyj domyślnych wartości
-            systemInstruction_parts = [
-                {"text": "Jesteś ekspertem ds. edukacji i tworzenia treści kontekstowych."},
-                {"text": "Twoim zadaniem jest wygenerowanie 5-zdaniowego wprowadzenia do zadanego tematu pytania."},
-                {"text": "oraz 5-zdaniowego podsumowania rozwijającego kontekst prawidłowej odpowiedzi."},
-                {"text": "Dodatkowo, wygeneruj listę najciekawszych terminów, które znajdują się w treści wprowadzenia i podsumowania, dla których użytkownik może chcieć pogłębić wiedzę."},
-                {"text": "Odpowiedzi muszą być precyzyjne, edukacyjne i generowane **tylko w języku polskim**."}
-            ]
-            introduction_prompt_type_description = "Pięciozdaniowe wprowadzenie do tematu pytania, nakreślające kontekst i znaczenie zagadnienia."
-    else:
-        # Domyślne wartości gdy nie wybrano typu promptu
-        systemInstruction_parts = [
-            {"text": "Jesteś ekspertem ds. edukacji i tworzenia treści kontekstowych."},
-            {"text": "Twoim zadaniem jest wygenerowanie 5-zdaniowego wprowadzenia do zadanego tematu pytania."},
-            {"text": "oraz 5-zdaniowego podsumowania rozwijającego kontekst prawidłowej odpowiedzi."},
-            {"text": "Dodatkowo, wygeneruj listę najciekawszych terminów, które znajdują się w treści wprowadzenia i podsumowania, dla których użytkownik może chcieć pogłębić wiedzę."},
-            {"text": "Odpowiedzi muszą być precyzyjne, edukacyjne i generowane **tylko w języku polskim**."}
-        ]
-        introduction_prompt_type_description = "Pięciozdaniowe wprowadzenie do tematu pytania, nakreślające kontekst i znaczenie zagadnienia."
+# Cache definicji słów kluczowych - kluczem jest (słowo, skrót pytania, temperatura)
+KEYWORD_CACHE_TTL = float(os.getenv('KEYWORD_CACHE_TTL', str(30 * 24 * 3600)))
+KEYWORD_BATCH_MAX_SIZE = int(os.getenv('KEYWORD_BATCH_MAX_SIZE', '30'))
 
+keyword_cache = PersistentCache(
+    'keyword_definitions',
+    os.path.join(CACHE_DIR, 'keywords.sqlite3'),
+    ttl=KEYWORD_CACHE_TTL,
+    max_bytes=DESCRIPTION_CACHE_MAX_BYTES,
+    memory_size=2048,
+    shared_slots=SHARED_CACHE_SLOTS,
+    shared_slot_size=4096
+)
 
-    # Sprawdź czy klucz API jest ustawiony
-    if not GEMINI_API_KEY or not GEMINI_API_URL:
-        app.logger.error('GEMINI_API_KEY or GEMINI_API_URL not set')
-        return jsonify({'error': 'API configuration missing'}), 500
+
+def build_description_request(args):
+    """
+    Buduje zserializowane body żądania opisu pytania z parametrów zapytania
+    """
+    # Pobierz parametry z żądania
+    category = args.get('category', '')
+    temperature = args.get('temperature', '0.5')
+    logger.debug('Temperature received: %s', temperature)
+    question = args.get('question', '')
+    correct_answer = args.get('correct_answer', '')
+    incorrect_answers = args.get('incorrect_answers', '')
+    prompt_type = args.get('prompt_type', '')
+
+    # Skompilowany szablon żądania (domyślny, gdy nie wybrano typu promptu)
+    prompt = prompt_registry.get_description_prompt(prompt_type)
 
     # Przygotuj prompt dla Gemini
     user_prompt = f"Wygeneruj treści na podstawie poniższych danych. Kategoria: '{category}'. Pytanie: '{question}'. Prawidłowa odpowiedź: '{correct_answer}'. Błędne odpowiedzi: '{incorrect_answers}'"
 
-    # Przygotuj request body dla Gemini API
-    gemini_request = {
-        "contents": [
-            {
-                "role": "user",
-                "parts": [
-                    {
-                        "text": user_prompt
-                    }
-                ]
-            }
-        ],
-        "systemInstruction": {
-            "parts": systemInstruction_parts
-        },
-        "generationConfig": {
-            "temperature":  float(temperature),
-            "responseMimeType": "application/json",
-            "responseSchema": {
-                "type": "object",
-                "properties": {
-                    "wprowadzenie": {
-                        "type": "string",
-                        "description": introduction_prompt_type_description
-                    },
-                    "podsumowanie": {
-                        "type": "string",
-                        "description": "Pięciozdaniowe rozszerzenie informacyjne na temat prawidłowej odpowiedzi, wyjaśniające jej znaczenie i kontekst."
-                    },
-                    "słowa_kluczowe": {
-                        "type": "array",
-                        "description": "Lista kluczowych terminów, nazw własnych, definicji lub dat z tekstu wprowadzenia i podsumowania, które mogą być interesujące i moga wymagać pogłębienia wiedzy. Wygenerowane wartości muszą mieć ten sam zapis jak w wprowadzeniu i podsumowaniu.",
-                        "items": {
-                            "type": "string"
-                        }
-                    }
-                },
-                "required": ["wprowadzenie", "podsumowanie", "słowa_kluczowe"]
-            }
+    # Wstaw tylko tekst użytkownika do gotowego szablonu
+    return prompt.render(user_prompt, temperature)
+
+
+def description_cache_key(gemini_request):
+    # Ten sam prompt i model dają ten sam wpis w cache'u
+    return make_key([GEMINI_API_URL, gemini_request])
+
+
+def parse_description_response(gemini_request, gemini_response):
+    """
+    Wydobywa wprowadzenie, podsumowanie i słowa kluczowe z odpowiedzi Gemini
+
+    Returns:
+        dict: {'wprowadzenie', 'podsumowanie', 'slowa_kluczowe'} lub None, jeśli Gemini nie zwróciło kandydatów
+    """
+    # Zapisz próbkę pełnej odpowiedzi do debugowania (bez I/O w wątku żądania)
+    capture.record('gemini_description', {'request': gemini_request, 'response': gemini_response})
+
+    # Wydobądź wprowadzenie i podsumowanie
+    if 'candidates' in gemini_response and len(gemini_response['candidates']) > 0:
+        content = gemini_response['candidates'][0]['content']['parts'][0]['text']
+        # Parse JSON z text field
+        parsed_content = json.loads(content)
+
+        return {
+            'wprowadzenie': parsed_content.get('wprowadzenie', ''),
+            'podsumowanie': parsed_content.get('podsumowanie', ''),
+            'slowa_kluczowe': parsed_content.get('słowa_kluczowe', [])
         }
+
+    return None
+
+
+def normalize_keyword(keyword):
+    """
+    Normalizuje słowo kluczowe do klucza cache'a: NFC, bez wielkości liter i nadmiarowych spacji
+    """
+    return ' '.join(unicodedata.normalize('NFC', keyword).casefold().split())
+
+
+def keyword_cache_key(keyword, question, temperature):
+    # Pytanie wchodzi do klucza jako skrót - definicja zależy od kontekstu pytania
+    question_hash = make_key(question)[:16] if question else ''
+    return make_key([GEMINI_API_URL, normalize_keyword(keyword), question_hash, round(float(temperature), 1)])
+
+
+def build_keyword_request(keyword, question, temperature):
+    """
+    Buduje zserializowane body żądania definicji słowa kluczowego
+    """
+    # Zmodyfikowany prompt z kontekstem pytania
+    if question:
+        user_prompt = f"Wyjaśnij w 3-4 zdaniach co oznacza termin: '{keyword}'. Odpowiedź powinna być zwięzła, merytoryczna i edukacyjna. Pamiętaj, że wyjaśnienie jest w kontekście pytania: '{question}', ale NIE MOŻESZ zdradzić odpowiedzi na to pytanie."
+    else:
+        user_prompt = f"Wyjaśnij w 3-4 zdaniach co oznacza termin: '{keyword}'. Odpowiedź powinna być zwięzła, merytoryczna i edukacyjna."
+
+    return KEYWORD_DEFINITION_PROMPT.render(user_prompt, temperature)
+
+
+def build_keyword_batch_request(keywords, question, temperature):
+    """
+    Buduje body jednego żądania o definicje wszystkich podanych słów kluczowych
+    """
+    terms = ', '.join(f"'{keyword}'" for keyword in keywords)
+    user_prompt = f"Wyjaśnij w 3-4 zdaniach co oznacza każdy z terminów: {terms}. Każda odpowiedź powinna być zwięzła, merytoryczna i edukacyjna."
+    if question:
+        user_prompt += f" Pamiętaj, że wyjaśnienia są w kontekście pytania: '{question}', ale NIE MOŻESZ zdradzić odpowiedzi na to pytanie."
+
+    return KEYWORD_DEFINITIONS_BATCH_PROMPT.render(user_prompt, temperature)
+
+
+def parse_keyword_batch_response(gemini_response):
+    """
+    Zwraca {znormalizowane słowo: definicja} z odpowiedzi na żądanie zbiorcze
+    """
+    if 'candidates' not in gemini_response or len(gemini_response['candidates']) == 0:
+        return {}
+
+    content = gemini_response['candidates'][0]['content']['parts'][0]['text']
+    return {
+        normalize_keyword(item.get('termin', '')): item.get('definicja', '')
+        for item in json.loads(content)
+        if item.get('termin') and item.get('definicja')
     }
 
+
+def parse_keyword_response(gemini_response):
+    """
+    Zwraca tekst definicji z odpowiedzi Gemini lub None
+    """
+    if 'candidates' in gemini_response and len(gemini_response['candidates']) > 0:
+        return gemini_response['candidates'][0]['content']['parts'][0]['text']
+    return None
+
+
+def _gemini_url():
+    return f"{GEMINI_API_URL}?key={GEMINI_API_KEY}"
+
+
+# Body żądań jest już zserializowanym JSON-em
+GEMINI_HEADERS = {'Content-Type': 'application/json; charset=utf-8'}
+
+
+@bp.route('/generate-description', methods=['GET'])
+def generate_description():
+    # Sprawdź czy klucz API jest ustawiony
+    if not GEMINI_API_KEY or not GEMINI_API_URL:
+        logger.error('GEMINI_API_KEY or GEMINI_API_URL not set')
+        return jsonify({'error': 'API configuration missing'}), 500
+
     try:
-        # Wyślij żądanie do Gemini API
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        url = f"{GEMINI_API_URL}?key={GEMINI_API_KEY}"
-        response = requests.post(url, headers=headers, json=gemini_request)
-        response.raise_for_status()
-        gemini_response = response.json()
-
-        # Zapisz pełną odpowiedź do pliku
-        with open('static/data/api_response.json', 'w', encoding='utf-8') as f:
-            json.dump(gemini_response, f, ensure_ascii=False, indent=2)
-
-        # Wydobądź wprowadzenie i podsumowanie
-        if 'candidates' in gemini_response and len(gemini_response['candidates']) > 0:
-            content = gemini_response['candidates'][0]['content']['parts'][0]['text']
-            # Parse JSON z text field
-            parsed_content = json.loads(content)
-            
-            return jsonify({
-                'wprowadzenie': parsed_content.get('wprowadzenie', ''),
-                'podsumowanie': parsed_content.get('podsumowanie', ''),
-                'slowa_kluczowe': parsed_content.get('słowa_kluczowe', [])
-            }), 200
-        else:
+        description = get_description(request.args)
+
+        if description is None:
             return jsonify({'error': 'No valid response from Gemini API'}), 500
 
+        return jsonify(description), 200
+
     except requests.exceptions.RequestException as e:
         return jsonify({'error': f'Request error: {str(e)}'}), 500
     except json.JSONDecodeError as e:
@@ -162,59 +204,246 @@ def generate_description():
         return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
 
 
+def get_description(args):
+    """
+    Zwraca opis pytania dla parametrów zapytania (z cache'a lub z Gemini API)
+
+    Ten sam prompt zwraca opis z cache'a; równoczesne chybienia wysyłają jedno żądanie.
+    """
+    gemini_request = build_description_request(args)
+    return description_cache.get_or_compute(
+        description_cache_key(gemini_request),
+        lambda: _request_description(gemini_request)
+    )
+
+
+def _request_description(gemini_request):
+    """
+    Wysyła żądanie opisu do Gemini API i zwraca sparsowaną odpowiedź
+
+    Args:
+        gemini_request (str): Zserializowane body żądania z CompiledPrompt.render
+    """
+    response = upstream.gemini.post(_gemini_url(), headers=GEMINI_HEADERS, data=gemini_request.encode('utf-8'))
+    response.raise_for_status()
+    return parse_description_response(gemini_request, response.json())
+
+
+@bp.route('/generate-description/stream', methods=['GET'])
+def generate_description_stream():
+    """
+    Strumieniuje opis pytania jako Server-Sent Events
+
+    Zdarzenia:
+        chunk - {'text': str} kolejny fragment wprowadzenia, wysyłany w trakcie generowania
+        done  - {'wprowadzenie', 'podsumowanie', 'slowa_kluczowe'} pełny opis na końcu strumienia
+        error - {'error': str}
+    """
+    if not GEMINI_API_KEY or not GEMINI_STREAM_URL:
+        return jsonify({'error': 'API configuration missing'}), 500
+
+    gemini_request = build_description_request(request.args)
+    cache_key = description_cache_key(gemini_request)
+
+    def generate():
+        cached = description_cache.get(cache_key)
+        if cached is not None:
+            yield sse_event('chunk', {'text': cached['wprowadzenie']})
+            yield sse_event('done', cached)
+            return
+
+        try:
+            url = f"{GEMINI_STREAM_URL}?alt=sse&key={GEMINI_API_KEY}"
+            response = upstream.gemini.post(url, headers=GEMINI_HEADERS, data=gemini_request.encode('utf-8'), stream=True)
+            response.raise_for_status()
+
+            # Wprowadzenie jest wysyłane do przeglądarki w miarę dekodowania z niepełnego JSON-a
+            introduction = JsonStringFieldReader('wprowadzenie')
+            content = []
+            with response:
+                for text in iter_gemini_stream_text(response):
+                    content.append(text)
+                    introduction_text = introduction.feed(text)
+                    if introduction_text:
+                        yield sse_event('chunk', {'text': introduction_text})
+
+            # Pełna odpowiedź w formacie generateContent - podsumowanie i słowa kluczowe na koniec
+            gemini_response = {'candidates': [{'content': {'parts': [{'text': ''.join(content)}]}}]}
+            description = parse_description_response(gemini_request, gemini_response)
+
+            if description is None:
+                yield sse_event('error', {'error': 'No valid response from Gemini API'})
+                return
+
+            description_cache.set(cache_key, description)
+            yield sse_event('done', description)
+
+        except requests.exceptions.RequestException as e:
+            yield sse_event('error', {'error': f'Request error: {str(e)}'})
+        except json.JSONDecodeError as e:
+            yield sse_event('error', {'error': f'JSON parsing error: {str(e)}'})
+        except Exception as e:
+            yield sse_event('error', {'error': f'Unexpected error: {str(e)}'})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @bp.route('/get-keyword-definition', methods=['GET'])
 def get_keyword_definition():
     try:
         keyword = request.args.get('keyword', '')
         temperature = float(request.args.get('temperature', 0.5))
         question = request.args.get('question', '')
-        
+
         if not keyword:
             return jsonify({'error': 'Keyword parameter is required'}), 400
 
-        # Zmodyfikowany prompt z kontekstem pytania
-        if question:
-            user_prompt = f"Wyjaśnij w 3-4 zdaniach co oznacza termin: '{keyword}'. Odpowiedź powinna być zwięzła, merytoryczna i edukacyjna. Pamiętaj, że wyjaśnienie jest w kontekście pytania: '{question}', ale NIE MOŻESZ zdradzić odpowiedzi na to pytanie."
+        # Te same terminy powtarzają się w pytaniach i zespołach - najpierw cache
+        definition = keyword_cache.get_or_compute(
+            keyword_cache_key(keyword, question, temperature),
+            lambda: _request_keyword_definition(keyword, question, temperature)
+        )
+
+        if definition is not None:
+            return jsonify({'definition': definition}), 200
         else:
-            user_prompt = f"Wyjaśnij w 3-4 zdaniach co oznacza termin: '{keyword}'. Odpowiedź powinna być zwięzła, merytoryczna i edukacyjna."
-
-        gemini_request = {
-            "contents": [
-                {
-                    "role": "user",
-                    "parts": [{"text": user_prompt}]
-                }
-            ],
-            "systemInstruction": {
-                "parts": [
-                    {
-                        "text": "Jesteś ekspertem edukacyjnym. Twoim zadaniem jest wyjaśnianie pojęć w usystematyzowany sposób podając definicje, rozwijając je oraz przywołując przykłady. "
-                               "Odpowiedzi generuj **tylko w języku polskim**. "
-                               "WAŻNE: Jeśli wyjaśnienie jest w kontekście pytania quizowego, NIE MOŻESZ w żaden sposób sugerować ani zdradzać prawidłowej odpowiedzi. "
-                               "Skup się na ogólnym wyjaśnieniu terminu bez wskazywania konkretnych odpowiedzi."
-                    }
-                ]
-            },
-            "generationConfig": {
-                "temperature": temperature,
-                "responseMimeType": "text/plain"
-            }
-        }
+            return jsonify({'error': 'No valid response from Gemini API'}), 500
+
+    except Exception as e:
+        logger.error('Error getting keyword definition: %s', e, exc_info=True)
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+
+
+def _request_keyword_definition(keyword, question, temperature):
+    gemini_request = build_keyword_request(keyword, question, temperature)
+    response = upstream.gemini.post(_gemini_url(), headers=GEMINI_HEADERS, data=gemini_request.encode('utf-8'))
+    response.raise_for_status()
+    return parse_keyword_response(response.json())
+
+
+@bp.route('/keyword-definitions', methods=['POST'])
+def get_keyword_definitions():
+    """
+    Zwraca definicje wielu słów kluczowych naraz - brakujące w cache'u pobiera jednym żądaniem do Gemini
+
+    Expected JSON:
+    {
+        "keywords": ["string", ...],
+        "question": "string (optional)",
+        "temperature": float
+    }
+    """
+    try:
+        data = request.json
+        keywords = [keyword for keyword in data.get('keywords', []) if isinstance(keyword, str) and keyword.strip()]
+        question = data.get('question', '')
+        temperature = float(data.get('temperature', 0.5))
+
+        if not keywords:
+            return jsonify({'error': 'Keywords parameter is required'}), 400
+
+        if len(keywords) > KEYWORD_BATCH_MAX_SIZE:
+            return jsonify({'error': f'At most {KEYWORD_BATCH_MAX_SIZE} keywords per request'}), 400
+
+        definitions = {}
+        missing = []
+        for keyword in keywords:
+            definition = keyword_cache.get(keyword_cache_key(keyword, question, temperature))
+            if definition is not None:
+                definitions[keyword] = definition
+            else:
+                missing.append(keyword)
+
+        if missing:
+            gemini_request = build_keyword_batch_request(missing, question, temperature)
+            response = upstream.gemini.post(_gemini_url(), headers=GEMINI_HEADERS, data=gemini_request.encode('utf-8'))
+            response.raise_for_status()
+            generated = parse_keyword_batch_response(response.json())
+
+            for keyword in missing:
+                definition = generated.get(normalize_keyword(keyword))
+                if definition:
+                    keyword_cache.set(keyword_cache_key(keyword, question, temperature), definition)
+                    definitions[keyword] = definition
 
-        headers = {'Content-Type': 'application/json'}
-        url = f"{GEMINI_API_URL}?key={GEMINI_API_KEY}"
-        
-        response = requests.post(url, headers=headers, json=gemini_request, timeout=30)
+        return jsonify({'definitions': definitions}), 200
+
+    except requests.exceptions.RequestException as e:
+        return jsonify({'error': f'Request error: {str(e)}'}), 500
+    except json.JSONDecodeError as e:
+        return jsonify({'error': f'JSON parsing error: {str(e)}'}), 500
+    except Exception as e:
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+
+
+# ✅ Wersje asynchroniczne dla ścieżki ASGI (asgi.py) - zwracają (payload, status)
+
+async def generate_description_async(async_request):
+    import httpx
+
+    if not GEMINI_API_KEY or not GEMINI_API_URL:
+        logger.warning('GEMINI_API_KEY or GEMINI_API_URL not set')
+        return {'error': 'API configuration missing'}, 500
+
+    gemini_request = build_description_request(async_request.args)
+
+    async def _request_description_async():
+        response = await upstream.async_gemini.post(
+            _gemini_url(), headers=GEMINI_HEADERS, content=gemini_request.encode('utf-8')
+        )
         response.raise_for_status()
-        gemini_response = response.json()
+        return parse_description_response(gemini_request, response.json())
 
-        if 'candidates' in gemini_response and len(gemini_response['candidates']) > 0:
-            definition = gemini_response['candidates'][0]['content']['parts'][0]['text']
-            
-            return jsonify({'definition': definition}), 200
+    try:
+        description = await description_cache.get_or_compute_async(
+            description_cache_key(gemini_request),
+            _request_description_async
+        )
+
+        if description is None:
+            return {'error': 'No valid response from Gemini API'}, 500
+
+        return description, 200
+
+    except httpx.HTTPError as e:
+        return {'error': f'Request error: {str(e)}'}, 500
+    except json.JSONDecodeError as e:
+        return {'error': f'JSON parsing error: {str(e)}'}, 500
+    except Exception as e:
+        return {'error': f'Unexpected error: {str(e)}'}, 500
+
+
+async def get_keyword_definition_async(async_request):
+    try:
+        keyword = async_request.args.get('keyword', '')
+        temperature = float(async_request.args.get('temperature', 0.5))
+        question = async_request.args.get('question', '')
+
+        if not keyword:
+            return {'error': 'Keyword parameter is required'}, 400
+
+        async def _request_keyword_definition_async():
+            gemini_request = build_keyword_request(keyword, question, temperature)
+            response = await upstream.async_gemini.post(
+                _gemini_url(), headers=GEMINI_HEADERS, content=gemini_request.encode('utf-8')
+            )
+            response.raise_for_status()
+            return parse_keyword_response(response.json())
+
+        definition = await keyword_cache.get_or_compute_async(
+            keyword_cache_key(keyword, question, temperature),
+            _request_keyword_definition_async
+        )
+
+        if definition is not None:
+            return {'definition': definition}, 200
         else:
-            return jsonify({'error': 'No valid response from Gemini API'}), 500
+            return {'error': 'No valid response from Gemini API'}, 500
 
     except Exception as e:
-        app.logger.error(f'Error getting keyword definition: {str(e)}', exc_info=True)
-        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
\ No newline at end of file
+        logger.error('Error getting keyword definition: %s', e)
+        return {'error': f'Unexpected error: {str(e)}'}, 500
@@ -1,8 +1,13 @@
 from flask import Blueprint, request, jsonify, session
-from database import create_team, authenticate_team, team_exists, validate_team_session
+from database import create_team, authenticate_team, team_exists, validate_team_session, async_validate_team_session
+from modules import speculation
 
 from functools import wraps
 from flask import redirect, url_for, session, jsonify
+from modules.log import get_logger
+
+
+logger = get_logger(__name__)
 
 bp = Blueprint('auth', __name__)
 
@@ -42,6 +47,22 @@ def login_required(f):
     return decorated_function
 
 
+async def async_session_is_valid(session_data):
+    """
+    Odpowiednik login_required dla ścieżki ASGI - sprawdza odczytaną sesję Flask
+    
+    Args:
+        session_data (dict): Zdekodowana sesja z ciasteczka
+    
+    Returns:
+        bool: True jeśli sesja jest zalogowana i zgodna z bazą danych
+    """
+    if 'team_name' not in session_data or not session_data.get('logged_in') or 'team_id' not in session_data:
+        return False
+
+    return await async_validate_team_session(session_data.get('team_name'), session_data.get('team_id'))
+
+
 @bp.route('/register', methods=['POST'])
 def register():
     """
@@ -115,7 +136,7 @@ def login():
             # Zapisz w sesji
             session['team_name'] = team_name
             session['team_id'] = result.get('team_id')
-            print(f"Team logged in successfully: {team_name}, ID: {session['team_id']}")
+            logger.debug('Team logged in successfully: %s, ID: %s', team_name, session['team_id'])
             session['logged_in'] = True
             return jsonify({'success': True, 'message': 'Log in successful', 'result': result}), 200
         else:
@@ -130,6 +151,8 @@ def logout():
     """
     Endpoint wylogowania
     """
+    # Porzuć pytania przygotowane w tle dla zespołu
+    speculation.cancel_team(session.get('team_name'))
     session.clear()
     return jsonify({'success': True, 'message': 'Logged out successfully'}), 200
 
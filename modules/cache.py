@@ -0,0 +1,726 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from modules.log import get_logger
+
+try:
+    import fcntl
+except ImportError:
+    # Brak blokad plików (Windows) - warstwa współdzielona jest wyłączona
+    fcntl = None
+
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# Warstwa cache'a współdzielona przez wszystkie workery na jednej maszynie (plik mapowany w pamięć)
+SHARED_CACHE_ENABLED = os.getenv('SHARED_CACHE_ENABLED', 'True') == 'True'
+
+
+# Rejestr wszystkich cache'y w procesie - do raportowania trafień
+_caches = []
+
+
+class TTLCache:
+    """
+    Cache w pamięci procesu z czasem życia wpisów (TTL) i wyrzucaniem najdawniej używanych (LRU)
+
+    Bezpieczny dla wątków. Każda instancja liczy trafienia i chybienia.
+    """
+
+    def __init__(self, name, max_size=1024, ttl=60, register=True):
+        """
+        Args:
+            name (str): Nazwa cache'a widoczna w statystykach
+            max_size (int): Maksymalna liczba wpisów
+            ttl (float): Domyślny czas życia wpisu w sekundach
+            register (bool): Czy raportować cache w get_cache_stats()
+        """
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if register:
+            _caches.append(self)
+
+    def get(self, key, default=None):
+        """
+        Zwraca wartość dla klucza lub default, jeśli wpisu nie ma albo wygasł
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+
+            # Oznacz jako ostatnio używany
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Zapisuje wartość, wyrzucając najdawniej używane wpisy po przekroczeniu max_size
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        """
+        Usuwa wszystkie wpisy, których klucz spełnia predicate(key)
+
+        Returns:
+            int: Liczba usuniętych wpisów
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Zwraca liczniki trafień i chybień oraz aktualny rozmiar
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class SharedMemoryCache:
+    """
+    Tablica haszująca w pliku mapowanym w pamięć, wspólna dla wszystkich procesów na maszynie
+
+    Plik ma stałą liczbę slotów o stałym rozmiarze. Klucz trafia do slotu wg skrótu
+    SHA-256 i sprawdzanych jest PROBE kolejnych slotów. Przy braku wolnego miejsca
+    nadpisywany jest slot wygasły albo najdawniej używany (przybliżone LRU).
+
+    Odczyt nie bierze żadnej blokady: każdy slot ma licznik wersji (nieparzysty
+    w trakcie zapisu) i sumę CRC32, więc odczyt w trakcie zapisu innego procesu
+    kończy się chybieniem, a nie uszkodzoną wartością. Zapisy są szeregowane
+    blokadą pliku (fcntl) i blokadą wątków. Wartości są zapisywane jako JSON;
+    za duże dla slotu są pomijane (licznik 'oversized').
+
+    Plik jest tworzony i mapowany przy pierwszym użyciu w danym procesie - import
+    (także w procesie nadrzędnym gunicorn --preload) nie dotyka dysku. Gdy pliku
+    nie da się otworzyć, cache działa dalej jako TTLCache w pamięci procesu.
+    """
+
+    MAGIC = b'QSHMC001'
+    FILE_HEADER = struct.Struct('<8sII')
+    FILE_HEADER_SIZE = 64
+    # seq, expires_at, accessed_at, length, crc32, digest klucza
+    SLOT_HEADER = struct.Struct('<QddII32s')
+    PROBE = 8
+    # Czas dostępu jest zapisywany najwyżej raz na tyle sekund - mniej zapisów do współdzielonych stron
+    TOUCH_INTERVAL = 1.0
+
+    def __init__(self, name, path, slots=4096, slot_size=8192, ttl=60, register=True):
+        """
+        Args:
+            name (str): Nazwa cache'a widoczna w statystykach
+            path (str): Ścieżka bazowa pliku; rozmiar tablicy jest częścią nazwy, więc zmiana
+                slots/slot_size tworzy nowy plik zamiast zmieniać rozmiar pliku używanego przez inne procesy
+            slots (int): Liczba slotów
+            slot_size (int): Rozmiar slotu w bajtach (nagłówek 64 B + klucz i wartość w JSON)
+            ttl (float): Domyślny czas życia wpisu w sekundach
+            register (bool): Czy raportować cache w get_cache_stats()
+        """
+        self.name = name
+        self.path = f'{path}.{slots}x{slot_size}.shm'
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.oversized = 0
+        self.available = fcntl is not None
+        self._map = None
+        self._fd = None
+        self._pid = None
+        self._write_lock = threading.Lock()
+        # Zastępstwo, gdy warstwa współdzielona jest niedostępna
+        self._fallback = TTLCache(name, max_size=slots, ttl=ttl, register=False)
+
+        if not self.available:
+            logger.warning('Shared cache %s unavailable on this platform', name)
+
+        if register:
+            _caches.append(self)
+
+    def _open(self):
+        """
+        Zwraca mapowanie pliku (otwierane przy pierwszym użyciu) albo None, gdy warstwa jest niedostępna
+        """
+        if not self.available:
+            return None
+        try:
+            return self._ensure_open()
+        except OSError as e:
+            logger.error('Error initializing shared cache %s at %s: %s', self.name, self.path, e)
+            self.available = False
+            return None
+
+    def _ensure_open(self):
+        # Mapowanie MAP_SHARED przeżywa fork, ale blokady fcntl nie - każdy proces otwiera plik sam
+        if self._pid == os.getpid():
+            return self._map
+
+        size = self.FILE_HEADER_SIZE + self.slots * self.slot_size
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size != size:
+                    os.ftruncate(fd, size)
+                shared_map = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+                if self.FILE_HEADER.unpack_from(shared_map, 0) != (self.MAGIC, self.slots, self.slot_size):
+                    # Nowy albo uszkodzony plik - wyczyść sloty
+                    shared_map[:size] = bytes(size)
+                    self.FILE_HEADER.pack_into(shared_map, 0, self.MAGIC, self.slots, self.slot_size)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+        except OSError:
+            os.close(fd)
+            raise
+
+        self._map, self._fd, self._pid = shared_map, fd, os.getpid()
+        self._write_lock = threading.Lock()
+        return shared_map
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha256(json.dumps(key, ensure_ascii=False).encode('utf-8')).digest()
+
+    def _offsets(self, digest):
+        start = int.from_bytes(digest[:8], 'little') % self.slots
+        for probe in range(min(self.PROBE, self.slots)):
+            yield self.FILE_HEADER_SIZE + ((start + probe) % self.slots) * self.slot_size
+
+    def _read_slot(self, shared_map, offset):
+        """
+        Zwraca (digest, expires_at, accessed_at, payload) albo None, gdy slot jest pusty lub w trakcie zapisu
+        """
+        seq, expires_at, accessed_at, length, crc, digest = self.SLOT_HEADER.unpack_from(shared_map, offset)
+        if seq & 1 or not length or length > self.slot_size - self.SLOT_HEADER.size:
+            return None
+
+        start = offset + self.SLOT_HEADER.size
+        payload = shared_map[start:start + length]
+        # Zmieniona wersja albo suma kontrolna - inny proces zapisywał slot w trakcie odczytu
+        if self.SLOT_HEADER.unpack_from(shared_map, offset)[0] != seq or zlib.crc32(payload) != crc:
+            return None
+        return digest, expires_at, accessed_at, payload
+
+    def _write_slot(self, shared_map, offset, digest=bytes(32), expires_at=0.0, payload=b''):
+        # Wywoływane pod blokadą zapisu. Pusty payload zwalnia slot.
+        seq = struct.unpack_from('<Q', shared_map, offset)[0]
+        # Nieparzysty licznik - czytelnicy pomijają slot do końca zapisu (nieparzysty już
+        # zostaje po procesie przerwanym w trakcie zapisu)
+        writing = seq if seq & 1 else seq + 1
+        struct.pack_into('<Q', shared_map, offset, writing)
+        start = offset + self.SLOT_HEADER.size
+        shared_map[start:start + len(payload)] = payload
+        self.SLOT_HEADER.pack_into(
+            shared_map, offset, writing, expires_at, time.time(), len(payload), zlib.crc32(payload), digest
+        )
+        struct.pack_into('<Q', shared_map, offset, writing + 1)
+
+    def _locked(self):
+        return _FileLock(self._write_lock, self._fd)
+
+    def get(self, key, default=None):
+        """
+        Zwraca wartość dla klucza lub default, jeśli wpisu nie ma albo wygasł (bez blokad)
+        """
+        shared_map = self._open()
+        if shared_map is None:
+            return self._fallback.get(key, default)
+
+        digest = self._digest(key)
+        now = time.time()
+
+        for offset in self._offsets(digest):
+            slot = self._read_slot(shared_map, offset)
+            if slot is None or slot[0] != digest:
+                continue
+            if slot[1] <= now:
+                break
+            try:
+                value = json.loads(slot[3])[1]
+            except (ValueError, IndexError):
+                break
+
+            if now - slot[2] > self.TOUCH_INTERVAL:
+                # Bez blokady - czas dostępu służy tylko do wyboru slotu do nadpisania
+                struct.pack_into('<d', shared_map, offset + 16, now)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        """
+        Zapisuje wartość w wolnym, wygasłym albo najdawniej używanym slocie spośród PROBE kandydatów
+        """
+        shared_map = self._open()
+        if shared_map is None:
+            self._fallback.set(key, value, ttl)
+            return
+
+        try:
+            payload = json.dumps([key, value], ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        except (TypeError, ValueError) as e:
+            logger.error('Error serializing shared cache %s entry: %s', self.name, e)
+            return
+        if len(payload) > self.slot_size - self.SLOT_HEADER.size:
+            self.oversized += 1
+            return
+
+        digest = self._digest(key)
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+
+        with self._locked():
+            now = time.time()
+            target, target_accessed = None, None
+            for offset in self._offsets(digest):
+                _, slot_expires, slot_accessed, length, _, slot_digest = self.SLOT_HEADER.unpack_from(shared_map, offset)
+                if slot_digest == digest:
+                    target = offset
+                    break
+                # Wolny lub wygasły slot liczy się jako najdawniej używany
+                accessed = -1.0 if not length or slot_expires <= now else slot_accessed
+                if target is None or accessed < target_accessed:
+                    target, target_accessed = offset, accessed
+
+            self._write_slot(shared_map, target, digest, expires_at, payload)
+
+    def delete(self, key):
+        shared_map = self._open()
+        if shared_map is None:
+            self._fallback.delete(key)
+            return
+
+        digest = self._digest(key)
+        with self._locked():
+            for offset in self._offsets(digest):
+                if self.SLOT_HEADER.unpack_from(shared_map, offset)[5] == digest:
+                    self._write_slot(shared_map, offset)
+
+    def delete_where(self, predicate):
+        """
+        Usuwa wszystkie wpisy, których klucz spełnia predicate(key) - przegląda całą tablicę
+
+        Przeglądanie trzyma blokadę pliku, więc nie nadaje się na ścieżkę żądań - tam
+        klucz powinien wskazywać wpis wprost (delete). Klucze będące krotkami wracają
+        z JSON jako listy i są zamieniane z powrotem na krotki.
+
+        Returns:
+            int: Liczba usuniętych wpisów
+        """
+        shared_map = self._open()
+        if shared_map is None:
+            return self._fallback.delete_where(predicate)
+
+        removed = 0
+        with self._locked():
+            for index in range(self.slots):
+                offset = self.FILE_HEADER_SIZE + index * self.slot_size
+                slot = self._read_slot(shared_map, offset)
+                if slot is None:
+                    continue
+                try:
+                    key = json.loads(slot[3])[0]
+                except (ValueError, IndexError):
+                    continue
+                if predicate(tuple(key) if isinstance(key, list) else key):
+                    self._write_slot(shared_map, offset)
+                    removed += 1
+        return removed
+
+    def clear(self):
+        shared_map = self._open()
+        if shared_map is None:
+            self._fallback.clear()
+            return
+
+        with self._locked():
+            for index in range(self.slots):
+                self._write_slot(shared_map, self.FILE_HEADER_SIZE + index * self.slot_size)
+
+    def stats(self):
+        """
+        Zwraca liczniki trafień i chybień tego procesu oraz liczbę ważnych wpisów w całej tablicy
+        """
+        shared_map = self._open()
+        if shared_map is None:
+            return {**self._fallback.stats(), 'max_size': self.slots, 'oversized': self.oversized}
+
+        size = 0
+        now = time.time()
+        for index in range(self.slots):
+            _, expires_at, _, length, _, _ = self.SLOT_HEADER.unpack_from(
+                shared_map, self.FILE_HEADER_SIZE + index * self.slot_size
+            )
+            if length and expires_at > now:
+                size += 1
+
+        lookups = self.hits + self.misses
+        return {
+            'name': self.name,
+            'size': size,
+            'max_size': self.slots,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'oversized': self.oversized
+        }
+
+
+class _FileLock:
+    """
+    Blokada wątków w procesie i blokada pliku między procesami (fcntl nie rozróżnia wątków)
+    """
+
+    def __init__(self, thread_lock, fd):
+        self.thread_lock = thread_lock
+        self.fd = fd
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        except OSError:
+            self.thread_lock.release()
+            raise
+
+    def __exit__(self, *exc_info):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+
+def shared_or_memory_cache(name, path, max_size=1024, ttl=60, slot_size=512):
+    """
+    Zwraca SharedMemoryCache (SHARED_CACHE_ENABLED) albo TTLCache, gdy warstwa współdzielona jest niedostępna
+
+    Tablica ma dwa razy więcej slotów niż max_size - przy połowie zajętych slotów
+    kolizje rzadko wyrzucają aktywne wpisy.
+    """
+    if SHARED_CACHE_ENABLED and fcntl is not None:
+        return SharedMemoryCache(name, path, slots=max_size * 2, slot_size=slot_size, ttl=ttl)
+    return TTLCache(name, max_size=max_size, ttl=ttl)
+
+
+def get_cache_stats():
+    """
+    Zwraca statystyki wszystkich cache'y utworzonych w procesie
+    """
+    return [cache.stats() for cache in _caches]
+
+
+class _InFlight:
+    """
+    Trwające wyliczenie wartości dla klucza - pozostałe wątki czekają na jego wynik
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class PersistentCache:
+    """
+    Dwupoziomowy cache: LRU w pamięci procesu + trwała warstwa na dysku (SQLite)
+
+    Wartości muszą dać się zserializować do JSON. Wpisy wygasają po ttl sekundach,
+    a gdy plik przekroczy max_bytes, usuwane są najdawniej używane wpisy.
+    get_or_compute chroni przed lawiną zapytań: równoczesne chybienia tego samego
+    klucza wywołują compute tylko raz.
+    """
+
+    # Co ile zapisów sprawdzać rozmiar warstwy dyskowej
+    EVICTION_CHECK_INTERVAL = 50
+
+    def __init__(self, name, path, ttl=86400, max_bytes=50 * 1024 * 1024, memory_size=256,
+                 shared_slots=0, shared_slot_size=8192):
+        """
+        Args:
+            name (str): Nazwa cache'a widoczna w statystykach
+            path (str): Ścieżka do pliku SQLite (None - tylko pamięć)
+            ttl (float): Czas życia wpisu w sekundach
+            max_bytes (int): Maksymalny łączny rozmiar wartości na dysku
+            memory_size (int): Liczba wpisów w warstwie pamięci
+            shared_slots (int): Liczba slotów warstwy współdzielonej między workerami (0 - bez niej)
+            shared_slot_size (int): Rozmiar slotu warstwy współdzielonej w bajtach
+        """
+        self.name = name
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory = TTLCache(name, max_size=memory_size, ttl=ttl, register=False)
+        # Warstwa pośrednia: wspólna dla workerów na maszynie, odczyt bez blokad i bez zapytania SQLite
+        self.shared = None
+        if path and shared_slots and SHARED_CACHE_ENABLED:
+            shared = SharedMemoryCache(
+                f'{name}_shared', os.path.splitext(path)[0], slots=shared_slots,
+                slot_size=shared_slot_size, ttl=ttl, register=False
+            )
+            self.shared = shared if shared.available else None
+
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._async_inflight = {}
+        _caches.append(self)
+
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            try:
+                self._connection().execute(
+                    'CREATE TABLE IF NOT EXISTS entries ('
+                    ' key TEXT PRIMARY KEY,'
+                    ' value TEXT NOT NULL,'
+                    ' size INTEGER NOT NULL,'
+                    ' expires_at REAL NOT NULL,'
+                    ' accessed_at REAL NOT NULL)'
+                )
+                self._connection().execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)')
+            except sqlite3.Error as e:
+                logger.error('Error initializing cache %s at %s: %s', name, path, e)
+                self.path = None
+
+    def _connection(self):
+        # Połączenie SQLite per wątek (po fork proces potomny otwiera własne - tabela powstaje przy imporcie,
+        # więc przy gunicorn --preload połączenie wątku głównego pochodzi z procesu nadrzędnego)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        """
+        Zwraca wartość z pamięci, z warstwy współdzielonej lub z dysku (i przenosi ją wyżej), None jeśli brak
+        """
+        value = self.memory.get(key)
+        if value is not None or not self.path:
+            return value
+
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                return value
+
+        try:
+            now = time.time()
+            row = self._connection().execute(
+                'SELECT value, expires_at FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None or row[1] <= now:
+                self.disk_misses += 1
+                return None
+
+            self._connection().execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+            self.disk_hits += 1
+            value = json.loads(row[0])
+            self.memory.set(key, value, ttl=row[1] - now)
+            if self.shared is not None:
+                self.shared.set(key, value, ttl=row[1] - now)
+            return value
+
+        except (sqlite3.Error, ValueError) as e:
+            logger.error('Error reading cache %s: %s', self.name, e)
+            return None
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if not self.path:
+            return
+
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+        try:
+            now = time.time()
+            serialized = json.dumps(value, ensure_ascii=False)
+            self._connection().execute(
+                'INSERT OR REPLACE INTO entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, serialized, len(serialized.encode('utf-8')), now + self.ttl, now)
+            )
+
+            self._writes += 1
+            if self._writes % self.EVICTION_CHECK_INTERVAL == 0:
+                self._evict()
+
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error('Error writing cache %s: %s', self.name, e)
+
+    def _evict(self):
+        """
+        Usuwa wygasłe wpisy, a następnie najdawniej używane, aż rozmiar spadnie poniżej max_bytes
+        """
+        connection = self._connection()
+        connection.execute('DELETE FROM entries WHERE expires_at <= ?', (time.time(),))
+
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        removed = 0
+        for key, size in connection.execute('SELECT key, size FROM entries ORDER BY accessed_at').fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+            removed += 1
+        logger.info('Evicted %s entries from cache %s', removed, self.name)
+
+    def get_or_compute(self, key, compute, timeout=60):
+        """
+        Zwraca wartość z cache'a albo wylicza ją przez compute() i zapamiętuje
+
+        Przy równoczesnych chybieniach compute() wywołuje tylko pierwszy wątek,
+        pozostałe czekają na jego wynik (lub wyjątek). Wynik None nie jest zapamiętywany.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._inflight_lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlight()
+                self._inflight[key] = call
+
+        if not leader:
+            if not call.event.wait(timeout):
+                raise TimeoutError(f'Timed out waiting for cache {self.name} entry')
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = compute()
+            if call.value is not None:
+                self.set(key, call.value)
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            call.event.set()
+
+    async def get_or_compute_async(self, key, compute):
+        """
+        Asynchroniczna wersja get_or_compute - compute() zwraca korutynę
+
+        Równoczesne chybienia w tej samej pętli zdarzeń czekają na jedno wywołanie compute().
+        W pętli zdarzeń sprawdzana jest tylko warstwa pamięci - odczyt i zapis warstwy
+        współdzielonej i SQLite idą do wątku z puli, żeby nie wstrzymywać innych żądań.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        future = self._async_inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_inflight[key] = future
+
+        try:
+            if self.path:
+                value = await asyncio.to_thread(self.get, key)
+            if value is None:
+                value = await compute()
+                if value is not None:
+                    await asyncio.to_thread(self.set, key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            # Oznacz wyjątek jako odebrany, nawet jeśli nikt inny nie czekał
+            future.exception()
+            raise
+        finally:
+            self._async_inflight.pop(key, None)
+            if not future.done():
+                future.cancel()
+
+    def stats(self):
+        result = {
+            **self.memory.stats(),
+            'disk_hits': self.disk_hits,
+            'disk_misses': self.disk_misses
+        }
+        if self.shared is not None:
+            result.update({'shared_hits': self.shared.hits, 'shared_misses': self.shared.misses})
+        return result
+
+
+def make_key(data):
+    """
+    Buduje klucz cache'a jako skrót SHA-256 z kanonicznej postaci JSON danych
+    """
+    serialized = data if isinstance(data, (str, bytes)) else json.dumps(data, sort_keys=True, ensure_ascii=False)
+    if isinstance(serialized, str):
+        serialized = serialized.encode('utf-8')
+    return hashlib.sha256(serialized).hexdigest()
@@ -0,0 +1,121 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+from collections import deque
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from modules.log import get_logger
+
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# Zapis odpowiedzi zewnętrznych API do debugowania - domyślnie wyłączony
+CAPTURE_ENABLED = os.getenv('CAPTURE_ENABLED', 'False') == 'True'
+CAPTURE_SAMPLE_RATE = float(os.getenv('CAPTURE_SAMPLE_RATE', '0.1'))
+CAPTURE_BUFFER_SIZE = int(os.getenv('CAPTURE_BUFFER_SIZE', '100'))
+
+# Opcjonalny rotowany plik JSONL (pusta ścieżka - tylko bufor w pamięci)
+CAPTURE_LOG_PATH = os.getenv('CAPTURE_LOG_PATH', '')
+CAPTURE_LOG_MAX_BYTES = int(os.getenv('CAPTURE_LOG_MAX_BYTES', str(5 * 1024 * 1024)))
+CAPTURE_LOG_BACKUPS = int(os.getenv('CAPTURE_LOG_BACKUPS', '3'))
+
+_buffer = deque(maxlen=CAPTURE_BUFFER_SIZE)
+_queue = queue.Queue(maxsize=1000)
+
+_writer_lock = threading.Lock()
+_writer_pid = None
+
+dropped = 0
+
+
+def record(kind, payload):
+    """
+    Zapamiętuje próbkę danych do debugowania (np. pełną odpowiedź Gemini)
+
+    Nie wykonuje żadnego I/O w wątku żądania: wpis trafia do bufora w pamięci,
+    a zapis do pliku JSONL odbywa się w wątku w tle.
+
+    Args:
+        kind (str): Rodzaj wpisu, np. 'gemini_description'
+        payload (dict): Dane do zapamiętania
+    """
+    global dropped
+
+    if not CAPTURE_ENABLED or random.random() >= CAPTURE_SAMPLE_RATE:
+        return
+
+    entry = {
+        'timestamp': datetime.now().isoformat(),
+        'kind': kind,
+        'payload': payload
+    }
+    _buffer.append(entry)
+
+    if CAPTURE_LOG_PATH:
+        _ensure_writer()
+        try:
+            _queue.put_nowait(entry)
+        except queue.Full:
+            dropped += 1
+
+
+def get_captures(limit=20, kind=None):
+    """
+    Zwraca ostatnie wpisy z bufora (najnowsze pierwsze)
+    """
+    entries = [entry for entry in reversed(_buffer) if kind is None or entry['kind'] == kind]
+    return entries[:limit]
+
+
+def get_capture_status():
+    return {
+        'enabled': CAPTURE_ENABLED,
+        'sample_rate': CAPTURE_SAMPLE_RATE,
+        'buffered': len(_buffer),
+        'buffer_size': CAPTURE_BUFFER_SIZE,
+        'log_path': CAPTURE_LOG_PATH or None,
+        'queued': _queue.qsize(),
+        'dropped': dropped
+    }
+
+
+def _ensure_writer():
+    """
+    Uruchamia wątek zapisujący przy pierwszym użyciu w danym procesie (także po fork)
+    """
+    global _writer_pid
+
+    if _writer_pid == os.getpid():
+        return
+
+    with _writer_lock:
+        if _writer_pid == os.getpid():
+            return
+        threading.Thread(target=_write_entries, daemon=True).start()
+        _writer_pid = os.getpid()
+
+
+def _write_entries():
+    os.makedirs(os.path.dirname(CAPTURE_LOG_PATH) or '.', exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(
+        CAPTURE_LOG_PATH,
+        maxBytes=CAPTURE_LOG_MAX_BYTES,
+        backupCount=CAPTURE_LOG_BACKUPS,
+        encoding='utf-8'
+    )
+
+    while True:
+        entry = _queue.get()
+        try:
+            line = json.dumps(entry, ensure_ascii=False, default=str)
+            handler.emit(logging.makeLogRecord({'msg': line}))
+        except Exception as e:
+            logger.error('Error writing capture entry: %s', e)
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from modules import upstream
+from modules.log import get_logger
+
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+TRIVIA_CATEGORIES_URL = os.getenv('TRIVIA_CATEGORIES_URL', 'https://opentdb.com/api_category.php')
+TRIVIA_COUNT_URL = os.getenv('TRIVIA_COUNT_URL', 'https://opentdb.com/api_count.php')
+LOCAL_CATEGORIES_PATH = os.getenv('LOCAL_CATEGORIES_PATH', 'static/data/local_quiz_categories.json')
+
+# Lista kategorii zmienia się rzadko - odświeżana w tle, nigdy w trakcie żądania
+CATEGORY_REFRESH_INTERVAL = float(os.getenv('CATEGORY_REFRESH_INTERVAL', str(24 * 3600)))
+# Po nieudanym odświeżeniu (np. brak sieci) kolejna próba następuje wcześniej
+CATEGORY_RETRY_INTERVAL = float(os.getenv('CATEGORY_RETRY_INTERVAL', '300'))
+# Jak długo (s) przeglądarka może używać odpowiedzi bez ponownego pytania serwera
+CATEGORY_MAX_AGE = int(os.getenv('CATEGORY_MAX_AGE', '3600'))
+CATEGORY_COUNTS_ENABLED = os.getenv('CATEGORY_COUNTS_ENABLED', 'True') == 'True'
+# Odstęp (s) między zapytaniami o liczbę pytań w kolejnych kategoriach
+CATEGORY_COUNT_INTERVAL = float(os.getenv('CATEGORY_COUNT_INTERVAL', '1'))
+
+
+class CatalogSnapshot:
+    """
+    Niezmienna wersja katalogu kategorii z gotowym body odpowiedzi i ETagiem
+    """
+
+    __slots__ = ('categories', 'body', 'etag', 'source', 'updated_at')
+
+    def __init__(self, categories, source):
+        self.categories = categories
+        self.body = json.dumps({'trivia_categories': categories}, ensure_ascii=False).encode('utf-8')
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.source = source
+        self.updated_at = time.time()
+
+
+class CategoryCatalog:
+    """
+    Katalog kategorii opentdb z liczbą pytań w każdej kategorii
+
+    Na starcie zawiera kategorie z pliku lokalnego (działa bez dostępu do
+    opentdb), a wątek w tle co CATEGORY_REFRESH_INTERVAL sekund pobiera
+    aktualną listę z api_category.php i liczby pytań z api_count.php.
+    """
+
+    def __init__(self, local_path=LOCAL_CATEGORIES_PATH):
+        self.local_path = local_path
+        self._snapshot = CatalogSnapshot(self._load_local(), 'local')
+        self._refresher_pid = None
+        self._refresher_lock = threading.Lock()
+        self.last_error = None
+
+    @property
+    def snapshot(self):
+        """
+        Bieżąca wersja katalogu (przy pierwszym użyciu w procesie uruchamia odświeżanie w tle)
+        """
+        self._ensure_refresher()
+        return self._snapshot
+
+    @property
+    def categories(self):
+        """
+        Lista kategorii z bieżącej wersji katalogu (bez uruchamiania odświeżania w tle)
+        """
+        return self._snapshot.categories
+
+    def _load_local(self):
+        try:
+            with open(self.local_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('trivia_categories', [])
+        except (OSError, ValueError) as e:
+            logger.error('Error loading local categories from %s: %s', self.local_path, e)
+            return []
+
+    def _ensure_refresher(self):
+        if self._refresher_pid == os.getpid():
+            return
+
+        with self._refresher_lock:
+            if self._refresher_pid == os.getpid():
+                return
+            threading.Thread(target=self._refresh_periodically, daemon=True).start()
+            self._refresher_pid = os.getpid()
+
+    def _refresh_periodically(self):
+        while True:
+            try:
+                self.refresh()
+                interval = CATEGORY_REFRESH_INTERVAL
+            except Exception as e:
+                # Zostaje poprzednia wersja katalogu
+                self.last_error = str(e)
+                interval = min(CATEGORY_RETRY_INTERVAL, CATEGORY_REFRESH_INTERVAL)
+                logger.error('Error refreshing category catalog: %s', e)
+            time.sleep(interval)
+
+    def refresh(self):
+        """
+        Pobiera aktualną listę kategorii i liczby pytań z opentdb
+        """
+        response = upstream.trivia.get(TRIVIA_CATEGORIES_URL)
+        response.raise_for_status()
+        categories = response.json().get('trivia_categories', [])
+        if not categories:
+            raise ValueError('Empty category list from opentdb')
+
+        if CATEGORY_COUNTS_ENABLED:
+            previous = {category['id']: category.get('question_count') for category in self._snapshot.categories}
+            categories = [
+                {**category, 'question_count': self._fetch_count(category['id']) or previous.get(category['id'])}
+                for category in categories
+            ]
+
+        snapshot = CatalogSnapshot(categories, 'opentdb')
+        if snapshot.etag != self._snapshot.etag:
+            logger.info('Category catalog refreshed: %s categories', len(categories))
+        # Podmiana całego obiektu - żądania widzą starą albo nową wersję, nigdy stan pośredni
+        self._snapshot = snapshot
+        self.last_error = None
+
+    def _fetch_count(self, category_id):
+        time.sleep(CATEGORY_COUNT_INTERVAL)
+        try:
+            response = upstream.trivia.get(TRIVIA_COUNT_URL, params={'category': category_id})
+            response.raise_for_status()
+            counts = response.json().get('category_question_count', {})
+        except Exception as e:
+            logger.error('Error fetching question count for category %s: %s', category_id, e)
+            return None
+
+        return {
+            'total': counts.get('total_question_count', 0),
+            'easy': counts.get('total_easy_question_count', 0),
+            'medium': counts.get('total_medium_question_count', 0),
+            'hard': counts.get('total_hard_question_count', 0)
+        }
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'categories': len(snapshot.categories),
+            'source': snapshot.source,
+            'etag': snapshot.etag,
+            'age_seconds': round(time.time() - snapshot.updated_at, 1),
+            'last_error': self.last_error
+        }
+
+
+catalog = CategoryCatalog()
@@ -0,0 +1,254 @@
+import atexit
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+from sortedcontainers import SortedList
+
+import database
+from modules.log import get_logger
+
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# Co ile sekund zapisywać ranking do dokumentu podsumowania (i pobierać zmiany z innych procesów)
+LEADERBOARD_CHECKPOINT_INTERVAL = float(os.getenv('LEADERBOARD_CHECKPOINT_INTERVAL', '60'))
+LEADERBOARD_MAX_LIMIT = int(os.getenv('LEADERBOARD_MAX_LIMIT', '100'))
+# Opóźnienie ponownej próby wczytania rankingu po błędzie bazy (s) - podwajane do LEADERBOARD_RETRY_MAX
+LEADERBOARD_RETRY_INTERVAL = float(os.getenv('LEADERBOARD_RETRY_INTERVAL', '5'))
+LEADERBOARD_RETRY_MAX = float(os.getenv('LEADERBOARD_RETRY_MAX', '300'))
+
+GLOBAL_BOARD = 'global'
+
+
+class Ranking:
+    """
+    Ranking zespołów jednej tablicy (globalnej lub kategorii)
+
+    Wpisy (-punkty, nazwa zespołu) są trzymane w SortedList, więc zmiana
+    punktów i miejsce zespołu to O(log n), a top N to wycinek listy - bez
+    przeglądania kolekcji zespołów.
+    """
+
+    def __init__(self, scores=None):
+        self.scores = dict(scores or {})
+        self._entries = SortedList((-points, team_name) for team_name, points in self.scores.items())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set(self, team_name, points):
+        previous = self.scores.get(team_name)
+        if previous == points:
+            return False
+
+        if previous is not None:
+            self._entries.remove((-previous, team_name))
+        self._entries.add((-points, team_name))
+        self.scores[team_name] = points
+        return True
+
+    def add(self, team_name, points):
+        return self.set(team_name, self.scores.get(team_name, 0) + points)
+
+    def raise_to(self, team_name, points):
+        """
+        Ustawia punkty tylko, jeśli są większe od zapamiętanych (punkty zespołów nie maleją)
+        """
+        if points > self.scores.get(team_name, float('-inf')):
+            return self.set(team_name, points)
+        return False
+
+    def rank(self, team_name):
+        """
+        Miejsce zespołu (1 = najwięcej punktów, równe punkty - to samo miejsce) lub None
+        """
+        points = self.scores.get(team_name)
+        if points is None:
+            return None
+        # Liczba zespołów z większą liczbą punktów
+        return self._entries.bisect_left((-points, '')) + 1
+
+    def top(self, limit):
+        result = []
+        for index, (negative_points, team_name) in enumerate(self._entries.islice(0, limit)):
+            points = -negative_points
+            # Miejsce poprzedniego zespołu przy remisie, inaczej pozycja na liście
+            if result and result[-1]['points'] == points:
+                rank = result[-1]['rank']
+            else:
+                rank = index + 1
+            result.append({'rank': rank, 'team_name': team_name, 'points': points})
+        return result
+
+
+class Leaderboard:
+    """
+    Rankingi globalny i per kategoria aktualizowane przy każdej zmianie punktów
+
+    Przy pierwszym użyciu w procesie ranking jest wczytywany z podsumowania
+    (a gdy potwierdzono, że go nie ma - budowany raz z kolekcji zespołów). Wątek
+    w tle co LEADERBOARD_CHECKPOINT_INTERVAL sekund zapisuje zmienione wpisy i
+    pobiera wpisy zmienione przez inne procesy.
+    """
+
+    def __init__(self):
+        self._boards = {}
+        self._lock = threading.Lock()
+        # Wpisy zmienione od ostatniego zapisu: {ranking: {team_name: punkty}}
+        self._changes = {}
+        self._loaded_pid = None
+        self._load_lock = threading.Lock()
+        self._synced_at = None
+        self._retry_at = 0.0
+        self._retry_delay = LEADERBOARD_RETRY_INTERVAL
+
+    def _ensure_loaded(self):
+        """
+        Wczytuje ranking i uruchamia zapis w tle przy pierwszym użyciu w danym procesie (także po fork)
+
+        Po błędzie bazy kolejna próba następuje dopiero po rosnącym opóźnieniu - do
+        tego czasu ranking zawiera tylko zmiany z tego procesu. Pełny odczyt kolekcji
+        zespołów następuje tylko, gdy baza potwierdzi, że podsumowania nie ma.
+        """
+        if self._loaded_pid == os.getpid() or time.monotonic() < self._retry_at:
+            return
+
+        with self._load_lock:
+            if self._loaded_pid == os.getpid() or time.monotonic() < self._retry_at:
+                return
+
+            started = time.time()
+            boards = database.get_leaderboard_summary()
+            rebuilt = False
+            if boards == {}:
+                # Brak podsumowania - jednorazowa budowa z kolekcji zespołów
+                boards = database.scan_team_scores()
+                rebuilt = True
+
+            if boards is None:
+                # Losowe rozłożenie ponowień - workery nie odpytują bazy jednocześnie
+                self._retry_at = time.monotonic() + random.uniform(0.5, 1) * self._retry_delay
+                self._retry_delay = min(self._retry_delay * 2, LEADERBOARD_RETRY_MAX)
+                logger.warning('Leaderboard not loaded, next attempt in %.0f s', self._retry_at - time.monotonic())
+                return
+
+            with self._lock:
+                self._merge(boards)
+                if rebuilt:
+                    # Zbudowany ranking trafi do podsumowania przy najbliższym zapisie
+                    for name, scores in boards.items():
+                        self._changes.setdefault(name, {}).update(scores)
+
+            self._synced_at = started
+            self._retry_delay = LEADERBOARD_RETRY_INTERVAL
+            threading.Thread(target=self._checkpoint_periodically, daemon=True).start()
+            self._loaded_pid = os.getpid()
+
+    def _merge(self, boards):
+        # Wywoływane z założoną blokadą _lock; punkty tylko rosną, więc wygrywa większa wartość
+        for name, scores in boards.items():
+            board = self._boards.setdefault(name, Ranking())
+            for team_name, points in scores.items():
+                board.raise_to(team_name, points)
+
+    def record_points(self, team_name, category_id, points, stats=None):
+        """
+        Aktualizuje rankingi po zapisaniu punktów (listener z database.add_points_listener)
+        """
+        self._ensure_loaded()
+        category_id = str(category_id)
+
+        with self._lock:
+            global_board = self._boards.setdefault(GLOBAL_BOARD, Ranking())
+            category_board = self._boards.setdefault(category_id, Ranking())
+
+            if stats is not None:
+                # Wartości bezwzględne z transakcji - niezależne od kolejności żądań
+                global_board.raise_to(team_name, stats.get('total_points', 0))
+                category_points = (stats.get('categories') or {}).get(category_id, {}).get('points', 0)
+                category_board.raise_to(team_name, category_points)
+            else:
+                global_board.add(team_name, points)
+                category_board.add(team_name, points)
+
+            for name, board in ((GLOBAL_BOARD, global_board), (category_id, category_board)):
+                if team_name in board.scores:
+                    self._changes.setdefault(name, {})[team_name] = board.scores[team_name]
+
+    def get(self, board=GLOBAL_BOARD, limit=10, team_name=None):
+        """
+        Zwraca top N zespołów rankingu i miejsce wskazanego zespołu
+
+        Returns:
+            dict: {'board', 'teams', 'top': [{'rank', 'team_name', 'points'}], 'me': {'rank', 'points'} | None}
+        """
+        self._ensure_loaded()
+        limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+
+        with self._lock:
+            ranking = self._boards.get(str(board)) or Ranking()
+            me = None
+            if team_name is not None and team_name in ranking.scores:
+                me = {'rank': ranking.rank(team_name), 'points': ranking.scores[team_name]}
+            return {'board': str(board), 'teams': len(ranking), 'top': ranking.top(limit), 'me': me}
+
+    def checkpoint(self):
+        """
+        Zapisuje zmienione wpisy do podsumowania i pobiera wpisy zmienione przez inne procesy
+        """
+        with self._lock:
+            changes, self._changes = self._changes, {}
+
+        if changes and database.merge_leaderboard_summary(changes) is None:
+            # Nieudany zapis - zmiany wracają do kolejki (nowsze wartości mają pierwszeństwo)
+            with self._lock:
+                for name, scores in changes.items():
+                    pending = self._changes.setdefault(name, {})
+                    for team_name, points in scores.items():
+                        pending[team_name] = max(points, pending.get(team_name, points))
+
+        # Zakładka o jeden interwał - zapisy innych procesów z czasem serwera nie umykają przez różnice zegarów
+        started = time.time()
+        since = self._synced_at - LEADERBOARD_CHECKPOINT_INTERVAL if self._synced_at else None
+        updated = database.get_leaderboard_summary(since)
+        if updated is None:
+            return
+
+        with self._lock:
+            self._merge(updated)
+        self._synced_at = started
+
+    def _checkpoint_periodically(self):
+        while True:
+            time.sleep(LEADERBOARD_CHECKPOINT_INTERVAL)
+            try:
+                self.checkpoint()
+            except Exception as e:
+                logger.error('Error checkpointing leaderboard: %s', e)
+
+    def checkpoint_on_exit(self):
+        # Tylko w procesie, który wczytał ranking i ma niezapisane zmiany
+        if self._loaded_pid == os.getpid() and self._changes:
+            self.checkpoint()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'boards': len(self._boards),
+                'teams': len(self._boards.get(GLOBAL_BOARD) or ()),
+                'dirty': bool(self._changes),
+                'pending_changes': sum(len(scores) for scores in self._changes.values())
+            }
+
+
+leaderboard = Leaderboard()
+database.add_points_listener(leaderboard.record_points)
+
+
+# Zapisz niezapisane zmiany rankingu przy zamykaniu procesu
+atexit.register(leaderboard.checkpoint_on_exit)
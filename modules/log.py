@@ -0,0 +1,125 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# Poziom logowania: DEBUG, INFO, WARNING, ERROR
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Odsetek zapisywanych komunikatów DEBUG/INFO (ostrzeżenia i błędy są zapisywane zawsze)
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+# Maksymalna liczba komunikatów czekających na zapis - nadmiarowe są odrzucane zamiast blokować żądanie
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s'
+
+_counters = {'dropped': 0, 'sampled_out': 0}
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Przepuszcza część komunikatów DEBUG/INFO (LOG_SAMPLE_RATE), ostrzeżenia i błędy zawsze
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate:
+            return True
+        _counters['sampled_out'] += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Wrzuca komunikaty do kolejki - zapis na stdout odbywa się w wątku w tle
+
+    Przy pełnej kolejce komunikat jest odrzucany (i liczony), a nie blokuje wątku
+    żądania. Wątek zapisujący startuje przy pierwszym komunikacie w danym procesie
+    (także po fork).
+    """
+
+    def __init__(self, log_queue, target):
+        super().__init__(log_queue)
+        self.target = target
+        self._listener = None
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _counters['dropped'] += 1
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+
+        with self._listener_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+
+    def stop(self):
+        # Zapisz komunikaty z kolejki przy zamykaniu procesu
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener_pid = None
+
+
+_handler = None
+_configure_lock = threading.Lock()
+
+
+def configure():
+    """
+    Podpina kolejkę komunikatów pod główny logger (raz na proces)
+
+    Logger aplikacji Flask i werkzeug korzystają z tej samej kolejki.
+    """
+    global _handler
+
+    with _configure_lock:
+        if _handler is not None:
+            return
+
+        target = logging.StreamHandler(sys.stdout)
+        target.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        _handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE), target)
+        _handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        atexit.register(_handler.stop)
+
+
+def get_logger(name):
+    """
+    Zwraca logger modułu (przy pierwszym wywołaniu konfiguruje logowanie)
+    """
+    configure()
+    return logging.getLogger(name)
+
+
+def get_log_stats():
+    return {
+        'level': LOG_LEVEL,
+        'sample_rate': LOG_SAMPLE_RATE,
+        'queued': _handler.queue.qsize() if _handler is not None else 0,
+        **_counters
+    }
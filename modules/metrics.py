@@ -0,0 +1,231 @@
+import contextvars
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from dotenv import load_dotenv
+from flask import g, request
+
+from modules import cache, log
+
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+# Token dla scrapera (nagłówek Authorization: Bearer <token>); bez niego /metrics wymaga ADMIN_TOKEN
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Granice kubełków histogramów czasu (s) - od trafień w cache do odpowiedzi Gemini
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Granice kubełków liczby operacji na bazie w jednym żądaniu
+OPERATION_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+
+class Histogram:
+    """
+    Histogram w formacie Prometheusa: kubełki skumulowane, suma i liczba obserwacji per zestaw etykiet
+    """
+
+    def __init__(self, name, help_text, labelnames, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        # Indeks pierwszego kubełka, do którego wartość należy (ostatni to +Inf)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        with self._lock:
+            series = {key: ([*counts], total, count) for key, (counts, total, count) in self._series.items()}
+
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = _labels(self.labelnames, key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames + ("le",), key + (le,))} {cumulative}')
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Counter:
+    """
+    Licznik w formacie Prometheusa per zestaw etykiet
+    """
+
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+request_duration = Histogram(
+    'quiz_request_duration_seconds', 'Czas obsługi żądania per endpoint',
+    ('endpoint', 'method', 'status'), LATENCY_BUCKETS
+)
+upstream_duration = Histogram(
+    'quiz_upstream_request_duration_seconds', 'Czas odpowiedzi zewnętrznych API (każda próba osobno)',
+    ('client', 'outcome'), LATENCY_BUCKETS
+)
+storage_operations = Counter(
+    'quiz_storage_operations_total', 'Odczyty i zapisy dokumentów w bazie', ('operation',)
+)
+storage_operations_per_request = Histogram(
+    'quiz_storage_operations_per_request', 'Odczyty i zapisy dokumentów w bazie w jednym żądaniu',
+    ('endpoint', 'operation'), OPERATION_BUCKETS
+)
+
+# Liczniki operacji na bazie bieżącego żądania (None poza żądaniem, np. w wątkach w tle)
+_request_operations = contextvars.ContextVar('request_operations', default=None)
+
+
+def count_storage(operation, amount=1):
+    """
+    Zlicza odczyty ('read') lub zapisy ('write') dokumentów - globalnie i w bieżącym żądaniu
+    """
+    storage_operations.inc(amount, operation=operation)
+    operations = _request_operations.get()
+    if operations is not None:
+        operations[operation] = operations.get(operation, 0) + amount
+
+
+def start_request():
+    """
+    Zaczyna pomiar żądania
+
+    Returns:
+        tuple: Stan pomiaru przekazywany do finish_request
+    """
+    operations = {}
+    token = _request_operations.set(operations)
+    return time.perf_counter(), operations, token
+
+
+def finish_request(state, endpoint, method, status):
+    started, operations, token = state
+    request_duration.observe(time.perf_counter() - started, endpoint=endpoint, method=method, status=status)
+    for operation in ('read', 'write'):
+        storage_operations_per_request.observe(operations.get(operation, 0), endpoint=endpoint, operation=operation)
+    try:
+        _request_operations.reset(token)
+    except ValueError:
+        # Koniec żądania w innym kontekście niż początek (np. odpowiedź strumieniowana)
+        _request_operations.set(None)
+
+
+def init_app(app):
+    """
+    Mierzy czas i operacje na bazie każdego żądania aplikacji Flask (etykieta: nazwa endpointu blueprintu)
+    """
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_state = start_request()
+
+    @app.after_request
+    def _finish_request_metrics(response):
+        state = g.pop('metrics_state', None)
+        if state is not None:
+            finish_request(state, request.endpoint or 'unmatched', request.method, response.status_code)
+        return response
+
+
+def _cache_lines():
+    stats = cache.get_cache_stats()
+    lines = []
+    for metric, key, kind, help_text in (
+        ('quiz_cache_hits_total', 'hits', 'counter', 'Trafienia w cache'),
+        ('quiz_cache_misses_total', 'misses', 'counter', 'Chybienia w cache'),
+        ('quiz_cache_hit_ratio', 'hit_ratio', 'gauge', 'Odsetek trafień w cache'),
+        ('quiz_cache_entries', 'size', 'gauge', 'Liczba wpisów w cache')
+    ):
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+        lines += [f'{metric}{_labels(("cache",), (item["name"],))} {item[key]}' for item in stats]
+
+    # Warstwa współdzielona przez workery w cache'ach dwupoziomowych (PersistentCache)
+    for metric, key, help_text in (
+        ('quiz_cache_shared_hits_total', 'shared_hits', 'Trafienia w warstwie cache współdzielonej przez workery'),
+        ('quiz_cache_shared_misses_total', 'shared_misses', 'Chybienia w warstwie cache współdzielonej przez workery')
+    ):
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+        lines += [f'{metric}{_labels(("cache",), (item["name"],))} {item[key]}' for item in stats if key in item]
+    return lines
+
+
+def is_metrics_request():
+    """
+    Sprawdza, czy bieżące żądanie ma poprawny token METRICS_TOKEN w nagłówku Authorization
+    """
+    header = request.headers.get('Authorization', '')
+    return bool(METRICS_TOKEN) and hmac.compare_digest(header, f'Bearer {METRICS_TOKEN}')
+
+
+def render():
+    """
+    Zwraca wszystkie metryki w formacie tekstowym Prometheusa
+
+    Metryki są w pamięci procesu - przy kilku workerach gunicorn każdy scrape
+    zwraca liczniki tego workera, który obsłużył żądanie (rozpoznawalnego po
+    quiz_worker_info).
+    """
+    lines = [
+        '# HELP quiz_worker_info Proces, którego metryki zawiera odpowiedź',
+        '# TYPE quiz_worker_info gauge',
+        f'quiz_worker_info{_labels(("pid",), (str(os.getpid()),))} 1'
+    ]
+    for metric in (request_duration, upstream_duration, storage_operations, storage_operations_per_request):
+        lines += metric.collect()
+    lines += _cache_lines()
+
+    log_stats = log.get_log_stats()
+    lines += [
+        '# HELP quiz_log_dropped_total Komunikaty odrzucone przy pełnej kolejce logowania',
+        '# TYPE quiz_log_dropped_total counter',
+        f"quiz_log_dropped_total {log_stats['dropped']}"
+    ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,221 @@
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+from flask import g, request
+
+from modules.log import get_logger
+
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# Profilowanie jest domyślnie wyłączone - wtedy aplikacja nie rejestruje żadnych hooków
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+# Odsetek żądań profilowanych losowo (0 - tylko żądania z nagłówkiem X-Profile)
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+# Endpointy objęte losowaniem, np. 'ai.generate_description,quiz.team_answer_stats_update' (puste - wszystkie)
+PROFILING_ENDPOINTS = {name.strip() for name in os.getenv('PROFILING_ENDPOINTS', '').split(',') if name.strip()}
+# Odstęp między próbkami stosu (ms)
+PROFILING_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', '5'))
+# Liczba ostatnich profili trzymanych w pamięci
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', '50'))
+
+PROFILE_HEADER = 'X-Profile'
+
+
+class Profile:
+    """
+    Próbki stosu wątku obsługującego jedno żądanie
+
+    Stosy są zapisywane w formacie collapsed (ramki od korzenia rozdzielone ';'),
+    który przyjmują flamegraph.pl, speedscope i inferno.
+    """
+
+    def __init__(self, profile_id, thread_id, endpoint, method, path, reason):
+        self.id = profile_id
+        self.thread_id = thread_id
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.status = None
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.samples = 0
+        self.stacks = {}
+
+    def add_sample(self, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            module = frame.f_globals.get('__name__', '?')
+            names.append(f"{module}:{getattr(code, 'co_qualname', code.co_name)}".replace(';', ','))
+            frame = frame.f_back
+        stack = ';'.join(reversed(names))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.copy().items()))
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'endpoint': self.endpoint,
+            'method': self.method,
+            'path': self.path,
+            'reason': self.reason,
+            'status': self.status,
+            'started_at': self.started_at,
+            'duration_ms': self.duration_ms,
+            'samples': self.samples
+        }
+
+
+class StackSampler:
+    """
+    Wątek w tle próbkujący stosy wątków z aktywnym profilem (zegar ścienny)
+
+    W przeciwieństwie do cProfile liczy też czas oczekiwania na Firestore,
+    Gemini i hashowanie hasła, zachowuje pełne stosy i działa przy wielu
+    równoległych profilach. Wątek śpi, gdy żaden profil nie jest aktywny.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread_pid = None
+
+    def start(self, profile):
+        with self._lock:
+            self._active[profile.thread_id] = profile
+            if self._thread_pid != os.getpid():
+                # Pierwszy profil w procesie (także po fork) - uruchom wątek
+                threading.Thread(target=self._run, name='stack-sampler', daemon=True).start()
+                self._thread_pid = os.getpid()
+        self._wakeup.set()
+
+    def stop(self, profile):
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                active = dict(self._active)
+                if not active:
+                    self._wakeup.clear()
+                    continue
+
+            frames = sys._current_frames()
+            for thread_id, profile in active.items():
+                frame = frames.get(thread_id)
+                # Profil zakończony w trakcie próbkowania - wątek obsługuje już inne żądanie
+                if frame is not None and profile.duration_ms is None:
+                    profile.add_sample(frame)
+            del frames
+            time.sleep(self.interval)
+
+
+_sampler = StackSampler(PROFILING_INTERVAL_MS / 1000)
+_profiles = deque(maxlen=PROFILING_KEEP)
+_profile_ids = itertools.count(1)
+
+
+def _profile_reason(authorize):
+    """
+    Zwraca powód profilowania bieżącego żądania albo None
+
+    Nagłówek X-Profile działa tylko dla żądań przepuszczonych przez authorize
+    (token administratora), żeby klient nie mógł spowalniać serwera profilowaniem.
+    """
+    if request.headers.get(PROFILE_HEADER) and authorize():
+        return 'header'
+
+    if PROFILING_SAMPLE_RATE > 0 and (not PROFILING_ENDPOINTS or request.endpoint in PROFILING_ENDPOINTS):
+        if random.random() < PROFILING_SAMPLE_RATE:
+            return 'sample'
+    return None
+
+
+def _finish(profile, status):
+    _sampler.stop(profile)
+    profile.status = status
+    profile.duration_ms = round((time.perf_counter() - profile.started) * 1000, 2)
+    _profiles.append(profile)
+    logger.info('Profiled %s %s: %s ms, %s samples', profile.method, profile.path, profile.duration_ms, profile.samples)
+
+
+def init_app(app, authorize):
+    """
+    Profiluje wybrane żądania aplikacji Flask (nagłówek X-Profile albo PROFILING_SAMPLE_RATE)
+
+    Args:
+        app (Flask): Aplikacja
+        authorize (callable): Zwraca True, gdy bieżące żądanie może włączyć profilowanie nagłówkiem
+    """
+    if not PROFILING_ENABLED:
+        return
+
+    @app.before_request
+    def _start_profile():
+        reason = _profile_reason(authorize)
+        if reason is None:
+            return
+
+        profile = Profile(
+            next(_profile_ids), threading.get_ident(), request.endpoint or 'unmatched',
+            request.method, request.path, reason
+        )
+        g.profile = profile
+        _sampler.start(profile)
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            _finish(profile, response.status_code)
+            response.headers['X-Profile-Id'] = str(profile.id)
+        return response
+
+    @app.teardown_request
+    def _teardown_profile(exc):
+        # Nieobsłużony wyjątek pomija after_request - profil i tak trafia do listy
+        profile = g.pop('profile', None)
+        if profile is not None:
+            _finish(profile, 500)
+
+
+def get_profiles():
+    return [profile.summary() for profile in reversed(_profiles)]
+
+
+def get_profile(profile_id):
+    for profile in _profiles:
+        if profile.id == profile_id:
+            return profile
+    return None
+
+
+def get_collapsed(endpoint=None):
+    """
+    Łączy stosy ostatnich profili (opcjonalnie jednego endpointu) w jeden flamegraph
+    """
+    stacks = {}
+    for profile in list(_profiles):
+        if endpoint and profile.endpoint != endpoint:
+            continue
+        for stack, count in profile.stacks.copy().items():
+            stacks[stack] = stacks.get(stack, 0) + count
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
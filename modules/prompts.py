@@ -0,0 +1,257 @@
+import json
+import os
+import re
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from modules.log import get_logger
+
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+PROMPTS_PATH = os.getenv('PROMPTS_PATH', 'static/data/prompts.json')
+# Jak często (s) sprawdzać, czy plik z promptami się zmienił
+PROMPTS_RELOAD_INTERVAL = float(os.getenv('PROMPTS_RELOAD_INTERVAL', '2'))
+
+# Domyślne wartości gdy nie wybrano typu promptu lub nie znaleziono go w prompts.json
+DEFAULT_SYSTEM_INSTRUCTION = (
+    "Jesteś ekspertem ds. edukacji i tworzenia treści kontekstowych.",
+    "Twoim zadaniem jest wygenerowanie 5-zdaniowego wprowadzenia do zadanego tematu pytania.",
+    "oraz 5-zdaniowego podsumowania rozwijającego kontekst prawidłowej odpowiedzi.",
+    "Dodatkowo, wygeneruj listę najciekawszych terminów, które znajdują się w treści wprowadzenia i podsumowania, dla których użytkownik może chcieć pogłębić wiedzę.",
+    "Odpowiedzi muszą być precyzyjne, edukacyjne i generowane **tylko w języku polskim**."
+)
+DEFAULT_INTRODUCTION_DESCRIPTION = "Pięciozdaniowe wprowadzenie do tematu pytania, nakreślające kontekst i znaczenie zagadnienia."
+
+CONCLUSION_DESCRIPTION = "Pięciozdaniowe rozszerzenie informacyjne na temat prawidłowej odpowiedzi, wyjaśniające jej znaczenie i kontekst."
+KEYWORDS_DESCRIPTION = "Lista kluczowych terminów, nazw własnych, definicji lub dat z tekstu wprowadzenia i podsumowania, które mogą być interesujące i moga wymagać pogłębienia wiedzy. Wygenerowane wartości muszą mieć ten sam zapis jak w wprowadzeniu i podsumowaniu."
+
+KEYWORD_DEFINITION_SYSTEM_INSTRUCTION = (
+    "Jesteś ekspertem edukacyjnym. Twoim zadaniem jest wyjaśnianie pojęć w usystematyzowany sposób podając definicje, rozwijając je oraz przywołując przykłady. "
+    "Odpowiedzi generuj **tylko w języku polskim**. "
+    "WAŻNE: Jeśli wyjaśnienie jest w kontekście pytania quizowego, NIE MOŻESZ w żaden sposób sugerować ani zdradzać prawidłowej odpowiedzi. "
+    "Skup się na ogólnym wyjaśnieniu terminu bez wskazywania konkretnych odpowiedzi."
+)
+
+# Znaczniki miejsc, w które wstawiane są dane żądania
+_USER_TEXT_SLOT = '__PROMPT_USER_TEXT__'
+_TEMPERATURE_SLOT = '__PROMPT_TEMPERATURE__'
+_SLOT_PATTERN = re.compile('"(%s|%s)"' % (_USER_TEXT_SLOT, _TEMPERATURE_SLOT))
+
+
+class CompiledPrompt:
+    """
+    Niezmienny, wstępnie zserializowany szablon body żądania do Gemini
+
+    Przy żądaniu wstawiane są tylko tekst użytkownika i temperatura - reszta
+    (systemInstruction, responseSchema) jest gotowym fragmentem JSON.
+    """
+
+    __slots__ = ('id', 'name', '_fragments', '_slots')
+
+    def __init__(self, prompt_id, name, request_template):
+        serialized = json.dumps(request_template, ensure_ascii=False, separators=(',', ':'))
+        pieces = _SLOT_PATTERN.split(serialized)
+
+        object.__setattr__(self, 'id', prompt_id)
+        object.__setattr__(self, 'name', name)
+        # split z grupą zwraca naprzemiennie fragmenty i nazwy znaczników
+        object.__setattr__(self, '_fragments', tuple(pieces[0::2]))
+        object.__setattr__(self, '_slots', tuple(pieces[1::2]))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CompiledPrompt is immutable')
+
+    def render(self, user_text, temperature):
+        """
+        Zwraca body żądania (JSON) z wstawionym tekstem użytkownika i temperaturą
+        """
+        values = {
+            _USER_TEXT_SLOT: json.dumps(user_text, ensure_ascii=False),
+            # Zaokrąglenie do 0.1 - temperatura jest częścią klucza cache'a
+            _TEMPERATURE_SLOT: json.dumps(round(float(temperature), 1))
+        }
+
+        parts = [self._fragments[0]]
+        for slot, fragment in zip(self._slots, self._fragments[1:]):
+            parts.append(values[slot])
+            parts.append(fragment)
+        return ''.join(parts)
+
+
+def _request_template(system_parts, generation_config):
+    return {
+        "contents": [
+            {
+                "role": "user",
+                "parts": [{"text": _USER_TEXT_SLOT}]
+            }
+        ],
+        "systemInstruction": {
+            "parts": [{"text": text} for text in system_parts]
+        },
+        "generationConfig": {
+            "temperature": _TEMPERATURE_SLOT,
+            **generation_config
+        }
+    }
+
+
+def compile_description_prompt(prompt_id, name, system_parts, introduction_description):
+    """
+    Kompiluje prompt opisu pytania (wprowadzenie, podsumowanie, słowa kluczowe)
+    """
+    return CompiledPrompt(prompt_id, name, _request_template(system_parts, {
+        "responseMimeType": "application/json",
+        "responseSchema": {
+            "type": "object",
+            "properties": {
+                "wprowadzenie": {
+                    "type": "string",
+                    "description": introduction_description
+                },
+                "podsumowanie": {
+                    "type": "string",
+                    "description": CONCLUSION_DESCRIPTION
+                },
+                "słowa_kluczowe": {
+                    "type": "array",
+                    "description": KEYWORDS_DESCRIPTION,
+                    "items": {
+                        "type": "string"
+                    }
+                }
+            },
+            "required": ["wprowadzenie", "podsumowanie", "słowa_kluczowe"],
+            # Wprowadzenie jako pierwsze pole - przy strumieniowaniu trafia do przeglądarki najwcześniej
+            "propertyOrdering": ["wprowadzenie", "podsumowanie", "słowa_kluczowe"]
+        }
+    }))
+
+
+DEFAULT_DESCRIPTION_PROMPT = compile_description_prompt(
+    'default', 'Default', DEFAULT_SYSTEM_INSTRUCTION, DEFAULT_INTRODUCTION_DESCRIPTION
+)
+
+KEYWORD_DEFINITION_PROMPT = CompiledPrompt(
+    'keyword_definition',
+    'Keyword Definition',
+    _request_template((KEYWORD_DEFINITION_SYSTEM_INSTRUCTION,), {"responseMimeType": "text/plain"})
+)
+
+KEYWORD_DEFINITIONS_BATCH_PROMPT = CompiledPrompt(
+    'keyword_definitions_batch',
+    'Keyword Definitions Batch',
+    _request_template((KEYWORD_DEFINITION_SYSTEM_INSTRUCTION,), {
+        "responseMimeType": "application/json",
+        "responseSchema": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "termin": {
+                        "type": "string",
+                        "description": "Termin dokładnie w takim zapisie, w jakim został podany."
+                    },
+                    "definicja": {
+                        "type": "string",
+                        "description": "Wyjaśnienie terminu w 3-4 zdaniach."
+                    }
+                },
+                "required": ["termin", "definicja"]
+            }
+        }
+    })
+)
+
+
+class PromptRegistry:
+    """
+    Rejestr promptów z prompts.json skompilowanych do CompiledPrompt
+
+    Plik jest wczytywany raz i ponownie tylko po zmianie (sprawdzanej co
+    PROMPTS_RELOAD_INTERVAL sekund), więc zmiany promptów nie wymagają restartu.
+    """
+
+    def __init__(self, path=PROMPTS_PATH):
+        self.path = path
+        self._prompts = {}
+        self._listing = ()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._reload_if_changed(force=True)
+
+    def get_description_prompt(self, prompt_id):
+        """
+        Zwraca skompilowany prompt opisu lub domyślny, jeśli prompt_id jest pusty albo nieznany
+        """
+        self._reload_if_changed()
+        return self._prompts.get(prompt_id, DEFAULT_DESCRIPTION_PROMPT)
+
+    def list_prompts(self):
+        """
+        Zwraca listę promptów do wyboru w interfejsie: ({'id', 'name'}, ...)
+        """
+        self._reload_if_changed()
+        return self._listing
+
+    def _reload_if_changed(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < PROMPTS_RELOAD_INTERVAL:
+            return
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                if force:
+                    logger.info('%s file not found', self.path)
+                return
+
+            if mtime == self._mtime:
+                return
+
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    prompts_data = json.load(f)
+                prompts, listing = self._compile(prompts_data.get('introduction_prompts', []))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Zostaw poprzednią wersję promptów
+                logger.error('Error loading prompts from %s: %s', self.path, e)
+                return
+
+            # Podmiana całych struktur - czytelnicy nie widzą stanu pośredniego
+            self._prompts = prompts
+            self._listing = listing
+            self._mtime = mtime
+            logger.info('Loaded %s prompts from %s', len(prompts), self.path)
+
+    @staticmethod
+    def _compile(introduction_prompts):
+        prompts = {}
+        listing = []
+
+        for prompt in introduction_prompts:
+            # Wydobądź wartości 'text' z zagnieżdżonych obiektów (role, descriptionTask, etc.)
+            system_instruction = prompt['modality']['systemInstruction']
+            system_parts = [
+                value['text'] for value in system_instruction.values()
+                if isinstance(value, dict) and 'text' in value
+            ]
+            introduction_description = prompt['modality']['generationConfig']['introduction']['description']
+
+            prompts[prompt['id']] = compile_description_prompt(
+                prompt['id'], prompt.get('name', prompt['id']), system_parts, introduction_description
+            )
+            listing.append({'id': prompt['id'], 'name': prompt.get('name', prompt['id'])})
+
+        return prompts, tuple(listing)
+
+
+prompt_registry = PromptRegistry()
@@ -0,0 +1,409 @@
+import hashlib
+import html
+import json
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from array import array
+
+import click
+import requests
+from dotenv import load_dotenv
+from flask.cli import AppGroup
+
+from modules import categories, question_pool, seen_questions
+from modules.cache import TTLCache
+from modules.log import get_logger
+
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# Lokalny bank pytań importowanych z opentdb (flask question-bank ingest)
+QUESTION_BANK_PATH = os.getenv('QUESTION_BANK_PATH', os.path.join('data', 'question_bank.sqlite3'))
+# fallback - bank tylko gdy opentdb nie odpowiada, primary - najpierw bank, off - tylko opentdb
+QUESTION_BANK_MODE = os.getenv('QUESTION_BANK_MODE', 'fallback')
+# Co ile sekund ponownie wczytywać listy pytań (np. po imporcie w innym procesie)
+QUESTION_BANK_RELOAD_INTERVAL = float(os.getenv('QUESTION_BANK_RELOAD_INTERVAL', '300'))
+# Po ilu sekundach bez losowania kursor zespołu jest usuwany (zespół zaczyna nową permutację)
+QUESTION_BANK_CURSOR_TTL = float(os.getenv('QUESTION_BANK_CURSOR_TTL', str(24 * 3600)))
+# Co ile zapisów kursorów usuwać przeterminowane
+CURSOR_PRUNE_INTERVAL = 1000
+# Ile razy dobierać pytania, gdy zespół widział już wydane
+QUESTION_BANK_SEEN_REFILLS = int(os.getenv('QUESTION_BANK_SEEN_REFILLS', '2'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    category_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    type TEXT NOT NULL,
+    question TEXT NOT NULL,
+    correct_answer TEXT NOT NULL,
+    incorrect_answers TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS questions_filter ON questions (category_id, difficulty, type);
+CREATE INDEX IF NOT EXISTS questions_difficulty_type ON questions (difficulty, type);
+CREATE TABLE IF NOT EXISTS cursors (
+    team_name TEXT NOT NULL,
+    filter_key TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    a INTEGER NOT NULL,
+    c INTEGER NOT NULL,
+    i INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (team_name, filter_key)
+);
+CREATE INDEX IF NOT EXISTS cursors_updated ON cursors (updated_at);
+'''
+
+
+def question_hash(question, correct_answer):
+    """
+    Klucz deduplikacji: treść pytania i prawidłowa odpowiedź bez wielkości liter i nadmiarowych spacji
+    """
+    normalized = ' '.join(f'{question}\n{correct_answer}'.casefold().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def _permutation(n):
+    """
+    Losuje permutację afiniczną i -> (a * i + c) mod n (a względnie pierwsze z n)
+
+    Stan permutacji to trzy liczby, a kolejny element wylicza się w O(1).
+    """
+    a = 1
+    if n > 2:
+        a = random.randrange(1, n)
+        while math.gcd(a, n) != 1:
+            a = random.randrange(1, n)
+    return [n, a, random.randrange(n), 0]
+
+
+class BankQuestion(dict):
+    """
+    Pytanie z lokalnego banku - odróżnia je od pytań z opentdb, które mogą wrócić do bufora
+    """
+
+
+class QuestionBank:
+    """
+    Pytania w SQLite z indeksem po (kategoria, trudność, typ)
+
+    Identyfikatory pytań pasujących do filtra są trzymane w pamięci w stałej
+    kolejności (po id). Każdy zespół przechodzi po nich własną permutacją, więc
+    nie dostaje tego samego pytania, dopóki nie zobaczy wszystkich z danego filtra.
+
+    Kursory permutacji są zapisywane w pliku banku, więc są wspólne dla workerów
+    na maszynie i przeżywają restart. Przy kilku maszynach każda ma własne kursory -
+    powtórki między nimi odfiltrowuje seen_questions.
+    """
+
+    def __init__(self, path=QUESTION_BANK_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._ids = TTLCache('question_bank_ids', max_size=512, ttl=QUESTION_BANK_RELOAD_INTERVAL)
+        self._cursor_writes = 0
+
+    def _connection(self, create=False):
+        # Połączenie SQLite per wątek (po fork proces potomny otwiera własne)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            if not create and not os.path.exists(self.path):
+                return None
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _filter_ids(self, category, difficulty, question_type):
+        key = (str(category), difficulty, question_type)
+        ids = self._ids.get(key)
+        if ids is not None:
+            return ids
+
+        connection = self._connection()
+        if connection is None:
+            return array('q')
+
+        conditions, params = [], []
+        if category:
+            conditions.append('category_id = ?')
+            params.append(int(category))
+        if difficulty:
+            conditions.append('difficulty = ?')
+            params.append(difficulty)
+        if question_type:
+            conditions.append('type = ?')
+            params.append(question_type)
+
+        query = 'SELECT id FROM questions'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        # Stała kolejność - kursor zespołu wskazuje te same pytania także po ponownym wczytaniu listy
+        query += ' ORDER BY id'
+
+        ids = array('q', (row[0] for row in connection.execute(query, params)))
+        self._ids.set(key, ids)
+        return ids
+
+    def _next_positions(self, team_name, key, n, amount):
+        """
+        Przesuwa kursor zespołu o amount pozycji (odczyt i zapis w jednej transakcji zapisu)
+        """
+        filter_key = '|'.join(key)
+        positions = []
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT n, a, c, i FROM cursors WHERE team_name = ? AND filter_key = ? AND updated_at > ?',
+                (team_name, filter_key, time.time() - QUESTION_BANK_CURSOR_TTL)
+            ).fetchone()
+            cursor = list(row) if row is not None else None
+            # Nowa permutacja dla nowego zespołu, po zmianie liczby pytań albo po przejściu wszystkich
+            if cursor is None or cursor[0] != n:
+                cursor = _permutation(n)
+
+            for _ in range(min(amount, n)):
+                if cursor[3] >= n:
+                    cursor = _permutation(n)
+                _, a, c, i = cursor
+                positions.append((a * i + c) % n)
+                cursor[3] += 1
+
+            connection.execute(
+                'INSERT OR REPLACE INTO cursors (team_name, filter_key, n, a, c, i, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (team_name, filter_key, *cursor, time.time())
+            )
+            self._cursor_writes += 1
+            if self._cursor_writes % CURSOR_PRUNE_INTERVAL == 0:
+                connection.execute('DELETE FROM cursors WHERE updated_at <= ?', (time.time() - QUESTION_BANK_CURSOR_TTL,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return positions
+
+    def sample(self, team_name, amount=1, category='', difficulty='', question_type=''):
+        """
+        Losuje pytania z banku bez powtórzeń dla zespołu
+
+        Returns:
+            list: Lista BankQuestion w formacie opentdb, z encjami HTML (pusta, jeśli bank nie ma pytań dla filtra)
+        """
+        try:
+            ids = self._filter_ids(category, difficulty, question_type)
+            if not ids:
+                return []
+
+            key = (str(category), difficulty, question_type)
+            positions = self._next_positions(team_name or '', key, len(ids), amount)
+
+            connection = self._connection()
+            questions = []
+            for position in positions:
+                row = connection.execute(
+                    'SELECT category, difficulty, type, question, correct_answer, incorrect_answers '
+                    'FROM questions WHERE id = ?',
+                    (ids[position],)
+                ).fetchone()
+                if row is not None:
+                    # Bank trzyma zdekodowany tekst - wydawany jest z encjami HTML, tak jak pytania z opentdb
+                    questions.append(BankQuestion({
+                        'type': row[2],
+                        'difficulty': row[1],
+                        'category': html.escape(row[0]),
+                        'question': html.escape(row[3]),
+                        'correct_answer': html.escape(row[4]),
+                        'incorrect_answers': [html.escape(answer) for answer in json.loads(row[5])]
+                    }))
+            return questions
+        except (sqlite3.Error, ValueError) as e:
+            logger.error('Error sampling question bank: %s', e)
+            return []
+
+    def add(self, category_id, questions):
+        """
+        Dodaje pytania w formacie opentdb (po zdekodowaniu encji HTML), pomijając duplikaty
+
+        Returns:
+            int: Liczba nowych pytań
+        """
+        rows = []
+        for question in questions:
+            text = html.unescape(question['question'])
+            correct_answer = html.unescape(question['correct_answer'])
+            rows.append((
+                question_hash(text, correct_answer),
+                int(category_id),
+                html.unescape(question['category']),
+                question['difficulty'],
+                question['type'],
+                text,
+                correct_answer,
+                json.dumps([html.unescape(answer) for answer in question['incorrect_answers']], ensure_ascii=False)
+            ))
+
+        connection = self._connection(create=True)
+        before = connection.total_changes
+        connection.execute('BEGIN')
+        try:
+            connection.executemany(
+                'INSERT OR IGNORE INTO questions '
+                '(hash, category_id, category, difficulty, type, question, correct_answer, incorrect_answers) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            # Bez wycofania połączenie wątku zostałoby w otwartej transakcji
+            connection.execute('ROLLBACK')
+            raise
+        self._ids.clear()
+        return connection.total_changes - before
+
+    def stats(self):
+        connection = self._connection()
+        if connection is None:
+            return {'path': self.path, 'questions': 0, 'categories': {}}
+
+        counts = dict(connection.execute(
+            'SELECT category_id, COUNT(*) FROM questions GROUP BY category_id'
+        ).fetchall())
+        return {'path': self.path, 'questions': sum(counts.values()), 'categories': counts}
+
+
+bank = QuestionBank()
+
+
+def get_questions(team_name, amount=1, category='', difficulty='', question_type='', mark=True):
+    """
+    Wydaje pytania, których zespół jeszcze nie widział
+
+    Pytania z opentdb widziane przez zespół wracają do bufora dla innych zespołów. Powtórki
+    są wydawane tylko wtedy, gdy po QUESTION_BANK_SEEN_REFILLS próbach zabraknie nowych pytań.
+    Z mark=False pytania nie są oznaczane jako widziane - wywołujący oznacza je
+    (seen_questions.mark_seen) dopiero, gdy trafią do gracza.
+
+    Returns:
+        list: Lista pytań w formacie opentdb
+    """
+    questions = _get_questions(team_name, amount, category, difficulty, question_type)
+    if not team_name:
+        return questions
+
+    served, repeats = seen_questions.split_seen(team_name, questions)
+    for _ in range(QUESTION_BANK_SEEN_REFILLS):
+        if len(served) >= amount:
+            break
+        more = _get_questions(team_name, amount - len(served), category, difficulty, question_type)
+        if not more:
+            break
+        unseen, seen = seen_questions.split_seen(team_name, more)
+        served += unseen
+        repeats += seen
+
+    missing = max(0, amount - len(served))
+    served += repeats[:missing]
+    return_questions(repeats[missing:], category, difficulty, question_type)
+
+    if mark:
+        seen_questions.mark_seen(team_name, served)
+    return served
+
+
+def return_questions(questions, category='', difficulty='', question_type=''):
+    """
+    Oddaje do bufora opentdb niewydane pytania z opentdb
+
+    Pytania z banku są pomijane - inne zespoły dostaną je z banku własną permutacją.
+    """
+    question_pool.return_questions(
+        [question for question in questions if not isinstance(question, BankQuestion)],
+        category, difficulty, question_type
+    )
+
+
+def _get_questions(team_name, amount, category, difficulty, question_type):
+    """
+    Pobiera pytania z bufora opentdb lub z lokalnego banku, zależnie od QUESTION_BANK_MODE
+    """
+    if QUESTION_BANK_MODE == 'primary':
+        questions = bank.sample(team_name, amount, category, difficulty, question_type)
+        if len(questions) < amount:
+            questions += question_pool.get_questions(amount - len(questions), category, difficulty, question_type)
+        return questions
+
+    if QUESTION_BANK_MODE != 'fallback':
+        return question_pool.get_questions(amount, category, difficulty, question_type)
+
+    # Pusty bufor - uzupełnianie rusza w tle, a braki pokrywa bank; na opentdb czekamy
+    # tylko wtedy, gdy bank nie ma pytań dla tych parametrów
+    questions = question_pool.get_questions(amount, category, difficulty, question_type, wait=False)
+    if len(questions) < amount:
+        questions += bank.sample(team_name, amount - len(questions), category, difficulty, question_type)
+    if len(questions) < amount:
+        try:
+            questions += question_pool.get_questions(amount - len(questions), category, difficulty, question_type)
+        except (question_pool.TriviaError, requests.exceptions.RequestException) as e:
+            logger.warning('opentdb unavailable and bank has no questions for %s: %s', (category, difficulty, question_type), e)
+    return questions
+
+
+# Komendy CLI: flask question-bank ingest / flask question-bank stats
+cli = AppGroup('question-bank', help='Lokalny bank pytań z opentdb')
+
+
+@cli.command('ingest')
+@click.option('--category', 'category_ids', multiple=True, type=int,
+              help='Id kategorii opentdb (domyślnie wszystkie)')
+@click.option('--limit', default=0, type=int, help='Maksymalna liczba pobranych pytań na kategorię (0 - wszystkie)')
+def ingest_command(category_ids, limit):
+    """
+    Pobiera pytania z opentdb do lokalnego banku
+    """
+    if not category_ids:
+        try:
+            categories.catalog.refresh()
+        except Exception as e:
+            print(f'Using local category list: {str(e)}')
+        category_ids = [category['id'] for category in categories.catalog.categories]
+
+    # Własny token - opentdb nie zwróci tego samego pytania dwa razy, a pusty wynik oznacza koniec kategorii
+    token = question_pool.request_token()
+
+    for category_id in category_ids:
+        fetched = added = 0
+        while not limit or fetched < limit:
+            amount = question_pool.QUESTION_POOL_BATCH_SIZE
+            if limit:
+                amount = min(amount, limit - fetched)
+
+            questions = question_pool.fetch_questions(amount, category_id, token=token, retry_rate_limit=True)
+            if not questions:
+                break
+            fetched += len(questions)
+            added += bank.add(category_id, questions)
+
+        print(f'Category {category_id}: fetched {fetched} questions, {added} new')
+
+    print(f"Question bank has {bank.stats()['questions']} questions")
+
+
+@cli.command('stats')
+def stats_command():
+    """
+    Wyświetla liczbę pytań w banku per kategoria
+    """
+    print(json.dumps(bank.stats(), indent=2))
@@ -0,0 +1,394 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from dotenv import load_dotenv
+
+from modules import categories, upstream
+from modules.log import get_logger
+
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+TRIVIA_API_URL = os.getenv('TRIVIA_API_URL', 'https://opentdb.com/api.php')
+TRIVIA_TOKEN_URL = os.getenv('TRIVIA_TOKEN_URL', 'https://opentdb.com/api_token.php')
+
+# Konfiguracja bufora pytań
+QUESTION_POOL_ENABLED = os.getenv('QUESTION_POOL_ENABLED', 'True') == 'True'
+QUESTION_POOL_BATCH_SIZE = int(os.getenv('QUESTION_POOL_BATCH_SIZE', '50'))  # opentdb zwraca maks. 50 pytań
+QUESTION_POOL_LOW_WATER = int(os.getenv('QUESTION_POOL_LOW_WATER', '10'))
+# Maksymalna liczba buforów (zestawów parametrów) w pamięci - najdawniej używane są usuwane
+QUESTION_POOL_MAX_POOLS = int(os.getenv('QUESTION_POOL_MAX_POOLS', '64'))
+# Jak długo (s) żądanie czeka na uzupełnienie pustego bufora w tle
+QUESTION_POOL_WAIT_TIMEOUT = float(os.getenv('QUESTION_POOL_WAIT_TIMEOUT', '10'))
+
+# Dozwolone wartości parametrów opentdb (pusty napis - dowolna)
+DIFFICULTIES = {'', 'easy', 'medium', 'hard'}
+QUESTION_TYPES = {'', 'multiple', 'boolean'}
+# Identyfikatory kategorii opentdb - lokalny katalog kategorii zawiera tylko część z nich
+TRIVIA_CATEGORY_IDS = {str(category_id) for category_id in range(9, 33)}
+
+# opentdb pozwala na jedno zapytanie co 5 sekund z jednego IP
+TRIVIA_MIN_INTERVAL = float(os.getenv('TRIVIA_MIN_INTERVAL', '5'))
+TRIVIA_MAX_ATTEMPTS = 5
+
+# Kody odpowiedzi opentdb
+RESPONSE_SUCCESS = 0
+RESPONSE_NO_RESULTS = 1
+RESPONSE_INVALID_PARAMETER = 2
+RESPONSE_TOKEN_NOT_FOUND = 3
+RESPONSE_TOKEN_EMPTY = 4
+RESPONSE_RATE_LIMIT = 5
+
+
+class TriviaError(Exception):
+    """
+    Błąd zwrócony przez opentdb (niezerowy response_code, którego nie da się obsłużyć)
+    """
+
+
+class TriviaRateLimited(TriviaError):
+    """
+    opentdb odrzuciło zapytanie z powodu limitu zapytań (response_code 5)
+    """
+
+
+class InvalidQuestionParameters(ValueError):
+    """
+    Kategoria, trudność albo typ pytań spoza listy dozwolonych wartości
+    """
+
+
+_rate_limit_lock = threading.Lock()
+_last_trivia_call = 0.0
+_rate_limited_until = 0.0
+
+
+def _wait_for_rate_limit():
+    """
+    Czeka, aż minie TRIVIA_MIN_INTERVAL od poprzedniego zapytania do opentdb
+
+    Pod blokadą jest tylko rezerwacja terminu - czekanie odbywa się po jej
+    zwolnieniu, więc kolejne wątki od razu dostają swoje (późniejsze) terminy.
+    """
+    global _last_trivia_call
+    with _rate_limit_lock:
+        now = time.monotonic()
+        slot = max(now, _last_trivia_call + TRIVIA_MIN_INTERVAL, _rate_limited_until)
+        _last_trivia_call = slot
+    if slot > now:
+        time.sleep(slot - now)
+
+
+def _note_rate_limit():
+    global _rate_limited_until
+    with _rate_limit_lock:
+        _rate_limited_until = time.monotonic() + TRIVIA_MIN_INTERVAL
+
+
+def is_rate_limited():
+    """
+    Czy opentdb odrzuciło ostatnio zapytanie z powodu limitu (przez TRIVIA_MIN_INTERVAL sekund)
+    """
+    return time.monotonic() < _rate_limited_until
+
+
+def request_token():
+    """
+    Pobiera nowy token sesji opentdb
+    """
+    response = upstream.trivia.get(TRIVIA_TOKEN_URL, params={'command': 'request'})
+    response.raise_for_status()
+    return response.json().get('token')
+
+
+class SessionToken:
+    """
+    Token sesji opentdb jednego bufora - dopóki jest ważny, opentdb nie zwraca tych samych pytań ponownie
+
+    Każdy bufor (zestaw parametrów) ma własny token, więc wyczerpanie pytań
+    w jednej kategorii resetuje token tylko tej kategorii.
+    """
+
+    def __init__(self):
+        self._token = None
+        self._lock = threading.Lock()
+
+    def get(self, refresh=False):
+        with self._lock:
+            if self._token is None or refresh:
+                self._token = request_token()
+                logger.info('Requested new opentdb session token')
+            return self._token
+
+
+def reset_session_token(token):
+    """
+    Resetuje wyczerpany token - opentdb zacznie zwracać pytania od nowa
+    """
+    response = upstream.trivia.get(TRIVIA_TOKEN_URL, params={'command': 'reset', 'token': token})
+    response.raise_for_status()
+    logger.info('Reset exhausted opentdb session token')
+
+
+def fetch_questions(amount, category='', difficulty='', question_type='', token=None, session_token=None,
+                    retry_rate_limit=False):
+    """
+    Pobiera pytania z opentdb z użyciem tokena sesji (session_token albo własnego token)
+
+    Obsługuje kody odpowiedzi opentdb: przy braku wystarczającej liczby pytań
+    zmniejsza amount, przy nieważnym lub wyczerpanym tokenie pobiera/resetuje token.
+    Limit zapytań kończy pobieranie wyjątkiem TriviaRateLimited, chyba że
+    retry_rate_limit=True (import z CLI) - wtedy pobieranie czeka i ponawia.
+
+    Z własnym tokenem (token) wyczerpanie pytań kończy pobieranie pustą listą
+    zamiast resetu - tak import do banku pytań wie, że pobrał całą kategorię.
+
+    Returns:
+        list: Lista pytań (może być pusta, jeśli opentdb nie ma pytań dla tych parametrów)
+    """
+    params = {'amount': amount}
+    if category:
+        params['category'] = category
+    if difficulty:
+        params['difficulty'] = difficulty
+    if question_type:
+        params['type'] = question_type
+
+    token_refreshed = False
+
+    for _ in range(TRIVIA_MAX_ATTEMPTS):
+        params['token'] = token or session_token.get()
+
+        _wait_for_rate_limit()
+        response = upstream.trivia.get(TRIVIA_API_URL, params=params)
+        response.raise_for_status()
+        data = response.json()
+        response_code = data.get('response_code', RESPONSE_SUCCESS)
+
+        if response_code == RESPONSE_SUCCESS:
+            return data.get('results', [])
+
+        if response_code == RESPONSE_NO_RESULTS:
+            # Za mało pytań dla tego zestawu parametrów - spróbuj mniejszej paczki
+            if params['amount'] <= 1:
+                return []
+            params['amount'] = max(1, params['amount'] // 2)
+
+        elif response_code == RESPONSE_TOKEN_NOT_FOUND:
+            if token:
+                raise TriviaError('opentdb session token not found')
+            session_token.get(refresh=True)
+
+        elif response_code == RESPONSE_TOKEN_EMPTY:
+            # Wszystkie pytania dla tych parametrów zostały już zwrócone
+            if token or token_refreshed:
+                return []
+            reset_session_token(params['token'])
+            token_refreshed = True
+
+        elif response_code == RESPONSE_RATE_LIMIT:
+            _note_rate_limit()
+            if not retry_rate_limit:
+                raise TriviaRateLimited(f'opentdb rate limit for {params}')
+
+        else:
+            raise TriviaError(f'opentdb returned response_code {response_code} for {params}')
+
+    raise TriviaError(f'opentdb did not return questions after {TRIVIA_MAX_ATTEMPTS} attempts')
+
+
+class QuestionPool:
+    """
+    Bufor pytań dla jednego zestawu (kategoria, trudność, typ)
+
+    Pytania są pobierane paczkami po QUESTION_POOL_BATCH_SIZE i wydawane z pamięci.
+    Gdy w buforze zostaje mniej niż QUESTION_POOL_LOW_WATER pytań, uzupełnianie
+    rusza w tle. Pobiera z opentdb tylko wątek w tle - żądanie z pustym buforem
+    najwyżej czeka na jego wynik.
+    """
+
+    def __init__(self, category='', difficulty='', question_type=''):
+        self.category = category
+        self.difficulty = difficulty
+        self.question_type = question_type
+
+        self._questions = deque()
+        self._session_token = SessionToken()
+        self._fill_lock = threading.Lock()
+        self._refilling = False
+        self._refill_flag_lock = threading.Lock()
+        # Powiadamiany po każdej próbie uzupełnienia; _last_error - błąd ostatniej próby
+        self._filled = threading.Condition()
+        self._fills = 0
+        self._last_error = None
+
+    def __len__(self):
+        return len(self._questions)
+
+    def take(self, amount=1, wait=True):
+        """
+        Zwraca do amount pytań z bufora
+
+        Brakujące pytania pobiera uzupełnianie w tle. Z wait=False zwracane jest od
+        razu to, co jest w buforze; z wait=True żądanie czeka na wynik uzupełniania
+        (najwyżej QUESTION_POOL_WAIT_TIMEOUT sekund).
+
+        Raises:
+            TriviaError: Gdy bufor był pusty, a uzupełnianie się nie powiodło
+        """
+        with self._filled:
+            fills = self._fills
+        questions = self._pop(amount)
+        if len(questions) >= amount:
+            self._schedule_refill()
+            return questions
+
+        self._schedule_refill(force=True)
+        if not wait:
+            return questions
+
+        with self._filled:
+            self._filled.wait_for(lambda: self._fills != fills, timeout=QUESTION_POOL_WAIT_TIMEOUT)
+            error = self._last_error
+        questions += self._pop(amount - len(questions))
+
+        if not questions:
+            if error is not None:
+                raise error
+            raise TriviaError(f'Question pool {self.key} was not refilled in time')
+        return questions
+
+    def is_filling(self):
+        return self._refilling
+
+    def give_back(self, questions):
+        """
+        Zwraca niewykorzystane pytania na początek bufora
+        """
+        self._questions.extendleft(reversed(questions))
+
+    def _pop(self, amount):
+        questions = []
+        while len(questions) < amount:
+            try:
+                questions.append(self._questions.popleft())
+            except IndexError:
+                break
+        return questions
+
+    def _fill(self):
+        questions = fetch_questions(
+            QUESTION_POOL_BATCH_SIZE, self.category, self.difficulty, self.question_type,
+            session_token=self._session_token
+        )
+        self._questions.extend(questions)
+        logger.info('Question pool %s refilled with %s questions', self.key, len(questions))
+
+    def _schedule_refill(self, force=False):
+        if not force and len(self._questions) >= QUESTION_POOL_LOW_WATER:
+            return
+
+        with self._refill_flag_lock:
+            if self._refilling:
+                return
+            self._refilling = True
+
+        threading.Thread(target=self._refill_in_background, daemon=True).start()
+
+    def _refill_in_background(self):
+        error = None
+        try:
+            with self._fill_lock:
+                self._fill()
+        except Exception as e:
+            logger.error('Error refilling question pool %s: %s', self.key, e)
+            error = e
+        finally:
+            with self._refill_flag_lock:
+                self._refilling = False
+            with self._filled:
+                self._fills += 1
+                self._last_error = error
+                self._filled.notify_all()
+
+    @property
+    def key(self):
+        return (self.category, self.difficulty, self.question_type)
+
+
+# Bufory są w pamięci procesu, nie w warstwie współdzielonej (SHARED_CACHE_ENABLED) - pytania muszą trafić
+# do jednego zespołu tylko raz, a sloty mmap nie dają atomowego zdjęcia pytania z bufora. Każdy worker
+# uzupełnia własne bufory; pytania wspólne dla workerów daje bank pytań (SQLite).
+_pools = OrderedDict()
+_pools_lock = threading.Lock()
+
+
+def validate_params(category='', difficulty='', question_type=''):
+    """
+    Sprawdza parametry zapytania o pytania z katalogiem kategorii i listą wartości opentdb
+
+    Returns:
+        tuple: Klucz bufora (category, difficulty, question_type)
+
+    Raises:
+        InvalidQuestionParameters: Gdy któryś parametr ma niedozwoloną wartość
+    """
+    category = str(category or '')
+    if category and category not in TRIVIA_CATEGORY_IDS and \
+            category not in {str(item['id']) for item in categories.catalog.categories}:
+        raise InvalidQuestionParameters(f'Unknown category: {category}')
+    if difficulty not in DIFFICULTIES:
+        raise InvalidQuestionParameters(f'Unknown difficulty: {difficulty}')
+    if question_type not in QUESTION_TYPES:
+        raise InvalidQuestionParameters(f'Unknown question type: {question_type}')
+    return category, difficulty, question_type
+
+
+def get_pool(category='', difficulty='', question_type=''):
+    """
+    Zwraca bufor dla danego zestawu parametrów (tworzy go przy pierwszym użyciu)
+
+    Liczba buforów jest ograniczona do QUESTION_POOL_MAX_POOLS - przy
+    przepełnieniu znika najdawniej używany bufor razem z pytaniami i tokenem.
+    """
+    key = validate_params(category, difficulty, question_type)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = QuestionPool(*key)
+            while len(_pools) > QUESTION_POOL_MAX_POOLS:
+                evicted, _ = _pools.popitem(last=False)
+                logger.info('Question pool %s evicted', evicted)
+        else:
+            _pools.move_to_end(key)
+        return pool
+
+
+def get_questions(amount=1, category='', difficulty='', question_type='', wait=True):
+    """
+    Wydaje pytania z bufora dla podanych parametrów (wait - jak w QuestionPool.take)
+
+    Returns:
+        list: Lista pytań w formacie opentdb
+    """
+    return get_pool(category, difficulty, question_type).take(amount, wait=wait)
+
+
+def return_questions(questions, category='', difficulty='', question_type=''):
+    """
+    Oddaje do bufora pytania, które zostały wydane, ale nie trafiły do gracza
+    """
+    if questions:
+        get_pool(category, difficulty, question_type).give_back(questions)
+
+
+def get_pool_stats():
+    """
+    Zwraca liczbę pytań w każdym buforze
+    """
+    with _pools_lock:
+        return {'|'.join(key): len(pool) for key, pool in _pools.items()}
@@ -1,46 +1,106 @@
 from flask import Blueprint, Flask, app, render_template, jsonify, make_response, session
+import asyncio
 import os
 import json
 import requests
 from flask import request
 from dotenv import load_dotenv
-from google.cloud import firestore
 
-from database import add_points_to_team, team_exists, update_correct_answers_counter, get_team_stats, db, update_incorrect_answers_counter, update_questions_generated_counter
-from modules import auth
+from database import record_answer, get_team_stats
+from modules import auth, categories, leaderboard, question_bank, question_pool, speculation, stats_buffer, upstream
+from modules.log import get_logger
 
 TRIVIA_API_URL = os.getenv('TRIVIA_API_URL', 'https://opentdb.com/api.php')
 
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 bp = Blueprint('quiz', __name__)
 
 
+def _trivia_params(args):
+    """
+    Wydobywa parametry zapytania o pytania (amount, category, difficulty, type)
+    """
+    return (
+        int(args.get('amount', 1)),
+        args.get('category', ''),
+        args.get('difficulty', ''),
+        args.get('type', '')
+    )
+
+
+def _use_question_pool(amount):
+    return question_pool.QUESTION_POOL_ENABLED and amount <= question_pool.QUESTION_POOL_BATCH_SIZE
+
+
+def _pool_response(questions):
+    response_code = question_pool.RESPONSE_SUCCESS if questions else question_pool.RESPONSE_NO_RESULTS
+    return {'response_code': response_code, 'results': questions}
+
+
+def _upstream_params(amount, category, difficulty, question_type):
+    params = {'amount': amount}
+    if category:
+        params['category'] = category
+    if difficulty:
+        params['difficulty'] = difficulty
+    if question_type:
+        params['type'] = question_type
+    return params
+
+
+def _speculative_questions(team_name, args):
+    """
+    Wydaje pojedyncze pytanie przygotowane w tle (razem z opisem) i zleca przygotowanie następnego
+
+    Returns:
+        dict: Odpowiedź w formacie opentdb, z polem 'description' gdy opis jest gotowy
+    """
+    settings = speculation.settings_from_args(args)
+    prepared = speculation.claim(team_name, settings)
+
+    if prepared is None:
+        questions = question_bank.get_questions(team_name, 1, settings.category, settings.difficulty, settings.question_type)
+        payload = _pool_response(questions)
+    else:
+        payload = _pool_response([prepared['question']])
+        if prepared['description'] is not None:
+            payload['description'] = prepared['description']
+
+    # Następne pytanie przygotowuje się, gdy gracz odpowiada na bieżące
+    speculation.speculate(team_name, settings)
+    return payload
+
+
+def _use_speculation(amount, args):
+    return amount == 1 and args.get('speculate') == '1' and speculation.SPECULATION_ENABLED
+
+
 @bp.route('/get-questions', methods=['GET'])
 @auth.login_required
 def get_questions():
     quiz_api = request.cookies.get('selectedQuizApi', 'default_quiz_api')
     if quiz_api == "Trivia API":
-        amount = request.args.get('amount', 1)
-        category = request.args.get('category', '')
-        difficulty = request.args.get('difficulty', '')
-        question_type = request.args.get('type', '')
-
-        base_url = TRIVIA_API_URL
-        params = {'amount': amount}
-        if category:
-            params['category'] = category
-        if difficulty:
-            params['difficulty'] = difficulty
-        if question_type:
-            params['type'] = question_type
-
         try:
-            response = requests.get(base_url, params=params)
+            amount, category, difficulty, question_type = _trivia_params(request.args)
+
+            # Pytania wydawane z bufora w pamięci, uzupełnianego w tle paczkami z opentdb
+            if _use_question_pool(amount) and _use_speculation(amount, request.args):
+                return jsonify(_speculative_questions(session.get('team_name'), request.args))
+
+            if _use_question_pool(amount):
+                questions = question_bank.get_questions(session.get('team_name'), amount, category, difficulty, question_type)
+                return jsonify(_pool_response(questions))
+
+            response = upstream.trivia.get(TRIVIA_API_URL, params=_upstream_params(amount, category, difficulty, question_type))
             response.raise_for_status()
 
             return jsonify(response.json())
+        except question_pool.InvalidQuestionParameters as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     else:
@@ -50,13 +110,53 @@ def get_questions():
 @bp.route('/get-categories', methods=['GET'])
 @auth.login_required
 def get_categories():
+    """
+    Zwraca katalog kategorii z pamięci (bez zapytania do opentdb w trakcie żądania)
+
+    Odpowiedź ma ETag - przeglądarka z aktualną wersją dostaje 304 bez body.
+    """
+    snapshot = categories.catalog.snapshot
+
+    response = make_response(snapshot.body)
+    response.mimetype = 'application/json'
+    response.set_etag(snapshot.etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = categories.CATEGORY_MAX_AGE
+    return response.make_conditional(request)
+    
+
+# ✅ Wersje asynchroniczne dla ścieżki ASGI (asgi.py) - zwracają (payload, status)
+
+async def get_questions_async(async_request):
+    if not await auth.async_session_is_valid(async_request.session):
+        return {'logged_in': False, 'error': 'Authentication required'}, 401
+
+    quiz_api = async_request.cookies.get('selectedQuizApi', 'default_quiz_api')
+    if quiz_api != "Trivia API":
+        return {'error': 'Unsupported quiz API selected'}, 400
+
     try:
-        response = requests.get('https://opentdb.com/api_category.php')
+        amount, category, difficulty, question_type = _trivia_params(async_request.args)
+
+        if _use_question_pool(amount) and _use_speculation(amount, async_request.args):
+            # Odbiór przygotowanego pytania może czekać na Gemini - w wątku, nie w pętli zdarzeń
+            team_name = async_request.session.get('team_name')
+            return await asyncio.to_thread(_speculative_questions, team_name, async_request.args), 200
+
+        if _use_question_pool(amount):
+            # Ciepły bufor zwraca pytania od razu; zimny blokuje tylko wątek z puli, nie pętlę zdarzeń
+            team_name = async_request.session.get('team_name')
+            questions = await asyncio.to_thread(question_bank.get_questions, team_name, amount, category, difficulty, question_type)
+            return _pool_response(questions), 200
+
+        response = await upstream.async_trivia.get(TRIVIA_API_URL, params=_upstream_params(amount, category, difficulty, question_type))
         response.raise_for_status()
-        return jsonify(response.json())
+        return response.json(), 200
+    except question_pool.InvalidQuestionParameters as e:
+        return {'error': str(e)}, 400
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    
+        return {'error': str(e)}, 500
+
 
 @bp.route('/team/stats/question', methods=['POST'])
 @auth.login_required
@@ -69,21 +169,30 @@ def team_question_stats_update():
         "categoryId": "int",
         "categoryName": "string"
     }
+
+    Odpowiedź nie zawiera już pola result ze statystykami zespołu (wymagałoby
+    odczytu bazy przy każdym pytaniu) - tylko success, message i
+    pending_questions_generated (przyrost czekający w buforze zapisu tego procesu).
+    Aktualne statystyki zwraca GET /api/team/stats.
     """
     try:
         data = request.json
         category_id = str(data.get('categoryId', 'general'))  # ✅ Zamień na string
         category_name = data.get('categoryName', 'general')  # ✅ Pobierz nazwę kategorii
 
-        print(f"request data: {data}, category: {category_id}  ")
+        logger.debug('request data: %s, category: %s', data, category_id)
         team_name = session.get('team_name', 'default_team')
-        if team_exists(team_name) is False:
-            return jsonify({'success': False, 'error': 'Team not found'}), 404
-        
-        update_questions_generated_counter(team_name, category_id, category_name)
-        team_stats = get_team_stats(team_name)
-        
-        return jsonify({'success': True, 'message': 'Team stats updated successfully', 'result': team_stats}), 200
+
+        # Licznik tylko do wyświetlania - zapis zbiorczy w tle, bez odczytów Firestore w żądaniu
+        if not stats_buffer.record_question_generated(team_name, category_id, category_name):
+            return jsonify({'success': False, 'error': 'Failed to update team stats'}), 500
+
+        pending = stats_buffer.questions_generated.pending(team_name)
+        return jsonify({
+            'success': True,
+            'message': 'Team stats updated successfully',
+            'pending_questions_generated': pending.get(('questions_generated',), 0)
+        }), 200
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -107,17 +216,17 @@ def team_answer_stats_update():
         is_correct_answer = data.get('is_correct_answer', False)
         category_id = str(data.get('category_id', 'general'))  # ✅ Zamień na string
         team_name = session.get('team_name', 'default_team')
-        if team_exists(team_name) is False:
+
+        # Punkty, liczniki i seria zapisywane jedną transakcją, która zwraca nowe statystyki
+        points = 10 if is_correct_answer else 0
+        team_stats = record_answer(team_name, category_id, is_correct_answer, points)
+
+        if team_stats is False:
             return jsonify({'success': False, 'error': 'Team not found'}), 404
-        
-        if is_correct_answer:
-            add_points_to_team(team_name, category_id, 10)
-            update_correct_answers_counter(team_name, category_id)
-        else:
-            update_incorrect_answers_counter(team_name, category_id)
-            print(f"No points added. Incorrect answer for team: {team_name}")
-        
-        team_stats = get_team_stats(team_name)
+        if team_stats is None:
+            return jsonify({'success': False, 'error': 'Failed to update team stats'}), 500
+
+        stats_buffer.questions_generated.overlay(team_name, team_stats['stats'])
         
         return jsonify({'status': True, 'message': 'Team stats updated successfully', 'result': team_stats}), 200
         
@@ -142,9 +251,32 @@ def get_team_stats_endpoint():
         team_stats = get_team_stats(team_name)
         
         if team_stats:
+            # Uwzględnij przyrosty czekające jeszcze w buforze zapisu
+            stats_buffer.questions_generated.overlay(team_name, team_stats['stats'])
             return jsonify({'status': True, 'message': 'Team stats updated successfully', 'result': team_stats}), 200
         else:
             return jsonify({'success': False, 'error': 'Team not found'}), 404
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@bp.route('/leaderboard', methods=['GET'])
+@auth.login_required
+def get_leaderboard():
+    """
+    Endpoint rankingu zespołów (z pamięci, bez przeglądania kolekcji zespołów)
+
+    Query params:
+        category (str, optional): ID kategorii - bez niego ranking globalny
+        limit (int): Liczba zespołów z czołówki (domyślnie 10)
+    """
+    try:
+        board = request.args.get('category') or leaderboard.GLOBAL_BOARD
+        limit = request.args.get('limit', 10, type=int)
+
+        result = leaderboard.leaderboard.get(board, limit, session.get('team_name'))
+        return jsonify({'success': True, 'result': result}), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
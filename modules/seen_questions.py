@@ -0,0 +1,299 @@
+import atexit
+import hashlib
+import html
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import database
+from modules.cache import TTLCache
+from modules.storage import merge_seen_chunk
+from modules.log import get_logger
+
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# Filtr Blooma pytań widzianych przez zespół: 64 Kib i 5 funkcji skrótu to ~0,3% fałszywych trafień przy 5000 pytań
+SEEN_FILTER_BITS = int(os.getenv('SEEN_FILTER_BITS', str(64 * 1024)))
+SEEN_FILTER_HASHES = int(os.getenv('SEEN_FILTER_HASHES', '5'))
+# Po tylu pytaniach filtr jest czyszczony - dalej rósłby odsetek fałszywych trafień
+SEEN_FILTER_CAPACITY = int(os.getenv('SEEN_FILTER_CAPACITY', '5000'))
+# Rozmiar kawałka zapisywanego w dokumencie zespołu (zapisywane są tylko zmienione kawałki)
+SEEN_CHUNK_BYTES = int(os.getenv('SEEN_CHUNK_BYTES', '1024'))
+# Co ile sekund zapisywać zmiany do Firestore
+SEEN_FLUSH_INTERVAL = float(os.getenv('SEEN_FLUSH_INTERVAL', '30'))
+SEEN_CACHE_SIZE = int(os.getenv('SEEN_CACHE_SIZE', '2048'))
+SEEN_CACHE_TTL = float(os.getenv('SEEN_CACHE_TTL', '3600'))
+
+
+def question_key(question):
+    """
+    Klucz pytania niezależny od źródła (opentdb zwraca encje HTML, bank pytań tekst)
+    """
+    text = ' '.join(html.unescape(question.get('question', '')).casefold().split())
+    answer = ' '.join(html.unescape(question.get('correct_answer', '')).casefold().split())
+    return f'{text}\n{answer}'
+
+
+class SeenFilter:
+    """
+    Filtr Blooma pytań widzianych przez jeden zespół
+
+    Sprawdzenie i dodanie to k operacji na bitach niezależnie od liczby pytań.
+    Fałszywe trafienie oznacza tylko, że zespół nie dostanie jakiegoś nowego
+    pytania - nigdy, że dostanie powtórkę.
+
+    Każdy worker ma własną kopię filtra. Zapis scala zmienione kawałki z
+    zapisanymi (bitowe OR), a scalony wynik wraca do kopii w pamięci - bity
+    dodane w innych workerach są widoczne najpóźniej po SEEN_FLUSH_INTERVAL.
+    """
+
+    def __init__(self, bits=SEEN_FILTER_BITS, hashes=SEEN_FILTER_HASHES, data=None, count=0):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+        self.count = count
+        # Pytania dodane od ostatniego zapisu - zapis zwiększa o tyle licznik w bazie
+        self.added = 0
+        self.dirty_chunks = set()
+        self.replace = False
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_document(cls, document):
+        """
+        Odtwarza filtr z mapy seen_questions dokumentu zespołu
+
+        Filtr zapisany z innymi parametrami (bits, hashes) jest pomijany.
+        """
+        if not document or document.get('bits') != SEEN_FILTER_BITS or document.get('hashes') != SEEN_FILTER_HASHES:
+            return cls()
+
+        seen_filter = cls(count=document.get('count', 0))
+        for index, blob in (document.get('chunks') or {}).items():
+            start = int(index) * SEEN_CHUNK_BYTES
+            seen_filter.array[start:start + len(blob)] = blob
+        return seen_filter
+
+    def merge_document(self, document):
+        """
+        Dopisuje do filtra bity z zapisanej mapy seen_questions (wywoływane z założoną blokadą lock)
+
+        Pomijane, gdy filtr został w międzyczasie wyczyszczony albo ma inne parametry.
+        """
+        if self.replace or document.get('bits') != self.bits or document.get('hashes') != self.hashes:
+            return
+
+        for index, blob in (document.get('chunks') or {}).items():
+            start = int(index) * SEEN_CHUNK_BYTES
+            current = bytes(self.array[start:start + len(blob)])
+            self.array[start:start + len(current)] = merge_seen_chunk(current, blob[:len(current)])
+        self.count = document.get('count', self.count) + self.added
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def add(self, key):
+        """
+        Dodaje klucz do filtra (wywoływane z założoną blokadą lock)
+        """
+        if self.count >= SEEN_FILTER_CAPACITY:
+            self.reset()
+
+        added = False
+        for position in self._positions(key):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self.array[byte] & mask:
+                self.array[byte] |= mask
+                self.dirty_chunks.add(byte // SEEN_CHUNK_BYTES)
+                added = True
+        if added:
+            self.count += 1
+            self.added += 1
+        return added
+
+    def reset(self):
+        self.array = bytearray(len(self.array))
+        self.count = 0
+        self.added = 0
+        self.dirty_chunks.clear()
+        self.replace = True
+
+    def take_changes(self):
+        """
+        Zwraca (kawałki, replace, added) do zapisu i czyści listę zmian (wywoływane z założoną blokadą lock)
+        """
+        if self.replace:
+            indices = range((len(self.array) + SEEN_CHUNK_BYTES - 1) // SEEN_CHUNK_BYTES)
+            # Po wyczyszczeniu zapisywane są tylko niezerowe kawałki - reszta znika z dokumentu
+            chunks = {
+                index: bytes(self.array[index * SEEN_CHUNK_BYTES:(index + 1) * SEEN_CHUNK_BYTES])
+                for index in indices
+                if any(self.array[index * SEEN_CHUNK_BYTES:(index + 1) * SEEN_CHUNK_BYTES])
+            }
+        else:
+            chunks = {
+                index: bytes(self.array[index * SEEN_CHUNK_BYTES:(index + 1) * SEEN_CHUNK_BYTES])
+                for index in sorted(self.dirty_chunks)
+            }
+        replace, added = self.replace, self.added
+        self.dirty_chunks.clear()
+        self.replace = False
+        self.added = 0
+        return chunks, replace, added
+
+
+_filters = TTLCache('seen_questions', max_size=SEEN_CACHE_SIZE, ttl=SEEN_CACHE_TTL)
+# Filtry z niezapisanymi zmianami - trzymane do zapisu także po wypadnięciu z cache'a
+_dirty = {}
+_dirty_lock = threading.Lock()
+_load_lock = threading.Lock()
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+_counters = {'checked': 0, 'repeats': 0, 'flushed_chunks': 0, 'flush_errors': 0, 'dropped': 0}
+
+
+def get_filter(team_name):
+    """
+    Zwraca filtr zespołu z pamięci (przy pierwszym użyciu wczytuje go z dokumentu zespołu)
+    """
+    seen_filter = _filters.get(team_name)
+    if seen_filter is not None:
+        return seen_filter
+
+    with _load_lock:
+        seen_filter = _filters.get(team_name)
+        if seen_filter is None:
+            with _dirty_lock:
+                seen_filter = _dirty.get(team_name)
+            if seen_filter is None:
+                seen_filter = SeenFilter.from_document(database.get_seen_questions(team_name))
+            _filters.set(team_name, seen_filter)
+    return seen_filter
+
+
+def split_seen(team_name, questions):
+    """
+    Dzieli pytania na jeszcze niewidziane i już widziane przez zespół
+
+    Returns:
+        tuple: (niewidziane, widziane)
+    """
+    seen_filter = get_filter(team_name)
+    unseen, seen = [], []
+    with seen_filter.lock:
+        for question in questions:
+            (seen if question_key(question) in seen_filter else unseen).append(question)
+
+    _counters['checked'] += len(questions)
+    _counters['repeats'] += len(seen)
+    return unseen, seen
+
+
+def mark_seen(team_name, questions):
+    """
+    Zapamiętuje pytania wydane zespołowi (zapis do Firestore odbywa się w tle)
+    """
+    if not questions:
+        return
+
+    seen_filter = get_filter(team_name)
+    with seen_filter.lock:
+        for question in questions:
+            seen_filter.add(question_key(question))
+        changed = bool(seen_filter.dirty_chunks) or seen_filter.replace
+
+    if changed:
+        with _dirty_lock:
+            _dirty[team_name] = seen_filter
+        _ensure_flusher()
+
+
+def flush():
+    """
+    Scala zmienione kawałki filtrów wszystkich zespołów z zapisanymi
+
+    Filtr zespołu, którego nie ma w bazie (np. usuniętego), jest porzucany zamiast
+    ponawiania zapisu. Przy błędzie zapisu zmiany wracają do kolejki.
+    """
+    with _dirty_lock:
+        pending = list(_dirty.items())
+        _dirty.clear()
+
+    for team_name, seen_filter in pending:
+        with seen_filter.lock:
+            chunks, replace, added = seen_filter.take_changes()
+
+        if not chunks and not replace:
+            continue
+
+        result = database.save_seen_questions(team_name, chunks, added, seen_filter.bits, seen_filter.hashes, replace)
+        if result:
+            _counters['flushed_chunks'] += len(chunks)
+            with seen_filter.lock:
+                seen_filter.merge_document(result)
+            continue
+
+        if result is False:
+            _counters['dropped'] += 1
+            _filters.delete(team_name)
+            logger.warning('Dropped seen questions of missing team %s', team_name)
+            continue
+
+        # Nieudany zapis - zmiany wracają do kolejki
+        _counters['flush_errors'] += 1
+        with seen_filter.lock:
+            seen_filter.dirty_chunks.update(chunks)
+            # Po ponownym wyczyszczeniu filtra dawne dodania nie wchodzą już do licznika
+            if not seen_filter.replace:
+                seen_filter.added += added
+            seen_filter.replace = seen_filter.replace or replace
+        with _dirty_lock:
+            _dirty.setdefault(team_name, seen_filter)
+
+
+def _ensure_flusher():
+    """
+    Uruchamia wątek zapisujący przy pierwszym użyciu w danym procesie (także po fork)
+    """
+    global _flusher_pid
+
+    if _flusher_pid == os.getpid():
+        return
+
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        threading.Thread(target=_flush_periodically, daemon=True).start()
+        _flusher_pid = os.getpid()
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(SEEN_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception as e:
+            logger.error('Error flushing seen questions: %s', e)
+
+
+def get_seen_stats():
+    with _dirty_lock:
+        pending = len(_dirty)
+    return {'pending_teams': pending, **_counters}
+
+
+# Zapisz niezapisane zmiany przy zamykaniu procesu
+atexit.register(flush)
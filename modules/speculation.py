@@ -0,0 +1,283 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, CancelledError, TimeoutError as FutureTimeoutError
+
+from dotenv import load_dotenv
+
+from modules import ai_logic, question_bank, seen_questions
+from modules.log import get_logger
+
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# Przygotowywanie następnego pytania (i jego opisu) w tle, zanim gracz o nie poprosi.
+# Przygotowania są w pamięci procesu - trafienie jest tylko wtedy, gdy kolejne żądanie
+# zespołu obsłuży ten sam worker (przy kilku workerach gunicorn potrzebne sticky sessions).
+# Pytanie w innym workerze przepada po SPECULATION_TTL i wraca do bufora tego procesu.
+SPECULATION_ENABLED = os.getenv('SPECULATION_ENABLED', 'True') == 'True'
+SPECULATION_WORKERS = int(os.getenv('SPECULATION_WORKERS', '4'))
+# Ile przygotowanych pytań może naraz czekać na jeden zespół
+SPECULATION_MAX_PER_TEAM = int(os.getenv('SPECULATION_MAX_PER_TEAM', '1'))
+# Po jakim czasie (s) nieodebrane pytanie jest porzucane
+SPECULATION_TTL = float(os.getenv('SPECULATION_TTL', '600'))
+# Jak długo (s) czekać na trwające przygotowanie zamiast zaczynać od nowa
+SPECULATION_CLAIM_TIMEOUT = float(os.getenv('SPECULATION_CLAIM_TIMEOUT', '30'))
+
+# Ustawienia gry, dla których przygotowano pytanie - zmiana którejkolwiek unieważnia przygotowanie
+SpeculationSettings = namedtuple(
+    'SpeculationSettings',
+    ['category', 'difficulty', 'question_type', 'describe', 'prompt_type', 'temperature']
+)
+
+
+class Speculation:
+    """
+    Jedno przygotowywane w tle pytanie zespołu
+    """
+
+    def __init__(self, team_name, settings):
+        self.team_name = team_name
+        self.settings = settings
+        self.created_at = time.monotonic()
+        self.cancelled = threading.Event()
+        self.future = None
+        self._released = False
+        self._release_lock = threading.Lock()
+
+    def release(self):
+        """
+        Oddaje nieodebrane pytanie do bufora (najwyżej raz)
+
+        Przygotowane pytanie nie jest oznaczane jako widziane przez zespół, więc po
+        zwrocie może je dostać także ten sam zespół.
+        """
+        if self.future is None or not self.future.done() or self.future.cancelled():
+            return
+
+        with self._release_lock:
+            if self._released:
+                return
+            self._released = True
+
+        try:
+            result = self.future.result()
+        except Exception:
+            return
+        if result:
+            settings = self.settings
+            question_bank.return_questions(
+                [result['question']], settings.category, settings.difficulty, settings.question_type
+            )
+
+
+_speculations = {}
+_speculations_lock = threading.Lock()
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+_counters = {'started': 0, 'hits': 0, 'misses': 0, 'cancelled': 0, 'expired': 0, 'skipped': 0}
+
+
+def _get_executor():
+    """
+    Pula wątków tworzona przy pierwszym użyciu w danym procesie (także po fork)
+    """
+    global _executor, _executor_pid
+
+    if _executor_pid == os.getpid():
+        return _executor
+
+    with _executor_lock:
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS, thread_name_prefix='speculation')
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _count(name):
+    with _speculations_lock:
+        _counters[name] += 1
+
+
+def settings_from_args(args):
+    """
+    Buduje SpeculationSettings z parametrów zapytania /get-questions
+    """
+    return SpeculationSettings(
+        str(args.get('category', '')),
+        args.get('difficulty', ''),
+        args.get('type', ''),
+        args.get('describe', '0') == '1',
+        args.get('introduction_prompt_type', ''),
+        args.get('temperature', '0.5')
+    )
+
+
+def description_args(question, settings):
+    """
+    Parametry opisu pytania w takiej postaci, w jakiej wysyła je przeglądarka
+
+    Dzięki temu przygotowany opis trafia pod ten sam klucz cache'a co zwykłe /generate-description.
+    """
+    return {
+        'temperature': settings.temperature,
+        'category': question.get('category', ''),
+        'introduction_prompt_type': settings.prompt_type,
+        'question': question.get('question', ''),
+        'correct_answer': question.get('correct_answer', ''),
+        'incorrect_answers': ', '.join(question.get('incorrect_answers', []))
+    }
+
+
+def _prepare(speculation):
+    """
+    Pobiera pytanie z bufora i generuje jego opis (uruchamiane w puli wątków)
+    """
+    settings = speculation.settings
+    if speculation.cancelled.is_set():
+        return None
+
+    # Jako widziane oznacza je dopiero claim, gdy pytanie trafia do gracza
+    questions = question_bank.get_questions(
+        speculation.team_name, 1, settings.category, settings.difficulty, settings.question_type, mark=False
+    )
+    if not questions:
+        return None
+
+    result = {'question': questions[0], 'description': None}
+    if settings.describe and not speculation.cancelled.is_set():
+        try:
+            result['description'] = ai_logic.get_description(description_args(questions[0], settings))
+        except Exception as e:
+            # Przeglądarka wygeneruje opis zwykłą ścieżką
+            logger.error('Error preparing description for team %s: %s', speculation.team_name, e)
+
+    return result
+
+
+def _on_done(speculation):
+    # Przygotowanie zakończone po anulowaniu - pytanie wraca do bufora
+    if speculation.cancelled.is_set():
+        speculation.release()
+
+
+def _cancel(speculation, reason='cancelled'):
+    speculation.cancelled.set()
+    if speculation.future is not None:
+        speculation.future.cancel()
+    speculation.release()
+    _counters[reason] += 1
+
+
+def _prune(team_name, settings):
+    """
+    Usuwa przygotowania przeterminowane i te dla innych ustawień niż bieżące
+
+    Wywoływane z założoną blokadą _speculations_lock.
+    """
+    now = time.monotonic()
+    kept = []
+    for speculation in _speculations.get(team_name, []):
+        if now - speculation.created_at > SPECULATION_TTL:
+            _cancel(speculation, 'expired')
+        elif speculation.settings != settings:
+            _cancel(speculation)
+        else:
+            kept.append(speculation)
+
+    if kept:
+        _speculations[team_name] = kept
+    else:
+        _speculations.pop(team_name, None)
+    return kept
+
+
+def speculate(team_name, settings):
+    """
+    Zaczyna w tle przygotowywać następne pytanie zespołu dla podanych ustawień
+
+    Returns:
+        bool: True jeśli przygotowanie zostało zlecone
+    """
+    if not SPECULATION_ENABLED or not team_name:
+        return False
+
+    with _speculations_lock:
+        pending = _prune(team_name, settings)
+        if len(pending) >= SPECULATION_MAX_PER_TEAM:
+            _counters['skipped'] += 1
+            return False
+
+        speculation = Speculation(team_name, settings)
+        speculation.future = _get_executor().submit(_prepare, speculation)
+        speculation.future.add_done_callback(lambda _: _on_done(speculation))
+        _speculations.setdefault(team_name, []).append(speculation)
+        _counters['started'] += 1
+
+    return True
+
+
+def claim(team_name, settings):
+    """
+    Odbiera przygotowane pytanie zespołu
+
+    Przygotowania dla innych ustawień są anulowane. Jeśli pasujące przygotowanie
+    jeszcze trwa, czeka na nie (najwyżej SPECULATION_CLAIM_TIMEOUT sekund).
+    Odebrane pytanie jest oznaczane jako widziane przez zespół.
+
+    Returns:
+        dict: {'question', 'description'} lub None, jeśli nic nie przygotowano
+    """
+    if not SPECULATION_ENABLED or not team_name:
+        return None
+
+    with _speculations_lock:
+        pending = _prune(team_name, settings)
+        speculation = pending.pop(0) if pending else None
+        if not pending:
+            _speculations.pop(team_name, None)
+
+    if speculation is None:
+        _count('misses')
+        return None
+
+    try:
+        result = speculation.future.result(timeout=SPECULATION_CLAIM_TIMEOUT)
+    except (CancelledError, FutureTimeoutError):
+        with _speculations_lock:
+            _cancel(speculation)
+        _count('misses')
+        return None
+    except Exception as e:
+        logger.error('Error in speculation for team %s: %s', team_name, e)
+        _count('misses')
+        return None
+
+    _count('hits' if result else 'misses')
+    if result:
+        seen_questions.mark_seen(team_name, [result['question']])
+    return result
+
+
+def cancel_team(team_name):
+    """
+    Anuluje wszystkie przygotowania zespołu (np. przy wylogowaniu)
+    """
+    with _speculations_lock:
+        for speculation in _speculations.pop(team_name, []):
+            _cancel(speculation)
+
+
+def get_speculation_stats():
+    with _speculations_lock:
+        return {
+            'enabled': SPECULATION_ENABLED,
+            'pending': sum(len(items) for items in _speculations.values()),
+            **_counters
+        }
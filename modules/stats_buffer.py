@@ -0,0 +1,227 @@
+import atexit
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import database
+from modules.log import get_logger
+
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# Liczniki tylko do wyświetlania (np. questions_generated) są sumowane w pamięci i zapisywane zbiorczo
+STATS_BUFFER_ENABLED = os.getenv('STATS_BUFFER_ENABLED', 'True') == 'True'
+STATS_FLUSH_INTERVAL = float(os.getenv('STATS_FLUSH_INTERVAL', '5'))
+STATS_FLUSH_EVENTS = int(os.getenv('STATS_FLUSH_EVENTS', '200'))
+
+
+class StatsBuffer:
+    """
+    Bufor zapisu (write-behind) przyrostów statystyk zespołów
+
+    Przyrosty tego samego zespołu i pola są sumowane w pamięci, a wątek w tle
+    zapisuje je do Firestore batchami co STATS_FLUSH_INTERVAL sekund albo po
+    STATS_FLUSH_EVENTS zdarzeniach. Niezapisane zmiany są zapisywane przy
+    zamykaniu procesu.
+    """
+
+    def __init__(self, name, flush_interval=STATS_FLUSH_INTERVAL, flush_events=STATS_FLUSH_EVENTS):
+        self.name = name
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._increments = {}
+        self._values = {}
+        self._events = 0
+        self._oldest = None
+        self._wakeup = threading.Event()
+
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+
+        self._counters = {'events': 0, 'flushes': 0, 'teams_written': 0, 'errors': 0}
+        self._last_flush = {'at': None, 'duration_ms': None, 'lag_seconds': None}
+
+    def add(self, team_name, increments, values=None):
+        """
+        Dodaje przyrosty statystyk zespołu do bufora
+
+        Args:
+            team_name (str): Nazwa zespołu
+            increments (dict): {(część ścieżki, ...): wartość inkrementu}
+            values (dict, optional): {(część ścieżki, ...): wartość do ustawienia}
+        """
+        with self._lock:
+            team_increments = self._increments.setdefault(team_name, {})
+            for path, amount in increments.items():
+                team_increments[path] = team_increments.get(path, 0) + amount
+            if values:
+                self._values.setdefault(team_name, {}).update(values)
+
+            self._events += 1
+            self._counters['events'] += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = self._events >= self.flush_events
+
+        self._ensure_flusher()
+        if full:
+            self._wakeup.set()
+
+    def pending(self, team_name):
+        """
+        Zwraca niezapisane jeszcze przyrosty zespołu: {(część ścieżki, ...): wartość}
+        """
+        with self._lock:
+            return dict(self._increments.get(team_name, {}))
+
+    def overlay(self, team_name, stats):
+        """
+        Dodaje niezapisane przyrosty do statystyk odczytanych z Firestore (modyfikuje stats)
+        """
+        with self._lock:
+            increments = dict(self._increments.get(team_name, {}))
+            values = dict(self._values.get(team_name, {}))
+
+        for path, value in values.items():
+            _nested(stats, path[:-1])[path[-1]] = value
+        for path, amount in increments.items():
+            parent = _nested(stats, path[:-1])
+            parent[path[-1]] = (parent.get(path[-1]) or 0) + amount
+        return stats
+
+    def flush(self):
+        """
+        Zapisuje zsumowane przyrosty wszystkich zespołów do Firestore
+        """
+        with self._flush_lock:
+            with self._lock:
+                increments, self._increments = self._increments, {}
+                values, self._values = self._values, {}
+                oldest, self._oldest = self._oldest, None
+                self._events = 0
+
+            if not increments and not values:
+                return
+
+            started = time.monotonic()
+            mutations = {
+                team_name: (increments.get(team_name, {}), values.get(team_name))
+                for team_name in set(increments) | set(values)
+            }
+            try:
+                failed = database.apply_stats_mutations(mutations)
+            except Exception as e:
+                logger.error('Error flushing %s stats: %s', self.name, e)
+                failed = mutations
+
+            finished = time.monotonic()
+            self._counters['flushes'] += 1
+            self._counters['teams_written'] += len(mutations) - len(failed)
+            self._last_flush = {
+                'at': time.time(),
+                'duration_ms': round((finished - started) * 1000, 2),
+                'lag_seconds': round(finished - oldest, 3) if oldest is not None else None
+            }
+
+            if failed:
+                # Nieudany zapis - przyrosty wracają do bufora i zostaną zapisane przy następnej okazji
+                self._counters['errors'] += 1
+                for team_name, (team_increments, team_values) in failed.items():
+                    self._requeue(team_name, team_increments, team_values, oldest)
+
+    def _requeue(self, team_name, increments, values, oldest):
+        with self._lock:
+            team_increments = self._increments.setdefault(team_name, {})
+            for path, amount in increments.items():
+                team_increments[path] = team_increments.get(path, 0) + amount
+            if values:
+                # Nowsze wartości ustawione w międzyczasie mają pierwszeństwo
+                self._values[team_name] = {**values, **self._values.get(team_name, {})}
+            if oldest is not None and (self._oldest is None or oldest < self._oldest):
+                self._oldest = oldest
+
+    def _ensure_flusher(self):
+        """
+        Uruchamia wątek zapisujący przy pierwszym użyciu w danym procesie (także po fork)
+        """
+        if self._flusher_pid == os.getpid():
+            return
+
+        with self._flusher_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            threading.Thread(target=self._flush_periodically, daemon=True).start()
+            self._flusher_pid = os.getpid()
+
+    def _flush_periodically(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error('Error flushing %s stats: %s', self.name, e)
+
+    def stats(self):
+        """
+        Zwraca stan bufora: liczbę oczekujących zespołów i zdarzeń oraz opóźnienie zapisu (s)
+        """
+        with self._lock:
+            pending_teams = len(set(self._increments) | set(self._values))
+            pending_events = self._events
+            lag = time.monotonic() - self._oldest if self._oldest is not None else 0.0
+
+        return {
+            'name': self.name,
+            'pending_teams': pending_teams,
+            'pending_events': pending_events,
+            'lag_seconds': round(lag, 3),
+            'last_flush': dict(self._last_flush),
+            **self._counters
+        }
+
+
+def _nested(data, path):
+    for part in path:
+        data = data.setdefault(str(part), {})
+    return data
+
+
+# Licznik wygenerowanych pytań - wyświetlany w statystykach zespołu
+questions_generated = StatsBuffer('questions_generated')
+
+
+def record_question_generated(team_name, category_id, category_name):
+    """
+    Zlicza wydane pytanie (zapis do Firestore z opóźnieniem, jeśli bufor jest włączony)
+
+    Returns:
+        bool: True jeśli przyrost został przyjęty
+    """
+    category_id = str(category_id)
+    increments = {
+        ('categories', category_id, 'generated'): 1,
+        ('questions_generated',): 1
+    }
+    values = {('categories', category_id, 'name'): category_name}
+
+    if not STATS_BUFFER_ENABLED:
+        return database.update_questions_generated_counter(team_name, category_id, category_name)
+
+    questions_generated.add(team_name, increments, values)
+    return True
+
+
+def get_stats_buffer_stats():
+    return [questions_generated.stats()]
+
+
+# Zapisz niezapisane przyrosty przy zamykaniu procesu
+atexit.register(questions_generated.flush)
@@ -0,0 +1,78 @@
+# Backendy przechowywania zespołów i statystyk
+#
+# database.py jest backendem Firestore. Inny backend (np. SQLite) dostarcza metody
+# o nazwach z STORAGE_FUNCTIONS - po wybraniu go przez STORAGE_BACKEND zastępują
+# one funkcje modułu database, więc pozostałe moduły się nie zmieniają.
+
+# Funkcje database.py, które musi dostarczyć każdy backend (te same argumenty i wyniki)
+STORAGE_FUNCTIONS = (
+    'initialize_database',
+    'ensure_teams_collection_exists',
+    # Zespoły i logowanie
+    'team_exists',
+    'create_team',
+    'authenticate_team',
+    'validate_team_session',
+    'async_validate_team_session',
+    'rotate_team_id',
+    # Statystyki
+    'get_team_stats',
+    'apply_stats_mutations',
+    'record_answer',
+    'migrate_team_stats',
+    'migrate_all_team_stats',
+    # Pytania widziane przez zespół
+    'get_seen_questions',
+    'save_seen_questions',
+    # Ranking
+    'get_leaderboard_summary',
+    'merge_leaderboard_summary',
+    'scan_team_scores'
+)
+
+
+def validate_new_team(team_name, password):
+    """
+    Sprawdza nazwę i hasło nowego zespołu (wspólne dla wszystkich backendów)
+
+    Returns:
+        str: Komunikat błędu lub None, jeśli dane są poprawne
+    """
+    # Walidacja nazwy zespołu
+    if not team_name or len(team_name) < 3:
+        return 'Team name must be at least 3 characters'
+
+    if len(team_name) > 50:
+        return 'Team name must be less than 50 characters'
+
+    # Walidacja hasła
+    if not password or len(password) < 8:
+        return 'Password must be at least 8 characters'
+
+    return None
+
+
+def merge_seen_chunk(stored, blob):
+    """
+    Łączy kawałek filtra Blooma z zapisanym (bitowe OR) - bity dodane przez inne workery nie giną
+    """
+    if not stored:
+        return bytes(blob)
+    length = max(len(stored), len(blob))
+    return (int.from_bytes(stored, 'little') | int.from_bytes(blob, 'little')).to_bytes(length, 'little')
+
+
+def bind_backend(namespace, backend):
+    """
+    Podstawia metody backendu pod funkcje z STORAGE_FUNCTIONS w namespace (globals() modułu database)
+
+    Funkcje pomocnicze database.py (add_points_to_team, update_*_counter) zapisują
+    przez _apply_stats_mutation, więc podstawiana jest też metoda apply_stats_mutation.
+    """
+    missing = [name for name in STORAGE_FUNCTIONS + ('apply_stats_mutation',) if not hasattr(backend, name)]
+    if missing:
+        raise TypeError(f'Storage backend {type(backend).__name__} is missing: {", ".join(missing)}')
+
+    for name in STORAGE_FUNCTIONS:
+        namespace[name] = getattr(backend, name)
+    namespace['_apply_stats_mutation'] = backend.apply_stats_mutation
@@ -0,0 +1,510 @@
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from modules import metrics
+from modules.storage import merge_seen_chunk, validate_new_team
+from modules.log import get_logger
+
+
+logger = get_logger(__name__)
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS teams (
+    name TEXT PRIMARY KEY,
+    id TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    email TEXT,
+    created_at TEXT NOT NULL,
+    last_login TEXT,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    failed_login_attempts INTEGER NOT NULL DEFAULT 0,
+    questions_generated INTEGER NOT NULL DEFAULT 0,
+    questions_answered INTEGER NOT NULL DEFAULT 0,
+    correct_answers INTEGER NOT NULL DEFAULT 0,
+    incorrect_answers INTEGER NOT NULL DEFAULT 0,
+    total_points INTEGER NOT NULL DEFAULT 0,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    best_streak INTEGER NOT NULL DEFAULT 0,
+    total_play_time_seconds INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS team_categories (
+    team_name TEXT NOT NULL REFERENCES teams (name) ON DELETE CASCADE,
+    category_id TEXT NOT NULL,
+    name TEXT,
+    generated INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    incorrect INTEGER NOT NULL DEFAULT 0,
+    points INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (team_name, category_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS seen_questions (
+    team_name TEXT PRIMARY KEY REFERENCES teams (name) ON DELETE CASCADE,
+    bits INTEGER NOT NULL,
+    hashes INTEGER NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS seen_question_chunks (
+    team_name TEXT NOT NULL REFERENCES seen_questions (team_name) ON DELETE CASCADE,
+    chunk INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (team_name, chunk)
+) WITHOUT ROWID;
+'''
+
+# Liczniki w wierszu zespołu i w wierszu kategorii, które można zmieniać przez apply_stats_mutation
+TEAM_COUNTERS = (
+    'questions_generated', 'questions_answered', 'correct_answers',
+    'incorrect_answers', 'total_points', 'total_play_time_seconds'
+)
+CATEGORY_COUNTERS = ('generated', 'correct', 'incorrect', 'points')
+
+# Stałe zapytania z parametrami - sqlite3 przygotowuje każde raz na połączenie (cache instrukcji)
+INCREMENT_TEAM = (
+    'UPDATE teams SET '
+    + ', '.join(f'{column} = {column} + ?' for column in TEAM_COUNTERS)
+    + ' WHERE name = ?'
+)
+INCREMENT_CATEGORY = (
+    'INSERT INTO team_categories (team_name, category_id, name, '
+    + ', '.join(CATEGORY_COUNTERS)
+    + ') VALUES (?, ?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT (team_name, category_id) DO UPDATE SET name = COALESCE(excluded.name, name), '
+    + ', '.join(f'{column} = {column} + excluded.{column}' for column in CATEGORY_COUNTERS)
+)
+# Seria liczona w tym samym UPDATE - prawe strony przypisań widzą wartości sprzed zmiany
+RECORD_ANSWER = '''
+UPDATE teams SET
+    questions_answered = questions_answered + 1,
+    total_points = total_points + :points,
+    total_play_time_seconds = total_play_time_seconds + :time_taken,
+    correct_answers = correct_answers + :correct,
+    incorrect_answers = incorrect_answers + 1 - :correct,
+    current_streak = CASE WHEN :correct THEN current_streak + 1 ELSE 0 END,
+    best_streak = MAX(best_streak, CASE WHEN :correct THEN current_streak + 1 ELSE 0 END)
+WHERE name = :team_name
+'''
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+class SqliteStorage:
+    """
+    Backend zespołów i statystyk w lokalnym pliku SQLite (STORAGE_BACKEND=sqlite)
+
+    Statystyki zespołu to kolumny jednego wiersza, a statystyki kategorii -
+    wiersze team_categories. Liczniki są zmieniane atomowo przez
+    UPDATE ... SET x = x + ?, bez odczytu przed zapisem, a tryb WAL pozwala
+    czytać równolegle z zapisem. Nie wymaga sieci ani usług w chmurze -
+    do wdrożeń na jednym serwerze i testów obciążeniowych.
+    """
+
+    def __init__(self, path, notify_points=None):
+        """
+        Args:
+            path (str): Ścieżka do pliku bazy
+            notify_points (callable, optional): Wywoływane po zapisaniu punktów, jak database._notify_points
+        """
+        self.path = path
+        self.notify_points = notify_points or (lambda *args: None)
+        self._local = threading.local()
+
+    def _connection(self):
+        # Połączenie SQLite per wątek (po fork proces potomny otwiera własne)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA foreign_keys=ON')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE - blokada zapisu od początku, bez zakleszczeń przy podnoszeniu blokady
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        metrics.count_storage('write')
+
+    def initialize_database(self):
+        try:
+            self._connection()
+            logger.info('SQLite storage initialized at %s', self.path)
+            return True
+        except sqlite3.Error as e:
+            logger.error('Error initializing SQLite storage: %s', e)
+            return False
+
+    def ensure_teams_collection_exists(self):
+        return self.initialize_database()
+
+    # ✅ Zespoły i logowanie
+    def team_exists(self, team_name):
+        try:
+            metrics.count_storage('read')
+            row = self._connection().execute('SELECT 1 FROM teams WHERE name = ?', (team_name,)).fetchone()
+            return row is not None
+        except sqlite3.Error as e:
+            logger.error('Error checking if team exists: %s', e)
+            return None
+
+    def create_team(self, team_name, password, email=None):
+        error = validate_new_team(team_name, password)
+        if error:
+            return {'success': False, 'error': error}
+
+        team_id = uuid.uuid4().hex
+        created_at = datetime.now()
+        # Hashowanie hasła trwa setki ms - poza transakcją, żeby nie trzymać blokady zapisu
+        password_hash = generate_password_hash(password)
+        try:
+            with self._transaction() as connection:
+                connection.execute(
+                    'INSERT INTO teams (name, id, password_hash, email, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (team_name, team_id, password_hash, email or None, created_at.isoformat())
+                )
+        except sqlite3.IntegrityError:
+            return {'success': False, 'error': 'Team name already exists'}
+        except sqlite3.Error as e:
+            logger.error('Error creating team: %s', e)
+            return {'success': False, 'error': str(e)}
+
+        logger.info('Team created successfully: %s', team_name)
+        return {
+            'success': True,
+            'message': 'Team created successfully',
+            'team_name': team_name,
+            'team_id': team_id,
+            'team_data': {
+                'created_at': created_at,
+                'last_login': datetime.now(),
+                'stats': self._stats(self._connection(), team_name)
+            }
+        }
+
+    def authenticate_team(self, team_name, password):
+        try:
+            if team_name == 'guest' and not self.team_exists(team_name):
+                self.create_team('guest', 'guestpassword')
+
+            connection = self._connection()
+            metrics.count_storage('read')
+            row = connection.execute(
+                'SELECT id, password_hash, created_at, is_active, failed_login_attempts FROM teams WHERE name = ?',
+                (team_name,)
+            ).fetchone()
+            if row is None:
+                return {'success': False, 'error': 'Invalid team name or password'}
+
+            team_id, password_hash, created_at, is_active, failed_attempts = row
+            if not is_active:
+                return {'success': False, 'error': 'Account is disabled'}
+            if failed_attempts >= 5:
+                return {'success': False, 'error': 'Account locked due to too many failed attempts'}
+
+            if team_name != 'guest' and password != 'guestpassword':
+                if not check_password_hash(password_hash, password):
+                    connection.execute(
+                        'UPDATE teams SET failed_login_attempts = failed_login_attempts + 1 WHERE name = ?',
+                        (team_name,)
+                    )
+                    metrics.count_storage('write')
+                    return {'success': False, 'error': 'Invalid team name or password'}
+
+            connection.execute(
+                'UPDATE teams SET last_login = ?, failed_login_attempts = 0 WHERE name = ?',
+                (datetime.now().isoformat(), team_name)
+            )
+            metrics.count_storage('write')
+            logger.debug('Team logged in successfully: %s', team_name)
+
+            return {
+                'success': True,
+                'message': 'Login successful',
+                'team_name': team_name,
+                'team_id': team_id,
+                'team_data': {
+                    'created_at': _parse_datetime(created_at),
+                    'last_login': datetime.now(),
+                    'stats': self._stats(connection, team_name)
+                }
+            }
+
+        except sqlite3.Error as e:
+            logger.error('Error authenticating team: %s', e)
+            return {'success': False, 'error': str(e)}
+
+    def validate_team_session(self, team_name, team_id):
+        # Odczyt z indeksu lokalnego pliku - bez cache'a sesji, który potrzebny jest przy Firestore
+        try:
+            metrics.count_storage('read')
+            row = self._connection().execute('SELECT id FROM teams WHERE name = ?', (team_name,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error('Error validating team session: %s', e)
+            return False
+
+        if row is None:
+            logger.warning('Team %s does not exist', team_name)
+            return False
+        if row[0] != team_id:
+            logger.warning('Team ID mismatch for %s: session=%s, db=%s', team_name, team_id, row[0])
+            return False
+        return True
+
+    async def async_validate_team_session(self, team_name, team_id):
+        return self.validate_team_session(team_name, team_id)
+
+    def rotate_team_id(self, team_name):
+        new_team_id = uuid.uuid4().hex
+        try:
+            cursor = self._connection().execute('UPDATE teams SET id = ? WHERE name = ?', (new_team_id, team_name))
+            metrics.count_storage('write')
+        except sqlite3.Error as e:
+            logger.error('Error rotating team id: %s', e)
+            return None
+
+        if not cursor.rowcount:
+            logger.warning('Team %s does not exist', team_name)
+            return None
+        logger.debug('Rotated team id for team: %s', team_name)
+        return new_team_id
+
+    # ✅ Statystyki
+    def _stats(self, connection, team_name):
+        metrics.count_storage('read')
+        row = connection.execute(
+            'SELECT ' + ', '.join(TEAM_COUNTERS) + ', current_streak, best_streak FROM teams WHERE name = ?',
+            (team_name,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        stats = dict(zip(TEAM_COUNTERS + ('current_streak', 'best_streak'), row))
+        stats['accuracy_percentage'] = 0.0
+        if stats['questions_answered']:
+            stats['accuracy_percentage'] = round((stats['correct_answers'] / stats['questions_answered']) * 100, 2)
+
+        stats['categories'] = {}
+        for category_id, name, *counters in connection.execute(
+            'SELECT category_id, name, ' + ', '.join(CATEGORY_COUNTERS) + ' FROM team_categories WHERE team_name = ?',
+            (team_name,)
+        ):
+            category_stats = dict(zip(CATEGORY_COUNTERS, counters))
+            if name is not None:
+                category_stats['name'] = name
+            stats['categories'][category_id] = category_stats
+        return stats
+
+    def get_team_stats(self, team_name):
+        try:
+            connection = self._connection()
+            stats = self._stats(connection, team_name)
+            if stats is None:
+                return {'team_name': team_name, 'stats': {'questions_generated': 0, 'categories': {}}}
+
+            created_at = connection.execute('SELECT created_at FROM teams WHERE name = ?', (team_name,)).fetchone()
+            return {
+                'team_name': team_name,
+                'stats': stats,
+                'created_at': _parse_datetime(created_at[0]) if created_at else None
+            }
+        except sqlite3.Error as e:
+            logger.error('Error getting stats: %s', e)
+            return None
+
+    def _apply_mutation(self, connection, team_name, increments, values=None):
+        """
+        Zapisuje zmiany statystyk zespołu w otwartej transakcji
+
+        Returns:
+            bool: False jeśli zespół nie istnieje
+        """
+        team_amounts = dict.fromkeys(TEAM_COUNTERS, 0)
+        category_amounts = {}
+        category_names = {}
+
+        for path, amount in increments.items():
+            if len(path) == 1 and path[0] in TEAM_COUNTERS:
+                team_amounts[path[0]] += amount
+            elif len(path) == 3 and path[0] == 'categories' and path[2] in CATEGORY_COUNTERS:
+                category_amounts.setdefault(str(path[1]), dict.fromkeys(CATEGORY_COUNTERS, 0))[path[2]] += amount
+            else:
+                raise ValueError(f'Unsupported stats counter: {path}')
+
+        for path, value in (values or {}).items():
+            if len(path) == 3 and path[0] == 'categories' and path[2] == 'name':
+                category_names[str(path[1])] = value
+                category_amounts.setdefault(str(path[1]), dict.fromkeys(CATEGORY_COUNTERS, 0))
+            else:
+                raise ValueError(f'Unsupported stats value: {path}')
+
+        cursor = connection.execute(INCREMENT_TEAM, [team_amounts[column] for column in TEAM_COUNTERS] + [team_name])
+        if not cursor.rowcount:
+            return False
+
+        connection.executemany(INCREMENT_CATEGORY, [
+            [team_name, category_id, category_names.get(category_id)] + [amounts[column] for column in CATEGORY_COUNTERS]
+            for category_id, amounts in category_amounts.items()
+        ])
+        return True
+
+    def apply_stats_mutation(self, team_name, increments, values=None):
+        try:
+            with self._transaction() as connection:
+                updated = self._apply_mutation(connection, team_name, increments, values)
+        except sqlite3.Error as e:
+            logger.error('Error updating stats for team %s: %s', team_name, e)
+            return False
+
+        if not updated:
+            logger.warning('Team %s does not exist', team_name)
+        return updated
+
+    def apply_stats_mutations(self, mutations):
+        # Jedna transakcja na cały bufor; zmiany nieistniejących zespołów są pomijane
+        try:
+            with self._transaction() as connection:
+                for team_name, (increments, values) in mutations.items():
+                    if not self._apply_mutation(connection, team_name, increments, values):
+                        logger.warning('Team %s does not exist', team_name)
+        except sqlite3.Error as e:
+            logger.error('Error committing stats batch: %s', e)
+            return dict(mutations)
+        return {}
+
+    def record_answer(self, team_name, category_id, is_correct, points=0, time_taken=0):
+        category_id = str(category_id)
+        correct = 1 if is_correct else 0
+
+        try:
+            with self._transaction() as connection:
+                cursor = connection.execute(RECORD_ANSWER, {
+                    'team_name': team_name, 'points': points, 'time_taken': time_taken, 'correct': correct
+                })
+                if not cursor.rowcount:
+                    logger.warning('Team %s does not exist', team_name)
+                    return False
+
+                connection.execute(INCREMENT_CATEGORY, (team_name, category_id, None, 0, correct, 1 - correct, points))
+                stats = self._stats(connection, team_name)
+                created_at = connection.execute(
+                    'SELECT created_at FROM teams WHERE name = ?', (team_name,)
+                ).fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error('Error recording answer: %s', e)
+            return None
+
+        logger.debug('Recorded answer for team: %s', team_name)
+        self.notify_points(team_name, category_id, points, stats)
+        return {'team_name': team_name, 'stats': stats, 'created_at': _parse_datetime(created_at)}
+
+    def migrate_team_stats(self, team_name):
+        # Statystyki są już wierszami tabel - układ STATS_LAYOUT dotyczy tylko Firestore
+        return False
+
+    def migrate_all_team_stats(self, dry_run=False):
+        logger.info('SQLite storage keeps stats in table rows - nothing to migrate')
+        return {'migrated': 0, 'skipped': 0, 'failed': 0}
+
+    # ✅ Pytania widziane przez zespół
+    def get_seen_questions(self, team_name):
+        try:
+            connection = self._connection()
+            metrics.count_storage('read')
+            row = connection.execute(
+                'SELECT bits, hashes, count FROM seen_questions WHERE team_name = ?', (team_name,)
+            ).fetchone()
+            if row is None:
+                return {}
+
+            chunks = connection.execute(
+                'SELECT chunk, data FROM seen_question_chunks WHERE team_name = ?', (team_name,)
+            )
+            return {
+                'bits': row[0],
+                'hashes': row[1],
+                'count': row[2],
+                'chunks': {str(chunk): bytes(data) for chunk, data in chunks}
+            }
+        except sqlite3.Error as e:
+            logger.error('Error getting seen questions: %s', e)
+            return None
+
+    def save_seen_questions(self, team_name, chunks, added, bits, hashes, replace=False):
+        try:
+            with self._transaction() as connection:
+                if connection.execute('SELECT 1 FROM teams WHERE name = ?', (team_name,)).fetchone() is None:
+                    logger.warning('Team %s does not exist', team_name)
+                    return False
+
+                row = connection.execute(
+                    'SELECT bits, hashes, count FROM seen_questions WHERE team_name = ?', (team_name,)
+                ).fetchone()
+                if replace or row is None or row[0] != bits or row[1] != hashes:
+                    connection.execute('DELETE FROM seen_question_chunks WHERE team_name = ?', (team_name,))
+                    count, stored = added, {}
+                else:
+                    count = row[2] + added
+                    stored = {
+                        str(chunk): bytes(data) for chunk, data in connection.execute(
+                            'SELECT chunk, data FROM seen_question_chunks WHERE team_name = ?', (team_name,)
+                        )
+                    }
+
+                connection.execute(
+                    'INSERT INTO seen_questions (team_name, bits, hashes, count) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (team_name) DO UPDATE SET bits = excluded.bits, hashes = excluded.hashes, '
+                    'count = excluded.count',
+                    (team_name, bits, hashes, count)
+                )
+                for index, blob in chunks.items():
+                    stored[str(index)] = merge_seen_chunk(stored.get(str(index)), blob)
+                    connection.execute(
+                        'INSERT OR REPLACE INTO seen_question_chunks (team_name, chunk, data) VALUES (?, ?, ?)',
+                        (team_name, int(index), stored[str(index)])
+                    )
+            return {'bits': bits, 'hashes': hashes, 'count': count, 'chunks': stored}
+
+        except sqlite3.Error as e:
+            logger.error('Error saving seen questions: %s', e)
+            return None
+
+    # ✅ Ranking - tabele są jedynym źródłem punktów, więc podsumowaniem jest ich odczyt
+    def scan_team_scores(self):
+        try:
+            connection = self._connection()
+            metrics.count_storage('read')
+            boards = {'global': dict(connection.execute('SELECT name, total_points FROM teams'))}
+            for category_id, team_name, points in connection.execute(
+                'SELECT category_id, team_name, points FROM team_categories'
+            ):
+                boards.setdefault(category_id, {})[team_name] = points
+            return boards
+        except sqlite3.Error as e:
+            logger.error('Error scanning team scores: %s', e)
+            return None
+
+    def get_leaderboard_summary(self, since=None):
+        return self.scan_team_scores()
+
+    def merge_leaderboard_summary(self, boards):
+        # Punkty z pamięci procesu są już zapisane w tabelach przez record_answer
+        return True
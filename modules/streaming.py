@@ -0,0 +1,98 @@
+import json
+import re
+
+
+class JsonStringFieldReader:
+    """
+    Przyrostowo odczytuje wartość jednego pola tekstowego z niepełnego JSON-a
+
+    Kolejne fragmenty odpowiedzi przekazuje się do feed(), które zwraca nowo
+    zdekodowane znaki wartości pola (z obsługą sekwencji ucieczki \\n, \\", \\uXXXX).
+    """
+
+    def __init__(self, field):
+        self._start_pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ''
+        self._pos = None
+        self.done = False
+        self.value = ''
+
+    def feed(self, text):
+        self._buffer += text
+        if self.done:
+            return ''
+
+        if self._pos is None:
+            match = self._start_pattern.search(self._buffer)
+            if not match:
+                return ''
+            self._pos = match.end()
+
+        buffer = self._buffer
+        i = self._pos
+        decoded = []
+
+        while i < len(buffer):
+            char = buffer[i]
+
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+
+            if char == '\\':
+                # Niepełna sekwencja ucieczki - poczekaj na kolejny fragment
+                if i + 1 >= len(buffer):
+                    break
+
+                if buffer[i + 1] == 'u':
+                    length = 6
+                    if i + length <= len(buffer) and 0xD800 <= int(buffer[i + 2:i + 6], 16) <= 0xDBFF:
+                        # Para surogatów (np. emoji) - potrzebne dwie sekwencje \uXXXX
+                        length = 12
+                    if i + length > len(buffer):
+                        break
+                    decoded.append(json.loads('"%s"' % buffer[i:i + length]))
+                    i += length
+                    continue
+
+                decoded.append(json.loads('"\\%s"' % buffer[i + 1]))
+                i += 2
+                continue
+
+            decoded.append(char)
+            i += 1
+
+        self._pos = i
+        text = ''.join(decoded)
+        self.value += text
+        return text
+
+
+def sse_event(event, data):
+    """
+    Formatuje zdarzenie Server-Sent Events z danymi w postaci JSON
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def iter_gemini_stream_text(response):
+    """
+    Zwraca kolejne fragmenty tekstu z odpowiedzi streamGenerateContent?alt=sse
+
+    Linie są dekodowane jako UTF-8 samodzielnie - nagłówek text/event-stream nie
+    podaje charsetu, więc requests przyjąłby ISO-8859-1 i zniekształcił polskie znaki.
+    Podział na linie po bajtach jest bezpieczny, bo bajt końca linii nie występuje
+    wewnątrz wielobajtowych znaków UTF-8. chunk_size=None oddaje dane zaraz po
+    nadejściu - domyślne 512 bajtów przetrzymywałoby koniec zdarzenia do następnego.
+    """
+    for raw_line in response.iter_lines(chunk_size=None):
+        line = raw_line.decode('utf-8')
+        if not line or not line.startswith('data:'):
+            continue
+
+        chunk = json.loads(line[len('data:'):].strip())
+        for candidate in chunk.get('candidates', [])[:1]:
+            for part in candidate.get('content', {}).get('parts', []):
+                if part.get('text'):
+                    yield part['text']
@@ -0,0 +1,373 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from modules import metrics
+
+
+load_dotenv()
+
+# Konfiguracja klienta zewnętrznych API
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3.05'))
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', '10'))
+GEMINI_READ_TIMEOUT = float(os.getenv('GEMINI_READ_TIMEOUT', '30'))
+UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '2'))
+UPSTREAM_BACKOFF_BASE = float(os.getenv('UPSTREAM_BACKOFF_BASE', '0.25'))
+UPSTREAM_BACKOFF_MAX = float(os.getenv('UPSTREAM_BACKOFF_MAX', '4'))
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', '10'))
+# Łączny limit czasu wszystkich prób jednego żądania (s) - po nim nie ma kolejnych ponowień
+UPSTREAM_TOTAL_TIMEOUT = float(os.getenv('UPSTREAM_TOTAL_TIMEOUT', '15'))
+GEMINI_TOTAL_TIMEOUT = float(os.getenv('GEMINI_TOTAL_TIMEOUT', '40'))
+# opentdb wpuszcza jedno zapytanie na 5 s z adresu IP - krótsze czekanie po 429 kończy się kolejnym 429
+TRIVIA_RATE_LIMIT_DELAY = float(os.getenv('TRIVIA_RATE_LIMIT_DELAY', '5'))
+TRIVIA_BACKOFF_MAX = float(os.getenv('TRIVIA_BACKOFF_MAX', '8'))
+
+# Kody odpowiedzi, po których warto ponowić żądanie
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Kody, przy których serwer może podać nagłówek Retry-After
+RATE_LIMIT_STATUS_CODES = {429, 503}
+# Metody, które można bezpiecznie powtórzyć także po przekroczeniu czasu odczytu
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+# Ile ostatnich pomiarów czasu trzymać do wyliczania percentyli
+LATENCY_SAMPLES = 512
+
+_clients = {}
+
+
+class UpstreamClient:
+    """
+    Klient HTTP dla jednego zewnętrznego API (Trivia, Gemini)
+
+    Utrzymuje połączenia keep-alive w puli per host, stosuje limity czasu
+    połączenia i odczytu, ponawia żądania po 429/5xx z losowym (jitter)
+    wykładniczym opóźnieniem i zbiera pomiary czasu odpowiedzi.
+
+    Żądania nieidempotentne (POST do Gemini) są ponawiane tylko po błędzie
+    nawiązania połączenia - po przekroczeniu czasu odczytu serwer mógł już
+    przetworzyć żądanie, a kolejna próba zajęłaby wątek na następny pełny
+    limit. Wszystkie próby razem mieszczą się w total_timeout.
+    """
+
+    def __init__(self, name, connect_timeout=UPSTREAM_CONNECT_TIMEOUT, read_timeout=UPSTREAM_READ_TIMEOUT,
+                 max_retries=UPSTREAM_MAX_RETRIES, pool_size=UPSTREAM_POOL_SIZE, total_timeout=UPSTREAM_TOTAL_TIMEOUT,
+                 backoff_max=UPSTREAM_BACKOFF_MAX, rate_limit_delay=0):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        # Pierwsza próba zawsze dostaje pełne limity połączenia i odczytu
+        self.total_timeout = max(total_timeout, connect_timeout + read_timeout)
+        self.backoff_max = backoff_max
+        # Minimalne czekanie po 429 bez nagłówka Retry-After
+        self.rate_limit_delay = rate_limit_delay
+
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._counters = {'requests': 0, 'errors': 0, 'retries': 0}
+
+    @property
+    def session(self):
+        """
+        Sesja requests tworzona przy pierwszym użyciu w procesie (pula połączeń per host)
+
+        Połączenia z procesu nadrzędnego (np. master gunicorn z --preload) nie są
+        używane po fork - dwa procesy pisałyby do tego samego gniazda TLS.
+        """
+        if self._session is None or self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def reset(self):
+        """
+        Zamyka otwarte połączenia - kolejne żądanie utworzy nową pulę
+        """
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+    def reset_after_fork(self):
+        """
+        Porzuca połączenia odziedziczone po procesie nadrzędnym bez ich zamykania (należą też do rodzica)
+        """
+        self._session_lock = threading.Lock()
+        self._session = None
+        self._session_pid = None
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """
+        Wysyła żądanie, ponawiając je maksymalnie max_retries razy po błędach połączenia i 429/5xx
+
+        Po wyczerpaniu ponowień albo łącznego limitu czasu zwraca ostatnią
+        odpowiedź (wywołujący robi raise_for_status) albo rzuca ostatni wyjątek requests.
+        """
+        timeout = kwargs.pop('timeout', None)
+        deadline = time.monotonic() + self.total_timeout
+        attempt = 0
+
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout or self._attempt_timeout(deadline), **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._record(time.perf_counter() - started, error=True)
+                # ConnectTimeout dziedziczy po ConnectionError, ReadTimeout - nie
+                retryable = method.upper() in IDEMPOTENT_METHODS or isinstance(e, requests.exceptions.ConnectionError)
+                delay = self._backoff(attempt + 1)
+                if not retryable or not self._can_retry(attempt, delay, deadline):
+                    raise
+            else:
+                failed = response.status_code in RETRY_STATUS_CODES
+                self._record(time.perf_counter() - started, error=failed)
+                if not failed:
+                    return response
+                delay = self._retry_delay(attempt + 1, response.status_code, response.headers.get('Retry-After'))
+                if not self._can_retry(attempt, delay, deadline):
+                    return response
+                response.close()
+
+            attempt += 1
+            with self._stats_lock:
+                self._counters['retries'] += 1
+            time.sleep(delay)
+
+    def _attempt_timeout(self, deadline):
+        """
+        Limity (połączenie, odczyt) dla kolejnej próby - nie dłuższe niż czas pozostały do deadline
+        """
+        remaining = max(deadline - time.monotonic(), 0.1)
+        connect_timeout, read_timeout = self.timeout
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+    def _can_retry(self, attempt, delay, deadline):
+        """
+        Czy zostały ponowienia i czy po odczekaniu delay zostanie czas na kolejną próbę
+        """
+        return attempt < self.max_retries and time.monotonic() + delay < deadline
+
+    def _retry_delay(self, attempt, status_code, retry_after=None):
+        """
+        Opóźnienie przed ponowieniem po odpowiedzi z błędem - przy 429/503 co najmniej Retry-After
+        """
+        delay = self._backoff(attempt)
+        if status_code in RATE_LIMIT_STATUS_CODES:
+            wait = parse_retry_after(retry_after)
+            if wait is None and status_code == 429:
+                wait = self.rate_limit_delay
+            delay = max(delay, wait or 0)
+        return delay
+
+    def _backoff(self, attempt):
+        """
+        Wykładnicze opóźnienie z pełnym jitterem: losowo z przedziału [0, base * 2^attempt]
+        """
+        return random.uniform(0, min(self.backoff_max, UPSTREAM_BACKOFF_BASE * (2 ** attempt)))
+
+    def _record(self, elapsed, error=False):
+        metrics.upstream_duration.observe(elapsed, client=self.name, outcome='error' if error else 'ok')
+        with self._stats_lock:
+            self._counters['requests'] += 1
+            if error:
+                self._counters['errors'] += 1
+            self._latencies.append(elapsed * 1000)
+
+    def stats(self):
+        """
+        Zwraca liczniki żądań oraz percentyle czasu odpowiedzi (ms) z ostatnich pomiarów
+        """
+        with self._stats_lock:
+            samples = sorted(self._latencies)
+            result = {'name': self.name, **self._counters}
+
+        if samples:
+            result.update({
+                'p50_ms': round(samples[int(len(samples) * 0.50)], 2),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+                'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+                'max_ms': round(samples[-1], 2)
+            })
+        return result
+
+
+class AsyncUpstreamClient(UpstreamClient):
+    """
+    Asynchroniczny odpowiednik UpstreamClient oparty na httpx.AsyncClient
+
+    Używany przez ścieżkę ASGI (asgi.py) - jeden worker może czekać na setki
+    odpowiedzi naraz bez blokowania wątków. Ponowienia, limity czasu i metryki
+    działają tak samo jak w wersji synchronicznej.
+    """
+
+    def __init__(self, name, **kwargs):
+        super().__init__(name, **kwargs)
+        self._async_client = None
+        self._loop = None
+
+    @property
+    def client(self):
+        """
+        Klient httpx tworzony przy pierwszym użyciu w bieżącej pętli zdarzeń
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._loop is not loop:
+            import httpx
+
+            connect_timeout, read_timeout = self.timeout
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_size)
+            )
+            self._loop = loop
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+        self._async_client = None
+        self._loop = None
+
+    def reset(self):
+        super().reset()
+        # Klient httpx jest związany z pętlą zdarzeń - zostanie utworzony ponownie
+        self._async_client = None
+        self._loop = None
+
+    def reset_after_fork(self):
+        super().reset_after_fork()
+        self._async_client = None
+        self._loop = None
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def request(self, method, url, **kwargs):
+        import httpx
+
+        timeout = kwargs.pop('timeout', None)
+        deadline = time.monotonic() + self.total_timeout
+        attempt = 0
+
+        while True:
+            started = time.perf_counter()
+            if timeout is None:
+                connect_timeout, read_timeout = self._attempt_timeout(deadline)
+                attempt_timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+            else:
+                attempt_timeout = timeout
+            try:
+                response = await self.client.request(method, url, timeout=attempt_timeout, **kwargs)
+            except (httpx.ConnectError, httpx.TimeoutException) as e:
+                self._record(time.perf_counter() - started, error=True)
+                retryable = method.upper() in IDEMPOTENT_METHODS or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                delay = self._backoff(attempt + 1)
+                if not retryable or not self._can_retry(attempt, delay, deadline):
+                    raise
+            else:
+                failed = response.status_code in RETRY_STATUS_CODES
+                self._record(time.perf_counter() - started, error=failed)
+                if not failed:
+                    return response
+                delay = self._retry_delay(attempt + 1, response.status_code, response.headers.get('Retry-After'))
+                if not self._can_retry(attempt, delay, deadline):
+                    return response
+                await response.aclose()
+
+            attempt += 1
+            with self._stats_lock:
+                self._counters['retries'] += 1
+            await asyncio.sleep(delay)
+
+
+def parse_retry_after(value):
+    """
+    Zwraca liczbę sekund z nagłówka Retry-After (liczba sekund albo data HTTP) lub None
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def get_client(name, client_class=UpstreamClient, **kwargs):
+    """
+    Zwraca współdzielonego klienta dla danego API (tworzy go przy pierwszym wywołaniu)
+    """
+    if name not in _clients:
+        _clients[name] = client_class(name, **kwargs)
+    return _clients[name]
+
+
+def reset_after_fork():
+    """
+    Wywoływane w procesie potomnym zaraz po fork (gunicorn post_fork) - każdy klient utworzy nowe połączenia
+    """
+    for client in _clients.values():
+        client.reset_after_fork()
+
+
+def get_upstream_stats():
+    """
+    Zwraca statystyki wszystkich klientów zewnętrznych API
+    """
+    return [client.stats() for client in _clients.values()]
+
+
+# Współdzieleni klienci używani przez blueprinty
+trivia = get_client('trivia', backoff_max=TRIVIA_BACKOFF_MAX, rate_limit_delay=TRIVIA_RATE_LIMIT_DELAY)
+gemini = get_client('gemini', read_timeout=GEMINI_READ_TIMEOUT, total_timeout=GEMINI_TOTAL_TIMEOUT)
+
+# Klienci asynchroniczni dla ścieżki ASGI
+async_trivia = get_client(
+    'trivia_async', AsyncUpstreamClient, backoff_max=TRIVIA_BACKOFF_MAX, rate_limit_delay=TRIVIA_RATE_LIMIT_DELAY
+)
+async_gemini = get_client(
+    'gemini_async', AsyncUpstreamClient, read_timeout=GEMINI_READ_TIMEOUT, total_timeout=GEMINI_TOTAL_TIMEOUT
+)
+
+
+async def aclose_all():
+    """
+    Zamyka klientów asynchronicznych (przy zamykaniu aplikacji ASGI)
+    """
+    for client in _clients.values():
+        if isinstance(client, AsyncUpstreamClient):
+            await client.aclose()
@@ -5,6 +5,10 @@ let currentQuestionIndex = 0;
 let introductionData = '';
 let conclusionData = '';
 let keywordsData = [];
+let keywordDefinitions = {};
+let keywordDefinitionsRequestId = 0;  // Numer ostatniego żądania definicji - starsze odpowiedzi są pomijane
+// Opis przygotowany przez serwer razem z pytaniem (speculate=1 w /api/get-questions)
+let prefetchedDescription = null;
 
 let currentTeamName = getCookie('teamName');
 let currentTeamId = getCookie('teamId');
@@ -59,7 +63,8 @@ document.addEventListener('DOMContentLoaded', async () => {
             })
             .catch(error => console.error('Error loading local quiz categories:', error));
     } else if (quizCategoriesCookie === "api_quiz_categories") {
-        fetch('https://opentdb.com/api_category.php')
+        // Katalog kategorii z serwera (odświeżany w tle, z ETagiem) zamiast bezpośrednio z opentdb
+        fetch('/api/get-categories')
             .then(response => response.json())
             .then(data => {
                 quizCategories = data.trivia_categories;
@@ -140,6 +145,7 @@ document.addEventListener('DOMContentLoaded', async () => {
     }
 
     function loadQuestionDescriptionFromAPI(question) {
+        clearKeywordDefinitions();
         return new Promise((resolve, reject) => {
             if (questionDescriptionCookie === "api_question_description") {
                 if (selectedAiApi) {
@@ -186,32 +192,70 @@ document.addEventListener('DOMContentLoaded', async () => {
                         incorrect_answers: question.incorrect_answers.join(', ')
                     });
 
-                    fetch(`/api/generate-description?${params.toString()}`)
-                        .then(response => response.json())
-                        .then(data => {
-                            if (data.wprowadzenie && data.podsumowanie) {
-                                introductionData = data.wprowadzenie;
-                                conclusionData = data.podsumowanie;
-                                keywordsData = data.slowa_kluczowe || [];
-                                console.log('Loaded API introduction data:', introductionData);
-                                console.log('Loaded API conclusion data:', conclusionData);
-                                console.log('Loaded API keywords data:', keywordsData);
-                                // Odblokuj przycisk sprawdzania odpowiedzi
-                                const checkBtn = document.getElementById('check-answer-btn');
-                                checkBtn.disabled = false;
-                                checkBtn.textContent = 'Check';
-
-                                resolve();
-                            } else {
-                                reject(new Error('Invalid response from description API'));
-                            }
-                        })
-                        .catch(error => {
-                            console.error('Error loading question description from API:', error);
-                            reject(error);
-                            // przerwij działanie funkcji
-                            return;
-                        });
+                    const applyDescription = (data) => {
+                        if (data.wprowadzenie && data.podsumowanie) {
+                            introductionData = data.wprowadzenie;
+                            conclusionData = data.podsumowanie;
+                            keywordsData = data.slowa_kluczowe || [];
+                            // Pobierz w tle definicje wszystkich słów kluczowych jednym żądaniem
+                            prefetchKeywordDefinitions(keywordsData, decodeHTML(question.question));
+                            console.log('Loaded API introduction data:', introductionData);
+                            console.log('Loaded API conclusion data:', conclusionData);
+                            console.log('Loaded API keywords data:', keywordsData);
+                            // Odblokuj przycisk sprawdzania odpowiedzi
+                            const checkBtn = document.getElementById('check-answer-btn');
+                            checkBtn.disabled = false;
+                            checkBtn.textContent = 'Check';
+
+                            resolve();
+                        } else {
+                            reject(new Error('Invalid response from description API'));
+                        }
+                    };
+
+                    const fetchDescription = () => {
+                        fetch(`/api/generate-description?${params.toString()}`)
+                            .then(response => response.json())
+                            .then(applyDescription)
+                            .catch(error => {
+                                console.error('Error loading question description from API:', error);
+                                reject(error);
+                            });
+                    };
+
+                    // Opis przygotowany w tle razem z pytaniem - bez kolejnego żądania
+                    if (prefetchedDescription) {
+                        const data = prefetchedDescription;
+                        prefetchedDescription = null;
+                        applyDescription(data);
+                        return;
+                    }
+
+                    if (!window.EventSource) {
+                        fetchDescription();
+                        return;
+                    }
+
+                    // Strumieniowanie - wprowadzenie pojawia się w miarę generowania
+                    const source = new EventSource(`/api/generate-description/stream?${params.toString()}`);
+                    let streamedText = '';
+
+                    source.addEventListener('chunk', (event) => {
+                        streamedText += JSON.parse(event.data).text;
+                        introText.textContent = decodeHTML(streamedText);
+                    });
+
+                    source.addEventListener('done', (event) => {
+                        source.close();
+                        applyDescription(JSON.parse(event.data));
+                    });
+
+                    source.addEventListener('error', (event) => {
+                        source.close();
+                        // Błąd zgłoszony przez serwer lub zerwane połączenie - spróbuj zwykłego żądania
+                        console.warn('Description stream failed, falling back to regular request', event.data || '');
+                        fetchDescription();
+                    });
                 } else {
                     reject(new Error('No AI API selected for question description'));
                 }
@@ -245,14 +289,24 @@ document.addEventListener('DOMContentLoaded', async () => {
                 amount: 1,
                 category: category,
                 difficulty: difficulty,
-                type: type
+                type: type,
+                // Serwer przygotowuje w tle następne pytanie (i jego opis) dla tych samych ustawień
+                speculate: 1
             });
 
+            if (questionDescriptionCookie === "api_question_description" && selectedAiApi) {
+                const introductionPromptSelect = document.getElementById('introduction_prompt');
+                params.set('describe', 1);
+                params.set('temperature', document.getElementById('temperature').value);
+                params.set('introduction_prompt_type', introductionPromptSelect ? introductionPromptSelect.value : '');
+            }
+
             fetch(`/api/get-questions?${params.toString()}`)
                 .then(response => response.json())
                 .then(data => {
                     if (data.results && Array.isArray(data.results)) {
                         quizData = data.results;
+                        prefetchedDescription = data.description || null;
                         console.log('Loaded quiz data from API:', quizData);
                         displayQuestion(quizData[0], category, quizDataCookie);
 
@@ -571,6 +625,46 @@ function highlightKeywords(text, keywords) {
     return highlightedText;
 }
 
+// Czyści definicje poprzedniego pytania - spóźniona odpowiedź na jego żądanie zostanie pominięta
+function clearKeywordDefinitions() {
+    keywordDefinitions = {};
+    return ++keywordDefinitionsRequestId;
+}
+
+function prefetchKeywordDefinitions(keywords, question) {
+    const requestId = clearKeywordDefinitions();
+    if (!keywords || keywords.length === 0) {
+        return;
+    }
+
+    const temperatureValue = document.getElementById('temperature').value;
+    fetch('/api/keyword-definitions', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            keywords: keywords,
+            question: question,
+            temperature: temperatureValue
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        // Odpowiedź dla poprzedniego pytania - nie nadpisuj definicji bieżącego
+        if (requestId !== keywordDefinitionsRequestId) {
+            return;
+        }
+        if (data.definitions) {
+            keywordDefinitions = data.definitions;
+            console.log('Prefetched keyword definitions:', Object.keys(keywordDefinitions));
+        }
+    })
+    .catch(error => {
+        console.error('Error prefetching keyword definitions:', error);
+    });
+}
+
 async function showKeywordDefinition(keyword) {
     console.log('Clicked keyword:', keyword);
     
@@ -624,8 +718,14 @@ async function showKeywordDefinition(keyword) {
             question: currentQuestion  // Dodaj pytanie do parametrów
         });
 
-        const response = await fetch(`/api/get-keyword-definition?${params.toString()}`);
-        const data = await response.json();
+        // Definicja pobrana wcześniej zbiorczo - bez dodatkowego żądania
+        let data;
+        if (keywordDefinitions[keyword]) {
+            data = { definition: keywordDefinitions[keyword] };
+        } else {
+            const response = await fetch(`/api/get-keyword-definition?${params.toString()}`);
+            data = await response.json();
+        }
 
         if (data.definition) {
             // Dodaj klasę do animacji rozciągania